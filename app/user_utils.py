@@ -1,21 +1,99 @@
 # app/user_utils.py
 
 import re
+from array import array
+from itertools import islice
+
+from scripts.metrics import VALIDATE_SECONDS, timed
+from scripts.user_record import UserRecord
+
+# Error bits returned per user by validate_users
+INVALID_FIRST_NAME = 1
+INVALID_LAST_NAME = 2
+INVALID_PHONE_NUMBER = 4
+
+ERROR_MESSAGES = (
+    (INVALID_FIRST_NAME, "Invalid first name"),
+    (INVALID_LAST_NAME, "Invalid last name"),
+    (INVALID_PHONE_NUMBER, "Invalid phone number"),
+)
+
+# Phone number must be 8–15 digits, with optional +
+PHONE_PATTERN = r"\+?[0-9]{8,15}"
+_phone_match = re.compile(PHONE_PATTERN).fullmatch
+
+BATCH_SIZE = 4096
+
+
+def _fields(user):
+    # UserRecord (from the consumer) or a plain dict with "phone_number"
+    if isinstance(user, UserRecord):
+        return user.first_name, user.last_name, user.phone
+    return user.get("first_name"), user.get("last_name"), user.get("phone_number")
+
+
+def _invalid_name(name):
+    return not name or not name.isalpha()
 
-def validate_user(user):
-    errors = []
 
-    # Check first name
-    if not user.get("first_name") or not user["first_name"].isalpha():
-        errors.append("Invalid first name")
+def _invalid_phone(phone):
+    return not phone or _phone_match(phone) is None
 
-    # Check last name
-    if not user.get("last_name") or not user["last_name"].isalpha():
-        errors.append("Invalid last name")
 
-    # Check phone number (must be 8–15 digits, with optional +)
-    phone = user.get("phone_number")
-    if not phone or not re.fullmatch(r"\+?[0-9]{8,15}", phone):
-        errors.append("Invalid phone number")
+def validate_columns(first_names, last_names, phone_numbers):
+    # Column-wise validation; pandas Series columns take the vectorized path
+    if hasattr(first_names, "str"):
+        return _validate_series(first_names, last_names, phone_numbers)
 
-    return errors
\ No newline at end of file
+    return array("B", [
+        first | last << 1 | phone << 2
+        for first, last, phone in zip(
+            map(_invalid_name, first_names),
+            map(_invalid_name, last_names),
+            map(_invalid_phone, phone_numbers),
+        )
+    ])
+
+
+def _validate_series(first_names, last_names, phone_numbers):
+    # Returns a numpy uint8 array; pandas is only used when the caller passes Series
+    first = ~first_names.fillna("").astype(str).str.isalpha()
+    last = ~last_names.fillna("").astype(str).str.isalpha()
+    phone = ~phone_numbers.fillna("").astype(str).str.fullmatch(PHONE_PATTERN)
+    return (
+        first.to_numpy("uint8") * INVALID_FIRST_NAME
+        | last.to_numpy("uint8") * INVALID_LAST_NAME
+        | phone.to_numpy("uint8") * INVALID_PHONE_NUMBER
+    )
+
+
+@timed(VALIDATE_SECONDS)
+def validate_users(users, batch_size=BATCH_SIZE):
+    # Bulk validation: one error bitmask per user (0 = valid), in input order.
+    # Accepts any iterable of dicts/UserRecords, or a pandas DataFrame with
+    # first_name, last_name and phone_number columns.
+    if hasattr(users, "columns"):
+        return _validate_series(users["first_name"], users["last_name"], users["phone_number"])
+
+    masks = array("B")
+    users = iter(users)
+    while True:
+        batch = list(islice(users, batch_size))
+        if not batch:
+            return masks
+        masks.extend(validate_columns(*zip(*map(_fields, batch))))
+
+
+def error_messages(mask):
+    if not mask:
+        return []
+    return [message for bit, message in ERROR_MESSAGES if mask & bit]
+
+
+@timed(VALIDATE_SECONDS)
+def validate_user(user):
+    # Same rules as validate_users, without building columns for a single row
+    first_name, last_name, phone = _fields(user)
+    return error_messages(
+        _invalid_name(first_name) | _invalid_name(last_name) << 1 | _invalid_phone(phone) << 2
+    )
@@ -0,0 +1,59 @@
+# Parse throughput: inline dispatch vs ParsePool with 1..N worker processes.
+# Run from the repository root: python -m benchmarks.bench_parse_pool [messages] [chunk_size]
+
+import os
+import sys
+import time
+
+from scripts.consumer import dispatch
+from scripts.parse_pool import ParsePool
+from scripts.xml_serializer import serialize_user_messages
+
+
+def make_bodies(count):
+    users = [{
+        "uuid": "2025-05-16T12:00:00.%06dZ" % i,
+        "time": "2025-05-16T12:00:00Z",
+        "password": "$P$BhashedpasswordvalueXXXXXXXXX",
+        "first_name": "Rayan",
+        "last_name": "Haddou",
+        "phone": "+32470123456",
+        "email": "user%d@example.com" % i,
+        "business_name": "MyCompany",
+        "business_email": "biz@example.com",
+        "real_address": "Main St 1",
+        "btw_number": "BE123456789",
+        "facturation_address": "Invoice St 5"
+    } for i in range(count)]
+    return serialize_user_messages(users)
+
+
+def report(label, count, seconds, baseline=None):
+    rate = count / seconds
+    speedup = "" if baseline is None else "  %.2fx" % (rate / baseline)
+    print("%-22s %10.0f msg/s%s" % (label, rate, speedup))
+    return rate
+
+
+def main(count=100000, chunk_size=256):
+    bodies = make_bodies(count)
+    print("%d messages, chunk size %d, %d cores" % (count, chunk_size, os.cpu_count() or 1))
+
+    start = time.perf_counter()
+    for body in bodies:
+        dispatch(body)
+    baseline = report("inline", count, time.perf_counter() - start)
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        with ParsePool(workers, chunk_size) as pool:
+            list(pool.map(bodies[:workers * chunk_size]))  # start the workers
+            start = time.perf_counter()
+            for _ in pool.map(bodies):
+                pass
+            report("pool, %d worker(s)" % workers, count, time.perf_counter() - start, baseline)
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,251 @@
+# Throughput and latency of every pipeline step on synthetic users, stored as JSON per commit.
+# Run from the repository root:
+#   python -m benchmarks.bench_pipeline run [--count N] [--size small|medium|large] [--output FILE]
+#   python -m benchmarks.bench_pipeline compare OLD.json NEW.json [--threshold 0.10]
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from app.user_utils import validate_user, validate_users
+from scripts.consumer import dispatch, handle_user_create
+from scripts.producer import send_user_to_rabbitmq
+from scripts.user_record import UserRecord
+from scripts.xml_serializer import serialize_user_message
+from scripts.xml_utils import generate_user_xml
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Free-text field length per size; large users also contain characters that need escaping
+SIZES = {"small": 8, "medium": 64, "large": 512}
+
+FIRST_NAMES = ["Rayan", "Weiam", "Lotte", "Jules", "Noor", "Élise", "Mats", "Yasmine"]
+LAST_NAMES = ["Haddou", "Almahnash", "Peeters", "Janssens", "Maes", "Dubois", "Claes"]
+
+
+def make_users(count, size="small", seed=42):
+    # Realistic WordPress users: some with a business, a few with invalid fields
+    rng = random.Random(seed)
+    length = SIZES[size]
+    filler = "Straat & <Zone> " if size == "large" else "Straat "
+
+    def text(prefix):
+        return (prefix + filler * (length // len(filler) + 1))[:length]
+
+    users = []
+    for i in range(count):
+        user = {
+            "uuid": "2025-05-16T12:00:00.%06dZ" % i,
+            "time": "2025-05-16T12:%02d:%02dZ" % (i // 60 % 60, i % 60),
+            "password": "$P$B" + "%028x" % rng.getrandbits(112),
+            "first_name": rng.choice(FIRST_NAMES),
+            "last_name": rng.choice(LAST_NAMES),
+            "phone": "+3247%07d" % rng.randrange(10 ** 7),
+            "email": "user%d@example.com" % i,
+        }
+        if rng.random() < 0.3:
+            user.update({
+                "business_name": text("Company %d " % i),
+                "business_email": "billing%d@example.com" % i,
+                "real_address": text("Main St %d " % i),
+                "btw_number": "BE0%09d" % rng.randrange(10 ** 9),
+                "facturation_address": text("Invoice St %d " % i),
+            })
+        if rng.random() < 0.05:
+            user["phone"] = "n/a"
+        users.append(user)
+    return users
+
+
+def wordpress_users(users):
+    # The lowercase shape built by the WordPress side for xml_utils.generate_user_xml
+    return [{
+        "user_login": user["email"].split("@")[0],
+        "user_pass": user["password"],
+        "user_email": user["email"],
+        "user_registered": user["time"],
+        "first_name": user["first_name"],
+        "last_name": user["last_name"],
+        "phone_number": user["phone"],
+        "business_name": user.get("business_name", ""),
+        "action_type": "create",
+        "time_of_action": user["time"],
+    } for user in users]
+
+
+class FakeChannel:
+    # In-process stand-in for a pika BlockingChannel: publishing only counts bytes
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def queue_declare(self, queue):
+        pass
+
+    def queue_bind(self, queue, exchange, routing_key):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.messages += 1
+        self.bytes += len(body)
+
+    def tx_select(self):
+        pass
+
+    def tx_commit(self):
+        pass
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(fn, items, warmup=100):
+    for item in items[:warmup]:
+        fn(item)
+
+    clock = time.perf_counter_ns
+    latencies = []
+    append = latencies.append
+    start = clock()
+    for item in items:
+        before = clock()
+        fn(item)
+        append(clock() - before)
+    total = clock() - start
+
+    latencies.sort()
+    return {
+        "ops_per_sec": len(items) / (total / 1e9),
+        "p50_us": percentile(latencies, 0.50) / 1e3,
+        "p99_us": percentile(latencies, 0.99) / 1e3,
+    }
+
+
+def cases(users):
+    bodies = [serialize_user_message(user) for user in users]
+    create_bodies = [body.decode() for body in bodies]
+    wp_users = wordpress_users(users)
+    # Validation runs on what the consumer hands over
+    records = [UserRecord.from_dict(user) for user in users]
+    channel = FakeChannel()
+    batches = [records[i:i + 256] for i in range(0, len(records), 256)]
+
+    # name -> (function, inputs, operations per call)
+    return {
+        "serialize.user_message": (serialize_user_message, users, 1),
+        "serialize.user_lowercase": (generate_user_xml, wp_users, 1),
+        "parse.dispatch": (dispatch, bodies, 1),
+        "parse.handle_user_create": (handle_user_create, create_bodies, 1),
+        "validate.user": (validate_user, records, 1),
+        "validate.users_batch": (validate_users, batches, 256),
+        "publish.send_user": (lambda user: send_user_to_rabbitmq(user, channel), users, 1),
+    }
+
+
+def run(count=20000, size="small", only=None):
+    users = make_users(count, size)
+    results = {}
+    for name, (fn, items, per_call) in cases(users).items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        result = measure(fn, items)
+        if per_call > 1:
+            result["ops_per_sec"] *= per_call
+            result["per_call"] = per_call
+        results[name] = result
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "count": count,
+        "size": size,
+        "results": results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old, new, threshold=0.10):
+    # Rows of (name, old ops/s, new ops/s, change); a regression is a throughput drop
+    # or a p99 increase larger than threshold
+    rows = []
+    regressions = []
+    for name, current in new["results"].items():
+        previous = old["results"].get(name)
+        if previous is None:
+            continue
+        change = current["ops_per_sec"] / previous["ops_per_sec"] - 1
+        p99_change = current["p99_us"] / previous["p99_us"] - 1 if previous["p99_us"] else 0.0
+        rows.append((name, previous["ops_per_sec"], current["ops_per_sec"], change, p99_change))
+        if change < -threshold or p99_change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def print_results(report):
+    print("commit %s, %d %s users, Python %s" % (report["commit"], report["count"], report["size"], report["python"]))
+    for name, result in report["results"].items():
+        print("%-28s %12.0f ops/s   p50 %8.2f us   p99 %8.2f us"
+              % (name, result["ops_per_sec"], result["p50_us"], result["p99_us"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--count", type=int, default=20000)
+    run_parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    run_parser.add_argument("--only", nargs="*", help="benchmark name prefixes, e.g. parse serialize")
+    run_parser.add_argument("--output", help="JSON file (default: benchmarks/results/<commit>-<size>.json)")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.count, args.size, args.only)
+        print_results(report)
+        output = args.output or os.path.join(RESULTS_DIR, "%s-%s.json" % (report["commit"], args.size))
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("saved to %s" % output)
+        return 0
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, regressions = compare(old, new, args.threshold)
+    print("%s -> %s" % (old["commit"], new["commit"]))
+    for name, before, after, change, p99_change in rows:
+        flag = "  REGRESSION" if name in regressions else ""
+        print("%-28s %12.0f -> %12.0f ops/s  %+7.1f%%   p99 %+7.1f%%%s"
+              % (name, before, after, change * 100, p99_change * 100, flag))
+    # Non-zero exit status so CI can fail on a regression
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# Micro-benchmark: template serializer vs the old ElementTree and string concatenation paths.
+# Run from the repository root: python -m benchmarks.bench_xml_serializer
+
+import timeit
+
+from scripts.user_record import UserRecord
+from scripts.xml_serializer import serialize_user, serialize_user_message, serialize_user_message_etree
+
+USER = {
+    "uuid": "2025-05-16T12:00:00.000000Z",
+    "time": "2025-05-16T12:00:00Z",
+    "password": "$P$BhashedpasswordvalueXXXXXXXXX",
+    "first_name": "Rayan",
+    "last_name": "Haddou",
+    "phone": "+32470123456",
+    "email": "rayan@example.com",
+    "business_name": "MyCompany",
+    "business_email": "biz@example.com",
+    "real_address": "Main St 1",
+    "btw_number": "BE123456789",
+    "facturation_address": "Invoice St 5"
+}
+
+WP_USER = {
+    "user_login": "weiam123",
+    "user_pass": "hashedpassword",
+    "user_email": "weiam@example.com",
+    "user_registered": "2025-05-16T12:00:00",
+    "first_name": "Weiam",
+    "last_name": "Almahnash",
+    "phone_number": "+32470123456",
+    "business_name": "MyCompany",
+    "business_email": "business@example.com",
+    "real_address": "Main Street 1",
+    "btw_number": "BE123456789",
+    "facturation_address": "Invoice Street 5",
+    "action_type": "create",
+    "time_of_action": "2025-05-16T12:00:00"
+}
+
+
+def concat_user_xml(user):
+    # The previous scripts/xml_utils.generate_user_xml, kept here as the baseline
+    xml = "<User>"
+    for key in WP_USER:
+        xml += f"<{key}>{user.get(key, '')}</{key}>"
+    xml += "</User>"
+    return xml.encode()
+
+
+def bench(label, fn, number):
+    best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"{label:<40} {best * 1e6:8.2f} us/msg  {1 / best:12,.0f} msg/s")
+    return best
+
+
+def main(number=20000):
+    record = UserRecord.from_dict(USER)
+
+    print("UserMessage")
+    etree = bench("  ElementTree (old producer)", lambda: serialize_user_message_etree(record), number)
+    fast = bench("  template (dict input)", lambda: serialize_user_message(USER), number)
+    fast_record = bench("  template (UserRecord input)", lambda: serialize_user_message(record), number)
+    print(f"  speedup: {etree / fast:.1f}x (dict), {etree / fast_record:.1f}x (UserRecord)")
+
+    print("User (lowercase shape)")
+    concat = bench("  string concatenation (old xml_utils)", lambda: concat_user_xml(WP_USER), number)
+    template = bench("  template", lambda: serialize_user(WP_USER), number)
+    print(f"  speedup: {concat / template:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
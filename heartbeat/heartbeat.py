@@ -5,12 +5,12 @@ import time
 
 from datetime import datetime
 
-# Logger setup
+from scripts.connection_pool import RECONNECT_ERRORS, ConnectionManager, backoff_delays, connection_parameters
+from scripts.message_schema import HEARTBEAT
+from scripts.metrics import HEARTBEATS_MISSED, HEARTBEATS_SENT, RABBITMQ_RECONNECTS, REGISTRY, start_http_server
+
+# Logger setup: handlers worden pas in main() ingesteld, importeren heeft geen bijwerkingen
 logger = logging.getLogger("HeartbeatLogger")
-logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(handler)
 
 # RabbitMQ settings
 MQ_SERVER = os.getenv('RABBITMQ_HOST', 'localhost')
@@ -25,78 +25,131 @@ INSTANCE_NAME = os.getenv('INSTANCE_NAME', 'heartbeat_service')
 EXCHANGE = 'heartbeat_monitoring'
 QUEUE = 'controlroom.heartbeat.ping'
 ROUTING = 'controlroom.heartbeat.ping'
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', 1))
+# Eén proces kan heartbeats voor meerdere services versturen (komma-gescheiden)
+HEARTBEAT_SERVICES = [name.strip() for name in os.getenv('HEARTBEAT_SERVICES', SERVICE_ID).split(',') if name.strip()]
+# Om de hoeveel seconden een samenvatting gelogd wordt, i.p.v. één regel per heartbeat
+LOG_INTERVAL = float(os.getenv('HEARTBEAT_LOG_INTERVAL', 60))
+
+HEARTBEAT_PROPERTIES = pika.BasicProperties(delivery_mode=2)
 
-# XML message formatter conform XSD
+# XML message formatter conform XSD (schema in scripts/message_schema.py)
 def dict_to_xml(log):
-    return f"""
-    <Heartbeat>
-        <ServiceName>{log['ServiceName']}</ServiceName>
-    </Heartbeat>
-    """.strip()
+    return HEARTBEAT.encode_values((log['ServiceName'],)).decode('utf-8')
 
 def get_heartbeat_message():
     return dict_to_xml({
         'ServiceName': SERVICE_ID
     })
 
-# RabbitMQ connectie met retries
-def setup_rabbitmq_channel():
-    max_retries = 10
-    retry_delay = 5
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"ENV - RABBITMQ_HOST={os.getenv('RABBITMQ_HOST')}")
-            logger.info(f"ENV - RABBITMQ_PORT={os.getenv('RABBITMQ_PORT')}")
-            logger.info(f"ENV - RABBITMQ_USER={os.getenv('RABBITMQ_USER')}")
-            logger.info(f"ENV - RABBITMQ_PASSWORD={os.getenv('RABBITMQ_PASSWORD')}")
-
-            auth = pika.PlainCredentials(username=MQ_USER, password=MQ_PASS)
-            params = pika.ConnectionParameters(
-                host=MQ_SERVER,
-                port=MQ_PORT,
-                virtual_host=MQ_VHOST,
-                credentials=auth
+# Payloads veranderen nooit: één keer opbouwen en als bytes hergebruiken
+def build_payloads(service_names=None):
+    return tuple(
+        dict_to_xml({'ServiceName': name}).encode('utf-8')
+        for name in (service_names or HEARTBEAT_SERVICES)
+    )
+
+
+class HeartbeatEngine:
+    # Verstuurt de vooraf opgebouwde payloads op een vast monotonic ritme: de volgende
+    # beat wordt gepland t.o.v. de vorige deadline, dus de publish-tijd telt niet op.
+
+    def __init__(self, channel, payloads, interval=HEARTBEAT_INTERVAL, sleep=time.sleep,
+                 clock=time.monotonic, log_interval=LOG_INTERVAL):
+        self.channel = channel
+        self.payloads = payloads
+        self.interval = interval
+        self.sleep = sleep
+        self.clock = clock
+        self.log_interval = log_interval
+        self.sent = 0
+        self.missed = 0
+
+    def publish(self):
+        for body in self.payloads:
+            self.channel.basic_publish(
+                exchange=EXCHANGE,
+                routing_key=ROUTING,
+                body=body,
+                properties=HEARTBEAT_PROPERTIES
             )
-            logger.info(f"Trying RabbitMQ connection to {MQ_SERVER}:{MQ_PORT} | user={MQ_USER} | vhost={MQ_VHOST}")
-            conn = pika.BlockingConnection(params)
-            chan = conn.channel()
-            logger.info("Verbinding met RabbitMQ succesvol gevestigd")
-            return conn, chan
-        except Exception as error:
-            logger.error(f"Fout bij het verbinden met RabbitMQ (poging {attempt + 1}/{max_retries}): {str(error)}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-            else:
-                raise
-
-# Heartbeat loop
+        self.sent += len(self.payloads)
+        HEARTBEATS_SENT.inc(len(self.payloads))
+
+    def run(self, beats=None):
+        next_due = self.clock()
+        next_log = next_due + self.log_interval
+        logged = 0
+        beat = 0
+        while beats is None or beat < beats:
+            self.publish()
+            beat += 1
+
+            now = self.clock()
+            if now >= next_log:
+                logger.info(f"{self.sent - logged} heartbeat-berichten verzonden in de laatste {self.log_interval:.0f}s")
+                logged = self.sent
+                next_log = now + self.log_interval
+
+            next_due += self.interval
+            if now > next_due:
+                # Te laat (bv. trage broker): gemiste beats overslaan i.p.v. in te halen
+                skipped = int((now - next_due) // self.interval) + 1
+                self.missed += skipped
+                HEARTBEATS_MISSED.inc(skipped)
+                next_due += skipped * self.interval
+                logger.warning(f"{skipped} heartbeat(s) overgeslagen, publish duurde te lang")
+            if beats is None or beat < beats:
+                self.sleep(next_due - now)
+
+# RabbitMQ connectie met exponentiële backoff (zonder het wachtwoord te loggen)
+def create_connection_manager():
+    return ConnectionManager(connection_parameters(MQ_SERVER, MQ_PORT, MQ_USER, MQ_PASS, MQ_VHOST))
+
+def setup_rabbitmq_channel(manager=None):
+    manager = manager or create_connection_manager()
+    channel = manager.channel()
+    return manager.connection(), channel
+
+# Heartbeat loop: bij verlies van de verbinding wordt meteen opnieuw verbonden
 def run_heartbeat():
-    connection, channel = setup_rabbitmq_channel()
+    manager = create_connection_manager()
+    engine = HeartbeatEngine(None, build_payloads())
+    delays = backoff_delays()
 
-    logger.info(f"Heartbeat-service gestart voor instance '{INSTANCE_NAME}'")
+    logger.info(f"Heartbeat-service gestart voor instance '{INSTANCE_NAME}' ({', '.join(HEARTBEAT_SERVICES)})")
     try:
         while True:
-            heartbeat_msg = get_heartbeat_message()
-            channel.basic_publish(
-                exchange=EXCHANGE,
-                routing_key=ROUTING,
-                body=heartbeat_msg.encode('utf-8'),
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
-            logger.info("Heartbeat-bericht verzonden naar monitoring")
-            time.sleep(1)
+            sent = engine.sent
+            try:
+                engine.channel = manager.channel()
+                # connection.sleep laat pika tijdens het wachten de verbinding bedienen (AMQP-heartbeats)
+                engine.sleep = manager.connection().sleep
+                engine.run()
+            except RECONNECT_ERRORS as error:
+                manager.reset()
+                RABBITMQ_RECONNECTS.inc()
+                if engine.sent > sent:
+                    # De verbinding werkte: de backoff begint opnieuw bij de kortste wachttijd
+                    delays = backoff_delays()
+                delay = next(delays)
+                logger.error(f"Verbinding met RabbitMQ verloren ({error!r}), opnieuw verbinden over {delay:.2f}s")
+                time.sleep(delay)
     except KeyboardInterrupt:
         logger.warning("Heartbeat-service gestopt door gebruiker")
     except Exception as error:
         logger.error(f"Er is een fout opgetreden: {str(error)}")
     finally:
         logger.info("Verbinding met RabbitMQ wordt gesloten")
-        connection.close()
+        manager.close()
 
 
-def start():
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     logger.info("Initialiseren van de heartbeat-service...")
+    if REGISTRY.enabled:
+        start_http_server()
     run_heartbeat()
 
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    main()
\ No newline at end of file
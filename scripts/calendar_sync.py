@@ -0,0 +1,319 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger("CalendarSync")
+
+# Keeps a local copy of the Google calendars and their events (the sessions) for the
+# event-registration plugin. Each calendar is fetched incrementally with its sync token,
+# so a pass only transfers what changed; the plugin reads the store instead of calling
+# the API on every page render.
+STORE_PATH = os.getenv("CALENDAR_STORE_PATH", "calendar.sqlite3")
+SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", 60))
+# Readers treat a calendar as stale (and fall back to the API) when it was not synced
+# within this many seconds, e.g. because the worker is down
+CACHE_TTL = float(os.getenv("CALENDAR_CACHE_TTL", 300))
+CREDENTIALS_PATH = os.getenv(
+    "CALENDAR_CREDENTIALS_PATH", "/var/www/html/wp-content/credentials/calendar-service-account.json"
+)
+CALENDAR_SUBJECT = os.getenv("CALENDAR_SUBJECT", "planning@youmnimalha.be")
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+
+# The planning calendar holds the events themselves, not sessions; the plugin skips it
+SKIPPED_CALENDARS = ("planning@youmnimalha.be",)
+
+
+class SyncTokenExpired(Exception):
+    # The API answered 410 Gone: the calendar needs a full sync
+    pass
+
+
+class GoogleCalendarApi:
+    # Thin wrapper over the Calendar v3 API. google-auth and google-api-python-client
+    # are only needed here and imported on first use.
+
+    def __init__(self, credentials_path=CREDENTIALS_PATH, subject=CALENDAR_SUBJECT):
+        self.credentials_path = credentials_path
+        self.subject = subject
+        self._service = None
+
+    def service(self):
+        if self._service is None:
+            from google.oauth2 import service_account
+            from googleapiclient.discovery import build
+
+            credentials = service_account.Credentials.from_service_account_file(
+                self.credentials_path, scopes=SCOPES, subject=self.subject
+            )
+            self._service = build("calendar", "v3", credentials=credentials, cache_discovery=False)
+        return self._service
+
+    def list_calendars(self):
+        calendars = []
+        page_token = None
+        while True:
+            response = self.service().calendarList().list(pageToken=page_token).execute()
+            calendars.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return calendars
+
+    def list_events(self, calendar_id, sync_token=None, page_token=None):
+        from googleapiclient.errors import HttpError
+
+        # Only parameters that may be combined with a sync token: the full and the
+        # incremental requests must ask for the same thing
+        params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": 2500, "pageToken": page_token}
+        if sync_token:
+            params["syncToken"] = sync_token
+        try:
+            return self.service().events().list(**params).execute()
+        except HttpError as error:
+            if error.resp.status == 410:
+                raise SyncTokenExpired(calendar_id) from error
+            raise
+
+
+def event_start(item):
+    start = item.get("start") or {}
+    return start.get("dateTime") or start.get("date") or ""
+
+
+def zone(name):
+    from zoneinfo import ZoneInfo
+
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (LookupError, ValueError):
+            logger.warning("Unknown time zone %r, using UTC", name)
+    return timezone.utc
+
+
+def start_key(item, default_zone=None):
+    # Start as UTC epoch seconds, so events sort like orderBy=startTime did; the raw
+    # dateTime and date strings mix offsets and all-day values. All-day events start at
+    # midnight in the event's (or else the calendar's) time zone.
+    start = item.get("start") or {}
+    value = start.get("dateTime") or start.get("date")
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=zone(start.get("timeZone") or default_zone))
+    return moment.timestamp()
+
+
+class CalendarStore:
+    # SQLite copy of the calendar list and the events per calendar, written only by the
+    # sync worker. Events keep the API resource as JSON so the plugin can rebuild the
+    # same Google_Service_Calendar_Event objects it used before.
+
+    def __init__(self, path=STORE_PATH, clock=time.time):
+        self.clock = clock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Rollback journal instead of WAL: WordPress mounts the store read-only, and WAL
+        # readers need write access to the -shm file
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS calendars ("
+            "id TEXT PRIMARY KEY, summary TEXT, access_role TEXT, data TEXT NOT NULL, "
+            "sync_token TEXT, synced_at REAL NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS events ("
+            "calendar_id TEXT NOT NULL, id TEXT NOT NULL, start TEXT NOT NULL, updated TEXT, data TEXT NOT NULL, "
+            "start_utc REAL, PRIMARY KEY (calendar_id, id));"
+        )
+        if "start_utc" not in [row[1] for row in self._db.execute("PRAGMA table_info(events)")]:
+            self._add_start_utc()
+        self._db.executescript(
+            "DROP INDEX IF EXISTS events_by_start;"
+            "CREATE INDEX IF NOT EXISTS events_by_start_utc ON events (calendar_id, start_utc);"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def _add_start_utc(self):
+        # Stores written before the sort key existed: fill it in from the stored events
+        self._db.execute("ALTER TABLE events ADD COLUMN start_utc REAL")
+        zones = dict(self._db.execute("SELECT id, json_extract(data, '$.timeZone') FROM calendars"))
+        rows = self._db.execute("SELECT calendar_id, id, data FROM events").fetchall()
+        self._db.executemany(
+            "UPDATE events SET start_utc = ? WHERE calendar_id = ? AND id = ?",
+            [(start_key(json.loads(data), zones.get(calendar_id)), calendar_id, event_id)
+             for calendar_id, event_id, data in rows],
+        )
+
+    def replace_calendars(self, calendars):
+        # Keeps the sync state of known calendars and drops calendars (and their events)
+        # that are no longer listed. An empty list (quota, permissions, a transient empty
+        # page) never wipes the store: NOT IN () would match every row.
+        if not calendars:
+            logger.warning("Calendar list is empty, keeping the stored calendars")
+            return
+        ids = [calendar["id"] for calendar in calendars]
+        with self._lock, self._db:
+            for calendar in calendars:
+                self._db.execute(
+                    "INSERT INTO calendars (id, summary, access_role, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET summary = excluded.summary, "
+                    "access_role = excluded.access_role, data = excluded.data",
+                    (calendar["id"], calendar.get("summary"), calendar.get("accessRole"), json.dumps(calendar)),
+                )
+            params = ", ".join("?" * len(ids))
+            self._db.execute("DELETE FROM events WHERE calendar_id NOT IN (%s)" % params, ids)
+            self._db.execute("DELETE FROM calendars WHERE id NOT IN (%s)" % params, ids)
+
+    def apply_events(self, calendar_id, items, sync_token, full=False):
+        # One transaction per sync: readers never see half a page set
+        with self._lock, self._db:
+            row = self._db.execute("SELECT json_extract(data, '$.timeZone') FROM calendars WHERE id = ?",
+                                   (calendar_id,)).fetchone()
+            default_zone = row[0] if row else None
+            if full:
+                self._db.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            for item in items:
+                if item.get("status") == "cancelled":
+                    self._db.execute("DELETE FROM events WHERE calendar_id = ? AND id = ?", (calendar_id, item["id"]))
+                    continue
+                self._db.execute(
+                    "INSERT OR REPLACE INTO events (calendar_id, id, start, start_utc, updated, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (calendar_id, item["id"], event_start(item), start_key(item, default_zone), item.get("updated"),
+                     json.dumps(item)),
+                )
+            self._db.execute(
+                "UPDATE calendars SET sync_token = ?, synced_at = ? WHERE id = ?",
+                (sync_token, self.clock(), calendar_id),
+            )
+
+    def sync_token(self, calendar_id):
+        with self._lock:
+            row = self._db.execute("SELECT sync_token FROM calendars WHERE id = ?", (calendar_id,)).fetchone()
+        return row[0] if row else None
+
+    def invalidate(self, calendar_id=None):
+        # Forces a full sync on the next pass and makes readers fall back to the API
+        # until then
+        with self._lock, self._db:
+            if calendar_id is None:
+                self._db.execute("UPDATE calendars SET sync_token = NULL, synced_at = 0")
+            else:
+                self._db.execute("UPDATE calendars SET sync_token = NULL, synced_at = 0 WHERE id = ?", (calendar_id,))
+
+    def is_fresh(self, calendar_id, ttl=CACHE_TTL):
+        with self._lock:
+            row = self._db.execute("SELECT synced_at FROM calendars WHERE id = ?", (calendar_id,)).fetchone()
+        return row is not None and row[0] >= self.clock() - ttl
+
+    def calendars(self):
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM calendars ORDER BY summary, id").fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def events(self, calendar_id):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM events WHERE calendar_id = ? ORDER BY start_utc, id", (calendar_id,)
+            ).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CalendarSync:
+
+    def __init__(self, api, store, skip=SKIPPED_CALENDARS):
+        self.api = api
+        self.store = store
+        self.skip = set(skip)
+        self.full_syncs = 0
+        self.api_calls = 0
+
+    def _fetch(self, calendar_id, sync_token):
+        # All pages first, so a failure halfway leaves the store and the token untouched
+        items = []
+        page_token = None
+        while True:
+            response = self.api.list_events(calendar_id, sync_token=sync_token, page_token=page_token)
+            self.api_calls += 1
+            items.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return items, response.get("nextSyncToken")
+
+    def sync_calendar(self, calendar_id):
+        # Returns the number of changed events
+        sync_token = self.store.sync_token(calendar_id)
+        if sync_token:
+            try:
+                items, next_token = self._fetch(calendar_id, sync_token)
+                self.store.apply_events(calendar_id, items, next_token)
+                return len(items)
+            except SyncTokenExpired:
+                logger.info("Sync token for %s expired, doing a full sync", calendar_id)
+        items, next_token = self._fetch(calendar_id, None)
+        self.store.apply_events(calendar_id, items, next_token, full=True)
+        self.full_syncs += 1
+        return len(items)
+
+    def sync_all(self):
+        calendars = [calendar for calendar in self.api.list_calendars() if calendar["id"] not in self.skip]
+        self.api_calls += 1
+        self.store.replace_calendars(calendars)
+        changed = 0
+        for calendar in calendars:
+            try:
+                changed += self.sync_calendar(calendar["id"])
+            except Exception as error:
+                # The other calendars still get synced; this one goes stale after the TTL
+                logger.error("Syncing calendar %s failed: %s", calendar["id"], error)
+        return changed
+
+    def run(self, interval=SYNC_INTERVAL, stop=None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                changed = self.sync_all()
+                if changed:
+                    logger.info("Calendar sync: %d events changed", changed)
+            except Exception as error:
+                logger.error("Calendar sync failed: %s", error)
+            stop.wait(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m scripts.calendar_sync")
+    parser.add_argument("--once", action="store_true", help="sync once and exit")
+    parser.add_argument("--invalidate", nargs="*", metavar="CALENDAR_ID",
+                        help="force a full sync of these calendars (all when none given) and exit")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    store = CalendarStore(STORE_PATH)
+    try:
+        if args.invalidate is not None:
+            for calendar_id in args.invalidate or [None]:
+                store.invalidate(calendar_id)
+            return
+        sync = CalendarSync(GoogleCalendarApi(), store)
+        if args.once:
+            sync.sync_all()
+        else:
+            logger.info("Syncing calendars to %s every %ss", STORE_PATH, SYNC_INTERVAL)
+            sync.run()
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+import pika
+from pika.exceptions import AMQPError
+
+from scripts.metrics import RABBITMQ_RECONNECTS
+
+logger = logging.getLogger("RabbitMQConnection")
+
+# Everything that means "the connection or channel is gone": reconnect and retry
+RECONNECT_ERRORS = (AMQPError, OSError)
+
+RECONNECT_BASE_DELAY = float(os.getenv("RABBITMQ_RECONNECT_BASE_DELAY", 0.5))
+RECONNECT_MAX_DELAY = float(os.getenv("RABBITMQ_RECONNECT_MAX_DELAY", 30))
+
+
+def connection_parameters(host=None, port=None, user=None, password=None, vhost=None):
+    # Defaults come from the same environment variables as docker-compose.yml
+    credentials = pika.PlainCredentials(
+        username=user or os.getenv("RABBITMQ_USER", "guest"),
+        password=password or os.getenv("RABBITMQ_PASSWORD", "guest"),
+    )
+    return pika.ConnectionParameters(
+        host=host or os.getenv("RABBITMQ_HOST", "localhost"),
+        port=int(port or os.getenv("RABBITMQ_PORT", 5672)),
+        virtual_host=vhost or os.getenv("MQ_VHOST", "/"),
+        credentials=credentials,
+    )
+
+
+def backoff_delays(base=RECONNECT_BASE_DELAY, cap=RECONNECT_MAX_DELAY, retries=None, rng=random.random):
+    # Exponential backoff with full jitter: attempt n waits uniform(0, min(cap, base * 2**n))
+    attempt = 0
+    while retries is None or attempt < retries:
+        yield rng() * min(cap, base * 2 ** attempt)
+        attempt += 1
+
+
+def describe(parameters):
+    # Never log the password
+    return f"{parameters.host}:{parameters.port} | user={parameters.credentials.username} | vhost={parameters.virtual_host}"
+
+
+class ConnectionManager:
+    # Owns one BlockingConnection and its default channel. Both are (re)created on
+    # demand, and run() retries an operation on a fresh channel after a dropped
+    # connection. max_retries=None keeps retrying forever.
+
+    def __init__(self, parameters=None, max_retries=None, base_delay=RECONNECT_BASE_DELAY,
+                 max_delay=RECONNECT_MAX_DELAY, sleep=time.sleep, rng=random.random):
+        self.parameters = parameters or connection_parameters()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.rng = rng
+        self.reconnects = 0
+        self._connection = None
+        self._channel = None
+
+    def _delays(self):
+        return backoff_delays(self.base_delay, self.max_delay, self.max_retries, self.rng)
+
+    def connection(self):
+        if self._connection is not None and self._connection.is_open:
+            return self._connection
+        self._channel = None
+
+        delays = self._delays()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                logger.info(f"Trying RabbitMQ connection to {describe(self.parameters)} (attempt {attempt})")
+                self._connection = pika.BlockingConnection(self.parameters)
+                logger.info("RabbitMQ connection established")
+                return self._connection
+            except RECONNECT_ERRORS as error:
+                delay = next(delays, None)
+                if delay is None:
+                    logger.error(f"Giving up on RabbitMQ after {attempt} attempts: {error}")
+                    raise
+                logger.warning(f"RabbitMQ connection failed ({error}), retrying in {delay:.2f}s")
+                self.sleep(delay)
+
+    def channel(self):
+        if self._channel is not None and self._channel.is_open and self._connection.is_open:
+            return self._channel
+        self._channel = self.connection().channel()
+        return self._channel
+
+    def reset(self):
+        # Drop the current connection; the next channel() call reconnects
+        connection, self._connection, self._channel = self._connection, None, None
+        if connection is not None:
+            try:
+                if connection.is_open:
+                    connection.close()
+            except RECONNECT_ERRORS:
+                pass
+
+    def run(self, operation):
+        # Calls operation(channel), reconnecting and retrying with backoff when the
+        # connection or channel is lost halfway
+        delays = self._delays()
+        while True:
+            channel = self.channel()
+            try:
+                return operation(channel)
+            except RECONNECT_ERRORS as error:
+                delay = next(delays, None)
+                if delay is None:
+                    raise
+                logger.warning(f"RabbitMQ operation failed ({error!r}), reconnecting in {delay:.2f}s")
+                self.reset()
+                self.reconnects += 1
+                RABBITMQ_RECONNECTS.inc()
+                self.sleep(delay)
+
+    def close(self):
+        self.reset()
+
+
+class ChannelPool:
+    # Extra channels on the manager's connection, for callers that must not share the
+    # default channel (e.g. one channel per publisher thread or per confirm window).
+
+    def __init__(self, manager, size=4):
+        self.manager = manager
+        self.size = size
+        self._idle = []
+
+    @contextmanager
+    def channel(self):
+        channel = None
+        while self._idle and channel is None:
+            candidate = self._idle.pop()
+            if candidate.is_open:
+                channel = candidate
+        if channel is None:
+            channel = self.manager.connection().channel()
+        try:
+            yield channel
+        except RECONNECT_ERRORS:
+            # A failed channel is never handed out again
+            self.manager.reset()
+            raise
+        if channel.is_open and len(self._idle) < self.size:
+            self._idle.append(channel)
@@ -1,55 +1,108 @@
-from xml.etree.ElementTree import fromstring
+from xml.etree.ElementTree import XMLPullParser
+
+from scripts.message_schema import USER_MESSAGE
+from scripts.metrics import PARSE_SECONDS, timed
+
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_ROOT = b"<UserMessages>"
+
+ACTIONS = ("CREATE", "UPDATE", "DELETE")
+
+
+@timed(PARSE_SECONDS)
+def dispatch(xml_bytes):
+    # Single entry point for all user messages: parses once and returns (action_type, UserRecord).
+    # Accepts bytes straight from the channel, so no decode is needed per message.
+    # An unknown or missing ActionType returns (action_type, None).
+    action, user = USER_MESSAGE.decode(xml_bytes)
+    if action not in ACTIONS:
+        return action, None
+    return action, user
+
 
 def handle_user_create(xml_string):
-    xml = fromstring(xml_string)
-    if xml.find("ActionType").text != "CREATE":
-        return None
-
-    user = {
-        "uuid": xml.findtext("UUID"),
-        "time": xml.findtext("TimeOfAction"),
-        "password": xml.findtext("EncryptedPassword"),
-        "first_name": xml.findtext("FirstName"),
-        "last_name": xml.findtext("LastName"),
-        "phone": xml.findtext("PhoneNumber"),
-        "email": xml.findtext("EmailAddress"),
-        "business_name": xml.findtext("Business/BusinessName"),
-        "business_email": xml.findtext("Business/BusinessEmail"),
-        "real_address": xml.findtext("Business/RealAddress"),
-        "btw_number": xml.findtext("Business/BTWNumber"),
-        "facturation_address": xml.findtext("Business/FacturationAddress")
-    }
-    return user
+    action, user = dispatch(xml_string)
+    return user if action == "CREATE" else None
 
 
 def handle_user_update(xml_string):
-    xml = fromstring(xml_string)
-    if xml.find("ActionType").text != "UPDATE":
-        return None
-
-    user = {
-        "uuid": xml.findtext("UUID"),
-        "time": xml.findtext("TimeOfAction"),
-        "password": xml.findtext("EncryptedPassword"),
-        "first_name": xml.findtext("FirstName"),
-        "last_name": xml.findtext("LastName"),
-        "phone": xml.findtext("PhoneNumber"),
-        "email": xml.findtext("EmailAddress"),
-        "business_name": xml.findtext("Business/BusinessName"),
-        "business_email": xml.findtext("Business/BusinessEmail"),
-        "real_address": xml.findtext("Business/RealAddress"),
-        "btw_number": xml.findtext("Business/BTWNumber"),
-        "facturation_address": xml.findtext("Business/FacturationAddress")
-    }
-    return user
+    action, user = dispatch(xml_string)
+    return user if action == "UPDATE" else None
 
 
 def handle_user_delete(xml_string):
-    xml = fromstring(xml_string)
-    if xml.find("ActionType").text != "DELETE":
-        return None
-
-    return {
-        "uuid": xml.findtext("UUID"),
-        "time": xml.findtext("TimeOfAction")
-    }
+    action, user = dispatch(xml_string)
+    return user if action == "DELETE" else None
+
+
+def _read_chunks(source, chunk_size):
+    # File-like objects (open(..., "rb"), socket.makefile("rb")) or an iterable of byte chunks
+    read = getattr(source, "read", None)
+    if read is None:
+        yield from source
+        return
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _strip_declarations(chunks):
+    # Concatenated dumps repeat "<?xml ...?>" per message, which is only legal at the very
+    # start of a document. Drop them, keeping a declaration split over two chunks intact.
+    pending = b""
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = pending + chunk
+        pending = b""
+        out = []
+        pos = 0
+        while True:
+            start = data.find(b"<?xml", pos)
+            if start == -1:
+                # A declaration may start in the last few bytes of this chunk
+                tail = data.rfind(b"<", max(pos, len(data) - 4))
+                if tail != -1 and b"<?xml".startswith(data[tail:]):
+                    out.append(data[pos:tail])
+                    pending = data[tail:]
+                else:
+                    out.append(data[pos:])
+                break
+            out.append(data[pos:start])
+            end = data.find(b"?>", start)
+            if end == -1:
+                pending = data[start:]
+                break
+            pos = end + 2
+        yield b"".join(out)
+    if pending:
+        yield pending
+
+
+def iter_user_messages(source, chunk_size=STREAM_CHUNK_SIZE):
+    # Streams (action_type, UserRecord) tuples out of a file, socket or chunk iterable holding
+    # many <UserMessage> elements, either concatenated or inside any wrapper element.
+    # Every message is cleared and detached as soon as it is yielded, so memory stays flat.
+    parser = XMLPullParser(events=("start", "end"))
+    parser.feed(STREAM_ROOT)
+    stack = []
+
+    for chunk in _strip_declarations(_read_chunks(source, chunk_size)):
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                stack.append(elem)
+                continue
+            stack.pop()
+            if elem.tag != "UserMessage":
+                continue
+            action, user = USER_MESSAGE.decode(elem)
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+            yield action, (user if action in ACTIONS else None)
+
+    parser.feed(b"</" + STREAM_ROOT[1:])
+    parser.close()
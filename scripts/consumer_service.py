@@ -0,0 +1,337 @@
+import asyncio
+import inspect
+import logging
+import os
+import signal
+from collections import deque
+
+from scripts.consumer import dispatch
+from scripts.idempotency import SEEN_CACHE_PATH, SeenCache
+from scripts.metrics import (
+    HANDLER_SECONDS, MESSAGES_FAILED, MESSAGES_PROCESSED, MESSAGES_SKIPPED, PARSE_ERRORS, REGISTRY,
+    start_http_server,
+)
+from scripts.parse_pool import PARSE_WORKERS, ParsePool
+from scripts.retry import RetryScheduler
+
+logger = logging.getLogger("ConsumerService")
+
+# RabbitMQ settings (same variables as the heartbeat service)
+MQ_SERVER = os.getenv("RABBITMQ_HOST", "localhost")
+MQ_PORT = int(os.getenv("RABBITMQ_PORT", 5672))
+MQ_USER = os.getenv("RABBITMQ_USER", "guest")
+MQ_PASS = os.getenv("RABBITMQ_PASSWORD", "guest")
+MQ_VHOST = os.getenv("MQ_VHOST", "/")
+
+# Queues drained by the WordPress user consumers, with their routing keys on EXCHANGE
+EXCHANGE = "user"
+USER_QUEUES = {
+    "frontend_user_create": "frontend.user.create",
+    "frontend_user_update": "frontend.user.update",
+    "frontend_user_delete": "frontend.user.delete",
+}
+
+PREFETCH = int(os.getenv("CONSUMER_PREFETCH", 200))
+WORKERS = int(os.getenv("CONSUMER_WORKERS", 16))
+ACK_BATCH = int(os.getenv("CONSUMER_ACK_BATCH", 50))
+ACK_INTERVAL = float(os.getenv("CONSUMER_ACK_INTERVAL", 0.25))
+
+
+async def connect():
+    # aio-pika is only needed when talking to a real broker
+    import aio_pika
+
+    return await aio_pika.connect_robust(
+        host=MQ_SERVER, port=MQ_PORT, login=MQ_USER, password=MQ_PASS, virtualhost=MQ_VHOST
+    )
+
+
+def log_user_change(action, user):
+    logger.info("%s %s (%s)", action, user.uuid, user.time)
+
+
+class AckBatcher:
+    # Settles deliveries of one channel in batches. Workers finish out of order, so only
+    # the leading run of finished deliveries is acked, with a single multiple=True ack
+    # on the last acked message of that run.
+    #
+    # Delivery tags are only unique per channel. When connect_robust reopens the channel
+    # the tags start at 1 again, so the first delivery on a new channel drops everything
+    # still held for the old one: those deliveries can no longer be settled and the
+    # broker redelivers them anyway.
+
+    def __init__(self, batch_size=ACK_BATCH):
+        self.batch_size = batch_size
+        self._channel = None
+        self._delivered = deque()
+        self._finished = {}
+        self._unflushed = 0
+        self.acks_sent = 0
+
+    def delivered(self, message):
+        if message.channel is not self._channel:
+            self.reset()
+            self._channel = message.channel
+        self._delivered.append(message)
+
+    def reset(self):
+        self._delivered.clear()
+        self._finished.clear()
+        self._unflushed = 0
+
+    def _current(self, message):
+        return message.channel is self._channel
+
+    async def ack(self, message):
+        if not self._current(message):
+            return
+        self._finished[message.delivery_tag] = True
+        self._unflushed += 1
+        if self._unflushed >= self.batch_size:
+            await self.flush()
+
+    async def reject(self, message):
+        # Rejected deliveries are settled right away but still have to leave the run
+        if not self._current(message):
+            return
+        self._finished[message.delivery_tag] = False
+        await message.reject(requeue=False)
+
+    async def flush(self):
+        last = None
+        while self._delivered and self._delivered[0].delivery_tag in self._finished:
+            message = self._delivered.popleft()
+            if self._finished.pop(message.delivery_tag):
+                last = message
+        self._unflushed = 0
+        if last is not None:
+            await last.ack(multiple=True)
+            self.acks_sent += 1
+
+    def __len__(self):
+        return len(self._delivered)
+
+
+class ConsumerService:
+    # Consumes the frontend user queues with a prefetch window, runs the handler on a
+    # bounded pool of worker tasks and acks in batches.
+
+    def __init__(self, handler=log_user_change, connect=connect, queues=USER_QUEUES, exchange=EXCHANGE,
+                 prefetch=PREFETCH, workers=WORKERS, ack_batch=ACK_BATCH, ack_interval=ACK_INTERVAL,
+                 parse=dispatch, parse_pool=None, guard=None, retry=None):
+        self.handler = handler
+        self.connect = connect
+        self.queues = queues
+        self.exchange = exchange
+        self.prefetch = prefetch
+        self.workers = workers
+        # A batch larger than the prefetch window would only be flushed by the timer
+        self.ack_batch = max(1, min(ack_batch, prefetch // 2 or 1))
+        self.ack_interval = ack_interval
+        self.parse = parse
+        # Optional ParsePool: bodies are parsed in worker processes, in delivery order
+        self.parse_pool = parse_pool
+        # Optional SeenCache: duplicate and stale messages are acked without calling the handler
+        self.guard = guard
+        # Optional RetryScheduler: failed messages are retried later or dead-lettered
+        # instead of rejected
+        self.retry = retry
+        self.processed = 0
+        self.failed = 0
+        self.skipped = 0
+        self._stopping = None
+
+    async def _setup(self, connection):
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=self.prefetch)
+        exchange = await channel.declare_exchange(self.exchange, "topic", durable=True)
+        queues = []
+        for name, routing_key in self.queues.items():
+            queue = await channel.declare_queue(name, durable=True)
+            await queue.bind(exchange, routing_key)
+            queues.append(queue)
+        if self.retry is not None:
+            await self.retry.setup(channel, self.queues)
+        return channel, queues
+
+    async def handle(self, message, parsed=None):
+        if parsed is None:
+            try:
+                parsed = self.parse(message.body)
+            except Exception:
+                PARSE_ERRORS.inc()
+                raise
+        elif isinstance(parsed, Exception):
+            PARSE_ERRORS.inc()
+            raise parsed
+        action, user = parsed
+        if user is None:
+            logger.warning("Ignoring message with ActionType %r", action)
+            return
+        if self.guard is None:
+            await self._call_handler(action, user)
+            return
+        if not self.guard.admit(action, user):
+            logger.debug("Skipping duplicate or stale %s for %s (%s)", action, user.uuid, user.time)
+            self.skipped += 1
+            MESSAGES_SKIPPED.inc()
+            return
+        try:
+            await self._call_handler(action, user)
+        except Exception:
+            self.guard.revert(action, user)
+            raise
+        self.guard.confirm(action, user)
+
+    async def _call_handler(self, action, user):
+        with HANDLER_SECONDS.time():
+            result = self.handler(action, user)
+            if inspect.isawaitable(result):
+                await result
+
+    async def _worker(self, pending, acks):
+        while True:
+            message, parsed = await pending.get()
+            try:
+                try:
+                    await self.handle(message, parsed)
+                except Exception as error:
+                    self.failed += 1
+                    MESSAGES_FAILED.inc()
+                    await self._failed(message, error, acks)
+                else:
+                    self.processed += 1
+                    MESSAGES_PROCESSED.inc()
+                    await acks.ack(message)
+            except Exception:
+                # Settling fails when the channel closed under the delivery; the broker
+                # redelivers it, so the worker only logs and carries on
+                logger.exception("Could not settle message %s", message.delivery_tag)
+            finally:
+                pending.task_done()
+
+    async def _failed(self, message, error, acks):
+        if self.retry is None:
+            logger.exception("Failed to process message %s", message.delivery_tag)
+            await acks.reject(message)
+            return
+        try:
+            await self.retry.schedule(message, error)
+        except Exception:
+            logger.exception("Could not schedule a retry for message %s", message.delivery_tag)
+            await acks.reject(message)
+        else:
+            # The copy is in a retry or dead-letter queue now
+            await acks.ack(message)
+
+    async def _chunker(self, incoming, chunks):
+        # Groups whatever is already delivered (up to chunk_size) and sends it to the pool
+        while True:
+            chunk = [await incoming.get()]
+            while len(chunk) < self.parse_pool.chunk_size and not incoming.empty():
+                chunk.append(incoming.get_nowait())
+            future = asyncio.wrap_future(self.parse_pool.submit([message.body for message in chunk]))
+            await chunks.put((chunk, future))
+            for _ in chunk:
+                incoming.task_done()
+
+    async def _collector(self, chunks, pending):
+        # Chunks are awaited in submission order, so workers get messages in delivery order
+        while True:
+            chunk, future = await chunks.get()
+            try:
+                results = await future
+            except Exception as error:
+                results = [error] * len(chunk)
+            for message, parsed in zip(chunk, results):
+                pending.put_nowait((message, parsed))
+            chunks.task_done()
+
+    async def _flusher(self, acks):
+        while True:
+            await asyncio.sleep(self.ack_interval)
+            try:
+                await acks.flush()
+            except Exception:
+                logger.exception("Could not flush acks")
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        connection = await self.connect()
+        try:
+            channel, queues = await self._setup(connection)
+            acks = AckBatcher(self.ack_batch)
+            pending = asyncio.Queue()
+            stages = []
+
+            if self.parse_pool is None:
+                async def on_message(message):
+                    acks.delivered(message)
+                    pending.put_nowait((message, None))
+            else:
+                incoming = asyncio.Queue()
+                chunks = asyncio.Queue(maxsize=2 * self.parse_pool.workers)
+                stages = [incoming, chunks]
+
+                async def on_message(message):
+                    acks.delivered(message)
+                    incoming.put_nowait(message)
+
+            consumer_tags = [await queue.consume(on_message) for queue in queues]
+            tasks = [asyncio.ensure_future(self._worker(pending, acks)) for _ in range(self.workers)]
+            tasks.append(asyncio.ensure_future(self._flusher(acks)))
+            if stages:
+                tasks.append(asyncio.ensure_future(self._chunker(incoming, chunks)))
+                tasks.append(asyncio.ensure_future(self._collector(chunks, pending)))
+            logger.info("Consuming %s (prefetch=%d, workers=%d)", ", ".join(self.queues), self.prefetch, self.workers)
+
+            await self._stopping.wait()
+
+            # Stop new deliveries, finish what is in flight and settle it before closing
+            for queue, tag in zip(queues, consumer_tags):
+                await queue.cancel(tag)
+            for stage in stages + [pending]:
+                await stage.join()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await acks.flush()
+        finally:
+            if self.guard is not None:
+                self.guard.flush()
+            await connection.close()
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+
+async def run_until_signalled(service):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, service.stop)
+        except NotImplementedError:
+            # Windows event loops have no signal handlers
+            pass
+    await service.run()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if REGISTRY.enabled:
+        start_http_server()
+    parse_pool = ParsePool(PARSE_WORKERS) if PARSE_WORKERS > 0 else None
+    guard = SeenCache(path=SEEN_CACHE_PATH)
+    service = ConsumerService(parse_pool=parse_pool, guard=guard, retry=RetryScheduler())
+
+    try:
+        asyncio.run(run_until_signalled(service))
+    finally:
+        guard.close()
+        if parse_pool is not None:
+            parse_pool.close()
+
+
+if __name__ == "__main__":
+    main()
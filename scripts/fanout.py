@@ -0,0 +1,159 @@
+from functools import lru_cache
+
+from scripts.message_schema import UPDATE_EVENT, UPDATE_SESSION
+from scripts.metrics import MESSAGES_PUBLISHED, PUBLISH_SECONDS
+
+# Messages published between two tx_commit calls
+CONFIRM_WINDOW = 500
+
+
+@lru_cache(maxsize=None)
+def xml_properties():
+    # pika is imported on first publish, not when the module is imported
+    from pika import BasicProperties
+
+    return BasicProperties(content_type="text/xml")
+
+
+# Routing keys of the event registration messages (event-registration-producer plugin).
+# The event and session exchanges and their queues are declared by the other teams.
+EVENT_ROUTING_KEYS = ("planning.event.update", "kassa.event.update", "crm.event.update")
+SESSION_ROUTING_KEYS = ("planning.session.update", "crm.session.update")
+
+
+def declare_routes(channel, exchange, routes):
+    for queue, routing_key in routes.items():
+        channel.queue_declare(queue)
+        channel.queue_bind(queue, exchange, routing_key)
+
+
+class Fanout:
+    # One serialized body for several routing keys on one exchange. The body is bytes,
+    # so every route publishes the same object without copying or re-serializing.
+    __slots__ = ("exchange", "routing_keys", "body")
+
+    def __init__(self, exchange, routing_keys, body):
+        self.exchange = exchange
+        self.routing_keys = tuple(routing_keys)
+        self.body = bytes(body)
+
+    def __len__(self):
+        return len(self.routing_keys)
+
+    def messages(self):
+        return [(self.exchange, routing_key, self.body) for routing_key in self.routing_keys]
+
+
+def windows(fanouts, size):
+    # Groups fanouts into windows of about size messages; a fanout is never split, so
+    # all routes of one body are committed together
+    window = []
+    count = 0
+    for fanout in fanouts:
+        if window and count + len(fanout) > size:
+            yield window
+            window = []
+            count = 0
+        window.append(fanout)
+        count += len(fanout)
+    if window:
+        yield window
+
+
+class FanoutPublisher:
+    # Publishes Fanouts over one channel. topology ({exchange: {queue: routing_key}}) is
+    # declared once per channel.
+    #
+    # With a ConnectionManager instead of a fixed channel, a dropped connection is
+    # re-established transparently: the topology is declared again on the new channel
+    # and an unconfirmed window is published again.
+    #
+    # With an Outbox, messages are only appended to the local log and published later by
+    # an OutboxFlusher (scripts/outbox.py), so publishing never waits for the broker.
+
+    def __init__(self, channel=None, topology=None, confirm_window=CONFIRM_WINDOW, manager=None, outbox=None,
+                 properties=None):
+        self.channel = channel
+        self.manager = manager
+        self.outbox = outbox
+        self.topology = topology or {}
+        self.confirm_window = confirm_window
+        self.properties = properties
+        self._declared = None
+        self._transactional = False
+
+    def _run(self, operation):
+        if self.manager is None:
+            return operation(self.channel)
+        return self.manager.run(operation)
+
+    def declare_on(self, channel):
+        for exchange, routes in self.topology.items():
+            declare_routes(channel, exchange, routes)
+
+    def _prepare(self, channel):
+        if channel is self._declared:
+            return
+        # New (or re-created) channel: declare the topology and start outside a transaction
+        self.declare_on(channel)
+        self.channel = channel
+        self._declared = channel
+        self._transactional = False
+
+    def declare(self):
+        self._run(self._prepare)
+
+    def _send(self, channel, fanouts, transactional):
+        self._prepare(channel)
+        if transactional and not self._transactional:
+            channel.tx_select()
+            self._transactional = True
+        properties = self.properties or xml_properties()
+        count = 0
+        for fanout in fanouts:
+            body = fanout.body
+            for routing_key in fanout.routing_keys:
+                channel.basic_publish(exchange=fanout.exchange, routing_key=routing_key, body=body,
+                                      properties=properties)
+            count += len(fanout)
+        if self._transactional:
+            channel.tx_commit()
+        return count
+
+    def _append(self, fanouts):
+        messages = [message for fanout in fanouts for message in fanout.messages()]
+        self.outbox.append_many(messages)
+        return len(messages)
+
+    def send(self, fanouts, transactional=True):
+        # Publishes fanouts as one unit (one transaction when transactional); returns the
+        # number of messages published
+        if self.outbox is not None:
+            return self._append(fanouts)
+        with PUBLISH_SECONDS.time():
+            count = self._run(lambda channel: self._send(channel, fanouts, transactional))
+        MESSAGES_PUBLISHED.inc(count)
+        return count
+
+    def publish_batch(self, fanouts):
+        # BlockingChannel.confirm_delivery() waits for a broker ack after every message,
+        # so windows are confirmed with channel transactions: one tx_commit round trip
+        # per confirm_window messages. A window that was not committed when the
+        # connection dropped is rolled back by the broker and published again.
+        # Returns the number of messages published.
+        if self.outbox is not None:
+            return self._append(list(fanouts))
+        return sum(self.send(window) for window in windows(fanouts, self.confirm_window))
+
+
+def event_fanouts(event, sessions=()):
+    # An UpdateEvent and its UpdateSessions (mappings as in scripts.message_schema),
+    # each serialized once
+    fanouts = [Fanout("event", EVENT_ROUTING_KEYS, UPDATE_EVENT.encode(event))]
+    fanouts.extend(Fanout("session", SESSION_ROUTING_KEYS, UPDATE_SESSION.encode(session)) for session in sessions)
+    return fanouts
+
+
+def publish_event(publisher, event, sessions=()):
+    # The event and all its sessions in one transaction (or one outbox append)
+    return publisher.send(event_fanouts(event, sessions))
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Last seen TimeOfAction per user UUID, used to drop redeliveries and stale messages
+# before any WordPress work is done. Optionally persisted in SQLite for restarts.
+SEEN_CACHE_SIZE = int(os.getenv("CONSUMER_SEEN_CACHE_SIZE", 100000))
+SEEN_CACHE_TTL = float(os.getenv("CONSUMER_SEEN_CACHE_TTL", 7 * 24 * 3600))
+SEEN_CACHE_PATH = os.getenv("CONSUMER_SEEN_CACHE_PATH")
+
+COMMIT_EVERY = 500
+
+
+def time_key(value):
+    # TimeOfAction as a comparable number; None when missing or not ISO 8601
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def content_digest(action, user):
+    # Identifies a message at one TimeOfAction: a redelivery has the same action and fields
+    return hashlib.sha1(("%s %r" % (action, user)).encode()).hexdigest()[:16]
+
+
+class SeenCache:
+    # Bounded LRU of uuid -> (time_key, deleted, stored_at, digests), entries expire after
+    # ttl. digests holds the content digests of the messages seen at time_key: TimeOfAction
+    # only has second precision, so a different change within the same second is still
+    # admitted and only the same message again is a duplicate.
+    #
+    # admit() decides whether a message still needs work and records it right away, so a
+    # duplicate picked up by another worker is dropped too; revert() undoes that when the
+    # handler fails and confirm() makes it durable once the work is done. Both are tracked
+    # per message, as several messages for one user can be in flight at the same time.
+
+    def __init__(self, maxsize=SEEN_CACHE_SIZE, ttl=SEEN_CACHE_TTL, path=None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        # (uuid, time_key, digest) -> [entry written by the message, entry it replaced]
+        self._pending = {}
+        # Messages that failed after a newer message for the same user was admitted; their
+        # retry is admitted once even though it is older
+        self._retries = OrderedDict()
+        self._db = None
+        self._uncommitted = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            "uuid TEXT PRIMARY KEY, time_key REAL, deleted INTEGER NOT NULL, stored_at REAL NOT NULL, digests TEXT)"
+        )
+        if "digests" not in [row[1] for row in self._db.execute("PRAGMA table_info(seen)")]:
+            self._db.execute("ALTER TABLE seen ADD COLUMN digests TEXT")
+        self._db.execute("DELETE FROM seen WHERE stored_at < ?", (self.clock() - self.ttl,))
+        self._db.commit()
+
+    def get(self, uuid):
+        entry = self._entries.get(uuid)
+        if entry is None and self._db is not None:
+            row = self._db.execute("SELECT time_key, deleted, stored_at, digests FROM seen WHERE uuid = ?",
+                                   (uuid,)).fetchone()
+            if row is not None:
+                entry = (row[0], bool(row[1]), row[2], frozenset(filter(None, (row[3] or "").split(","))))
+                self._put(uuid, entry)
+        if entry is None:
+            return None
+        if entry[2] < self.clock() - self.ttl:
+            del self._entries[uuid]
+            return None
+        self._entries.move_to_end(uuid)
+        return entry
+
+    def _put(self, uuid, entry):
+        self._entries[uuid] = entry
+        self._entries.move_to_end(uuid)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _token(self, action, user):
+        key = time_key(user.time)
+        if user.uuid is None or key is None:
+            return None
+        return user.uuid, key, content_digest(action, user)
+
+    def _is_fresh(self, action, token, entry):
+        if token is None or entry is None:
+            return True
+        last_key, deleted, _, digests = entry
+        if deleted and action == "UPDATE":
+            return False
+        _, key, digest = token
+        if last_key is None or key > last_key:
+            return True
+        if key == last_key:
+            return digest not in digests
+        return token in self._retries and not deleted
+
+    def is_fresh(self, action, user):
+        token = self._token(action, user)
+        return self._is_fresh(action, token, self.get(token[0]) if token else None)
+
+    def admit(self, action, user):
+        token = self._token(action, user)
+        if token is None:
+            return True
+        uuid, key, digest = token
+        previous = self.get(uuid)
+        if not self._is_fresh(action, token, previous):
+            return False
+        self._retries.pop(token, None)
+        if previous is not None and previous[0] is not None and key < previous[0]:
+            # A retry older than the current state: admitted, but the state stays
+            self._pending[token] = [None, None]
+            return True
+        digests = {digest}
+        if previous is not None and previous[0] == key:
+            digests.update(previous[3])
+        entry = (key, action == "DELETE", self.clock(), frozenset(digests))
+        self._pending[token] = [entry, previous]
+        self._put(uuid, entry)
+        return True
+
+    def revert(self, action, user):
+        token = self._token(action, user)
+        if token not in self._pending:
+            return
+        entry, previous = self._pending.pop(token)
+        uuid = token[0]
+        if entry is not None and self._entries.get(uuid) is entry:
+            # Nothing was admitted after this message: back to the state before it
+            if previous is None:
+                self._entries.pop(uuid, None)
+            else:
+                self._put(uuid, previous)
+            return
+        # Newer messages for this user were admitted meanwhile and keep their state; the
+        # ones that would fall back to this message's entry fall back to its predecessor
+        for pending in self._pending.values():
+            if entry is not None and pending[1] is entry:
+                pending[1] = previous
+        self._retries[token] = True
+        if len(self._retries) > self.maxsize:
+            self._retries.popitem(last=False)
+
+    def confirm(self, action, user):
+        token = self._token(action, user)
+        if token not in self._pending:
+            return
+        entry, _ = self._pending.pop(token)
+        if self._db is None or entry is None:
+            return
+        key, deleted, stored_at, digests = entry
+        # Messages can be confirmed out of order: an older one never overwrites a newer state
+        self._db.execute(
+            "INSERT INTO seen (uuid, time_key, deleted, stored_at, digests) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(uuid) DO UPDATE SET time_key = excluded.time_key, deleted = excluded.deleted, "
+            "stored_at = excluded.stored_at, digests = excluded.digests "
+            "WHERE seen.time_key IS NULL OR excluded.time_key >= seen.time_key",
+            (token[0], key, int(deleted), stored_at, ",".join(sorted(digests))),
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self._db is not None and self._uncommitted:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return len(self._entries)
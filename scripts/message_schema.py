@@ -0,0 +1,312 @@
+import os
+from xml.etree.ElementTree import fromstring, tostring
+
+from scripts.user_record import BUSINESS_FIELDS, USER_FIELDS, UserRecord
+
+# Declarative specs for every XML message the frontend sends or receives. Each
+# MessageSchema compiles its encoders (one f-string per element group) and decoder
+# tables once at import time, and can check a message against its structure or
+# against the XSD generated from the same spec.
+
+# Structural validation of incoming messages; off by default because it costs a
+# second walk over every message
+VALIDATE_MESSAGES = os.getenv("VALIDATE_MESSAGES", "").lower() in ("1", "true", "yes")
+
+_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+# Fields of the lowercase <User> shape (scripts/xml_utils.py), in document order
+USER_SHAPE_FIELDS = (
+    "user_login", "user_pass", "user_email", "user_registered",
+    "first_name", "last_name", "phone_number",
+    "business_name", "business_email", "real_address", "btw_number", "facturation_address",
+    "action_type", "time_of_action",
+)
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def escape(value):
+    if value is None:
+        return ""
+    if value.__class__ is not str:
+        value = str(value)
+    if "&" in value or "<" in value or ">" in value:
+        return value.translate(_ESCAPES)
+    return value
+
+
+def format_value(template, values):
+    # Fills a compiled template with the escaped values (also used by scripts.xml_serializer).
+    # Fast path: one scan over all values when they are plain strings without markup
+    try:
+        joined = "".join(values)
+    except TypeError:
+        pass
+    else:
+        if "&" not in joined and "<" not in joined and ">" not in joined:
+            return template(*values)
+    return template(*map(escape, values))
+
+
+def compile_template(root, layout):
+    # Generates a function rendering root with one f-string; it takes the (escaped) values
+    # positionally in document order. layout lists tags, a (tag, tags) pair nests a group.
+    names = []
+
+    def render(tag, children):
+        if children is None:
+            names.append("v%d" % len(names))
+            return "<%s>{%s}</%s>" % (tag, names[-1], tag)
+        inner = "".join(render(*item) if isinstance(item, tuple) else render(item, None) for item in children)
+        return "<%s>%s</%s>" % (tag, inner, tag)
+
+    body = render(root, layout)
+    namespace = {}
+    exec("def render_%s(%s):\n    return f\"%s\"\n" % (root, ", ".join(names), body), namespace)
+    return namespace["render_" + root]
+
+
+class Field:
+    # A leaf element, a nested group (children) or a container of repeated items (item,
+    # a MessageSchema for the repeated element). name is the key in decoded dicts.
+    __slots__ = ("tag", "name", "children", "item", "required", "schema")
+
+    def __init__(self, tag, name, children=None, item=None, required=True):
+        self.tag = tag
+        self.name = name
+        self.children = children
+        self.item = item
+        self.required = required
+        self.schema = MessageSchema(tag, children) if children is not None else None
+
+
+class MessageSchema:
+
+    def __init__(self, root, fields, decoder=None):
+        self.root = root
+        self.fields = tuple(fields)
+        self._positions = {field.tag: index for index, field in enumerate(self.fields)}
+        self._leaves = {field.tag: field.name for field in self.fields if field.schema is None and field.item is None}
+        self._groups = {
+            field.tag: (field.name, field.item or field.schema, field.item is not None)
+            for field in self.fields if field.schema is not None or field.item is not None
+        }
+        # Positional fast path, only for messages without repeated elements
+        self.template = None if self._has_items() else compile_template(root, self.layout())
+        self._encode = self._compile_encoder()
+        self._decoder = decoder
+        self._xml_schema = None
+
+    def _has_items(self):
+        return any(field.item is not None or (field.schema and field.schema._has_items()) for field in self.fields)
+
+    def layout(self):
+        return tuple((field.tag, field.schema.layout()) if field.schema else field.tag for field in self.fields)
+
+    def _compile_encoder(self):
+        # encode_<root>(m) renders a mapping; nested groups and repeated items get their
+        # own compiled function, called from the parent's f-string
+        namespace = {"e": escape, "join": "".join, "EMPTY": {}}
+        parts = []
+        for index, field in enumerate(self.fields):
+            if field.item is not None:
+                namespace["item%d" % index] = field.item._encode
+                parts.append("<%s>{join(map(item%d, m.get(%r) or ()))}</%s>" % (field.tag, index, field.name, field.tag))
+            elif field.schema is not None:
+                namespace["group%d" % index] = field.schema._encode
+                parts.append("{group%d(m.get(%r) or EMPTY)}" % (index, field.name))
+            else:
+                parts.append("<%s>{e(m.get(%r))}</%s>" % (field.tag, field.name, field.tag))
+        source = "def encode_%s(m):\n    return f\"<%s>%s</%s>\"\n" % (self.root, self.root, "".join(parts), self.root)
+        exec(source, namespace)
+        return namespace["encode_" + self.root]
+
+    def encode(self, values):
+        # Mapping (nested dicts for groups, lists of dicts for repeated items) -> bytes
+        return self._encode(values).encode()
+
+    def encode_values(self, values):
+        # Positional values in document order -> bytes, escaped only when needed
+        return format_value(self.template, values).encode()
+
+    def decode(self, data, validate=VALIDATE_MESSAGES):
+        # bytes, str or an Element -> dict (or what the schema's own decoder returns)
+        element = fromstring(data) if isinstance(data, (bytes, str)) else data
+        if validate:
+            self.validate(element)
+        if self._decoder is not None:
+            return self._decoder(element)
+        return self.decode_element(element)
+
+    def decode_element(self, element):
+        # Missing fields are left out, present but empty fields become "" (same as findtext)
+        values = {}
+        leaves = self._leaves
+        for child in element:
+            tag = child.tag
+            name = leaves.get(tag)
+            if name is not None:
+                values[name] = child.text or ""
+                continue
+            group = self._groups.get(tag)
+            if group is not None:
+                name, schema, repeated = group
+                values[name] = [schema.decode_element(item) for item in child] if repeated else schema.decode_element(child)
+        return values
+
+    def errors(self, element, path=""):
+        path = "%s/%s" % (path, element.tag)
+        if element.tag != self.root:
+            return ["%s: expected <%s>" % (path, self.root)]
+        errors = []
+        present = set()
+        last = -1
+        for child in element:
+            index = self._positions.get(child.tag)
+            if index is None:
+                errors.append("%s: unexpected <%s>" % (path, child.tag))
+                continue
+            if index <= last:
+                errors.append("%s: <%s> is repeated or out of order" % (path, child.tag))
+            last = max(last, index)
+            present.add(child.tag)
+            field = self.fields[index]
+            if field.item is not None:
+                for item in child:
+                    errors.extend(field.item.errors(item, "%s/%s" % (path, child.tag)))
+            elif field.schema is not None:
+                errors.extend(field.schema.errors(child, path))
+            elif len(child):
+                errors.append("%s/%s: unexpected child elements" % (path, child.tag))
+        for field in self.fields:
+            if field.required and field.tag not in present:
+                errors.append("%s: missing <%s>" % (path, field.tag))
+        return errors
+
+    def validate(self, data, xsd=False):
+        # Structural check against the spec; xsd=True validates against the generated XSD
+        # with lxml instead (optional dependency, imported on first use)
+        if xsd:
+            self._validate_xsd(data)
+            return
+        element = fromstring(data) if isinstance(data, (bytes, str)) else data
+        errors = self.errors(element)
+        if errors:
+            raise SchemaError("; ".join(errors))
+
+    def _validate_xsd(self, data):
+        from lxml import etree
+
+        if self._xml_schema is None:
+            self._xml_schema = etree.XMLSchema(etree.fromstring(self.to_xsd().encode()))
+        if not isinstance(data, (bytes, str)):
+            data = tostring(data)
+        document = etree.fromstring(data.encode() if isinstance(data, str) else data)
+        if not self._xml_schema.validate(document):
+            raise SchemaError("; ".join(str(error) for error in self._xml_schema.error_log))
+
+    def to_xsd(self):
+        lines = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">',
+        ]
+        self._xsd_element(lines, "  ", "")
+        lines.append("</xs:schema>")
+        return "\n".join(lines) + "\n"
+
+    def _xsd_element(self, lines, indent, occurs):
+        lines.append('%s<xs:element name="%s"%s>' % (indent, self.root, occurs))
+        lines.append("%s  <xs:complexType>" % indent)
+        lines.append("%s    <xs:sequence>" % indent)
+        inner = indent + "      "
+        for field in self.fields:
+            optional = "" if field.required else ' minOccurs="0"'
+            if field.item is not None:
+                lines.append('%s<xs:element name="%s"%s>' % (inner, field.tag, optional))
+                lines.append("%s  <xs:complexType>" % inner)
+                lines.append("%s    <xs:sequence>" % inner)
+                field.item._xsd_element(lines, inner + "      ", ' minOccurs="0" maxOccurs="unbounded"')
+                lines.append("%s    </xs:sequence>" % inner)
+                lines.append("%s  </xs:complexType>" % inner)
+                lines.append("%s</xs:element>" % inner)
+            elif field.schema is not None:
+                field.schema._xsd_element(lines, inner, optional)
+            else:
+                lines.append('%s<xs:element name="%s" type="xs:string"%s/>' % (inner, field.tag, optional))
+        lines.append("%s    </xs:sequence>" % indent)
+        lines.append("%s  </xs:complexType>" % indent)
+        lines.append("%s</xs:element>" % indent)
+
+
+# Root tag -> MessageSchema
+SCHEMAS = {}
+
+
+def register(schema):
+    if schema.root in SCHEMAS:
+        raise ValueError("A schema for <%s> is already registered" % schema.root)
+    SCHEMAS[schema.root] = schema
+    return schema
+
+
+def schema_for(root):
+    try:
+        return SCHEMAS[root]
+    except KeyError:
+        raise SchemaError("No schema registered for <%s>" % root) from None
+
+
+def encode_message(root, values):
+    return schema_for(root).encode(values)
+
+
+def decode_message(data, validate=VALIDATE_MESSAGES):
+    # Any registered message -> (root tag, decoded value)
+    element = fromstring(data) if isinstance(data, (bytes, str)) else data
+    return element.tag, schema_for(element.tag).decode(element, validate)
+
+
+# <UserMessage> (producer and consumer). Decodes to (action, UserRecord); a DELETE only
+# needs its UUID and TimeOfAction.
+USER_MESSAGE = register(MessageSchema(
+    "UserMessage",
+    [Field("ActionType", "action")]
+    + [Field(tag, name, required=tag in ("UUID", "TimeOfAction")) for tag, name in USER_FIELDS.items()]
+    + [Field("Business", "business", [Field(tag, name, required=False) for tag, name in BUSINESS_FIELDS.items()],
+             required=False)],
+    decoder=UserRecord.from_element,
+))
+
+# Lowercase <User> built by the WordPress side (scripts/xml_utils.py)
+USER = register(MessageSchema("User", [Field(key, key, required=False) for key in USER_SHAPE_FIELDS]))
+
+HEARTBEAT = register(MessageSchema("Heartbeat", [Field("ServiceName", "service_name")]))
+
+# Event registration messages (event-registration-producer plugin)
+UPDATE_EVENT = register(MessageSchema("UpdateEvent", [
+    Field("EventUUID", "event_uuid"),
+    Field("EventName", "event_name"),
+    Field("EventDescription", "event_description"),
+    Field("StartDateTime", "start"),
+    Field("EndDateTime", "end"),
+    Field("EventLocation", "location"),
+    Field("Organisator", "organisator"),
+    Field("Capacity", "capacity"),
+    Field("EventType", "event_type"),
+    Field("RegisteredUsers", "registered_users", item=MessageSchema("User", [Field("UUID", "uuid")])),
+]))
+
+UPDATE_SESSION = register(MessageSchema("UpdateSession", [
+    Field("SessionUUID", "session_uuid"),
+    Field("EventUUID", "event_uuid"),
+    Field("SessionName", "session_name"),
+    Field("SessionDescription", "session_description"),
+    Field("Capacity", "capacity"),
+    Field("StartDateTime", "start"),
+    Field("EndDateTime", "end"),
+    Field("SessionLocation", "location"),
+    Field("SessionType", "session_type"),
+    Field("RegisteredUsers", "registered_users", item=MessageSchema("User", [Field("email", "email")])),
+]))
@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Counters and histograms for the hot paths, exported in the Prometheus text format.
+# Disabled unless METRICS_ENABLED is set: timed() then returns the function itself and
+# inc()/observe() return after a single flag check.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+# Own default port: 9100 belongs to node_exporter, which may run next to these containers
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9464))
+
+# Seconds, from a fast parse (~10 us) up to a slow deploy
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def counter(self, name, help):
+        return self._metrics.get(name) or self.register(Counter(name, help, self))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._metrics.get(name) or self.register(Histogram(name, help, buckets, self))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class Counter:
+
+    def __init__(self, name, help, registry):
+        self.name = name
+        self.help = help
+        self.registry = registry
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}",
+        ]
+
+
+class Histogram:
+
+    def __init__(self, name, help, buckets, registry):
+        self.name = name
+        self.help = help
+        self.registry = registry
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket plus +Inf; cumulated when rendered
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        if not self.registry.enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return Timer(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Timer:
+    # with histogram.time(): ...
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        if self.histogram.registry.enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            self.histogram.observe(time.perf_counter() - self.start)
+
+
+def timed(histogram):
+    # Decorator for hot functions. When metrics are disabled at import time the function
+    # is returned unwrapped, so there is no per-call cost at all.
+    def decorate(fn):
+        if not histogram.registry.enabled:
+            return fn
+        observe = histogram.observe
+        clock = time.perf_counter
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(clock() - start)
+        return wrapper
+    return decorate
+
+
+REGISTRY = Registry()
+
+# Hot-path metrics shared by the scripts/ modules, the heartbeat and the webhook listener
+PARSE_SECONDS = REGISTRY.histogram("frontend_parse_seconds", "Time to parse one user message")
+PARSE_ERRORS = REGISTRY.counter("frontend_parse_errors_total", "User messages that could not be parsed")
+VALIDATE_SECONDS = REGISTRY.histogram("frontend_validate_seconds", "Time to validate one user or one batch")
+SERIALIZE_SECONDS = REGISTRY.histogram("frontend_serialize_seconds", "Time to serialize one user message")
+PUBLISH_SECONDS = REGISTRY.histogram("frontend_publish_seconds", "Time to publish one user or one confirmed window")
+MESSAGES_PUBLISHED = REGISTRY.counter("frontend_messages_published_total", "Messages published to RabbitMQ")
+MESSAGES_PROCESSED = REGISTRY.counter("frontend_messages_processed_total", "Consumed messages handled successfully")
+MESSAGES_FAILED = REGISTRY.counter("frontend_messages_failed_total", "Consumed messages whose handling failed")
+MESSAGES_RETRIED = REGISTRY.counter("frontend_messages_retried_total", "Failed messages scheduled for a delayed retry")
+MESSAGES_DEAD_LETTERED = REGISTRY.counter("frontend_messages_dead_lettered_total", "Failed messages moved to the dead-letter queue")
+MESSAGES_SKIPPED = REGISTRY.counter("frontend_messages_skipped_total", "Duplicate or stale messages skipped")
+HANDLER_SECONDS = REGISTRY.histogram("frontend_handler_seconds", "Time spent in the consumer handler (WordPress)")
+HEARTBEATS_SENT = REGISTRY.counter("frontend_heartbeats_sent_total", "Heartbeat messages published")
+HEARTBEATS_MISSED = REGISTRY.counter("frontend_heartbeats_missed_total", "Heartbeats skipped because publishing was late")
+RABBITMQ_RECONNECTS = REGISTRY.counter("frontend_rabbitmq_reconnects_total", "Reconnects after a lost RabbitMQ connection")
+DEPLOY_SECONDS = REGISTRY.histogram("frontend_deploy_seconds", "Duration of a webhook deploy (git pull + restart)")
+DEPLOYS_FAILED = REGISTRY.counter("frontend_deploys_failed_total", "Webhook deploys that failed")
+
+
+def make_handler(registry):
+    # http.server is only imported by processes that serve /metrics
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood the service logs
+            pass
+
+    return MetricsHandler
+
+
+def start_http_server(port=METRICS_PORT, registry=REGISTRY, host="0.0.0.0"):
+    # Serves /metrics from a daemon thread; returns the server so callers can shut it down
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), make_handler(registry))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -1,60 +1,109 @@
-import requests
+import json
+import os
+import platform
 import subprocess
 import time
-import platform
-import os
-from dotenv import load_dotenv 
 
 # ====== CONFIGURATION ======
-load_dotenv() 
-
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 REPO_OWNER = "IntegrationProject1"
 REPO_NAME = "Frontend"
 WEBHOOK_ID = 544925591  # ngrok webhook
 PORT = 30012
+# Local ngrok API, answers once the agent is up
+NGROK_API = "http://localhost:4040/api/tunnels"
+# Seconds to wait for the tunnel before giving up
+NGROK_TIMEOUT = float(os.getenv("NGROK_TIMEOUT", 15))
 # ===========================
 
-# 🔍 Determine ngrok command based on OS
-if platform.system() == "Windows":
-    ngrok_cmd = [r"C:\Users\Weiam\Downloads\ngrok.exe", "http", str(PORT)]
-else:
-    ngrok_cmd = ["ngrok", "http", str(PORT)]
-
-# Step 1: Start ngrok
-print("🔄 Starting ngrok...")
-ngrok_process = subprocess.Popen(ngrok_cmd)
-time.sleep(3)  # Wait for ngrok to initialize
-
-# Step 2: Get public URL from ngrok
-try:
-    response = requests.get("http://localhost:4040/api/tunnels")
-    tunnels = response.json()["tunnels"]
-    public_url = next(t["public_url"] for t in tunnels if t["proto"] == "https")
-    print(f"✅ Ngrok URL: {public_url}")
-except Exception as e:
-    print("❌ Failed to get ngrok URL:", e)
-    ngrok_process.kill()
-    exit(1)
-
-# Step 3: Update GitHub webhook with new ngrok URL
-headers = {
-    "Authorization": f"Bearer {GITHUB_TOKEN}",
-    "Accept": "application/vnd.github+json"
-}
-
-webhook_url = f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}/hooks/{WEBHOOK_ID}"
-payload = {
-    "config": {
+
+def ngrok_command(port=PORT):
+    # 🔍 Determine ngrok command based on OS
+    if platform.system() == "Windows":
+        return [r"C:\Users\Weiam\Downloads\ngrok.exe", "http", str(port)]
+    return ["ngrok", "http", str(port)]
+
+
+def fetch_tunnels(api_url=NGROK_API):
+    from urllib.request import urlopen
+
+    with urlopen(api_url, timeout=2) as response:
+        return json.load(response)["tunnels"]
+
+
+def wait_for_public_url(fetch=fetch_tunnels, timeout=NGROK_TIMEOUT, first_delay=0.05, max_delay=1.0,
+                        sleep=time.sleep, clock=time.monotonic):
+    # Polls the ngrok API with a short, doubling delay until the https tunnel is up,
+    # instead of a fixed wait that is either too long or too short
+    deadline = clock() + timeout
+    delay = first_delay
+    while True:
+        try:
+            for tunnel in fetch():
+                if tunnel["proto"] == "https":
+                    return tunnel["public_url"]
+            error = "no https tunnel yet"
+        except (OSError, ValueError, KeyError) as e:
+            error = e
+        if clock() + delay > deadline:
+            raise TimeoutError(f"ngrok tunnel not available after {timeout:.0f}s: {error}")
+        sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def webhook_config(public_url, secret):
+    # GitHub drops the secret of a hook whose config is updated without it, and the
+    # listener rejects unsigned deliveries, so it is always sent along
+    return {
         "url": f"{public_url}/webhook",
-        "content_type": "json"
+        "content_type": "json",
+        "secret": secret,
+    }
+
+
+def update_webhook(public_url, token, secret):
+    # requests is only needed for the GitHub call
+    import requests
+
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github+json"
     }
-}
+    webhook_url = f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}/hooks/{WEBHOOK_ID}"
+    payload = {"config": webhook_config(public_url, secret)}
+    return requests.patch(webhook_url, headers=headers, json=payload)
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    token = os.getenv("GITHUB_TOKEN")
+    secret = os.getenv("WEBHOOK_SECRET")
+    if not secret:
+        raise SystemExit("WEBHOOK_SECRET must be set (the secret the webhook listener checks)")
+
+    # Step 1: Start ngrok
+    print("🔄 Starting ngrok...")
+    ngrok_process = subprocess.Popen(ngrok_command())
+
+    # Step 2: Get public URL from ngrok
+    try:
+        public_url = wait_for_public_url()
+        print(f"✅ Ngrok URL: {public_url}")
+    except Exception as e:
+        print("❌ Failed to get ngrok URL:", e)
+        ngrok_process.kill()
+        raise SystemExit(1)
+
+    # Step 3: Update GitHub webhook with new ngrok URL
+    print("🔁 Updating GitHub Webhook...")
+    response = update_webhook(public_url, token, secret)
+
+    if response.status_code == 200:
+        print("✅ Webhook updated successfully!")
+    else:
+        print(f"❌ Failed to update webhook: {response.status_code} → {response.text}")
 
-print("🔁 Updating GitHub Webhook...")
-response = requests.patch(webhook_url, headers=headers, json=payload)
 
-if response.status_code == 200:
-    print("✅ Webhook updated successfully!")
-else:
-    print(f"❌ Failed to update webhook: {response.status_code} → {response.text}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import logging
+import os
+import signal
+import sqlite3
+import threading
+import time
+
+from scripts.connection_pool import RECONNECT_ERRORS
+from scripts.fanout import xml_properties
+
+logger = logging.getLogger("Outbox")
+
+# Append-only local log of messages still to be published. Producers append and return
+# at once; one flusher thread replays the log in order, in transaction-confirmed
+# batches, and only removes what the broker has committed.
+#
+# The flusher runs in the process that owns the outbox (OutboxFlusher.start()) or as its
+# own service, `python -m scripts.outbox` (frontend-outbox-flusher), next to producers
+# that only append to the same file.
+OUTBOX_PATH = os.getenv("PRODUCER_OUTBOX_PATH", "outbox.sqlite3")
+OUTBOX_BATCH_SIZE = int(os.getenv("PRODUCER_OUTBOX_BATCH_SIZE", 1000))
+OUTBOX_IDLE_INTERVAL = float(os.getenv("PRODUCER_OUTBOX_IDLE_INTERVAL", 1.0))
+
+
+class Outbox:
+
+    def __init__(self, path=OUTBOX_PATH, synchronous="NORMAL"):
+        # WAL with synchronous=NORMAL survives a crash of the process; FULL also survives
+        # a power loss at the cost of an fsync per append
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=%s" % synchronous)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, exchange TEXT NOT NULL, routing_key TEXT NOT NULL, "
+            "body BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._appended = threading.Event()
+
+    def append(self, exchange, routing_key, body):
+        self.append_many([(exchange, routing_key, body)])
+
+    def append_many(self, messages):
+        # One transaction for all messages, e.g. every route of one user
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO outbox (exchange, routing_key, body, created_at) VALUES (?, ?, ?, ?)",
+                    [(exchange, routing_key, body, now) for exchange, routing_key, body in messages],
+                )
+        self.wake()
+
+    def peek(self, limit):
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, exchange, routing_key, body FROM outbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+    def remove_through(self, last_id):
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM outbox WHERE id <= ?", (last_id,))
+
+    def wake(self):
+        self._appended.set()
+
+    def wait(self, timeout):
+        # Blocks until something is appended or timeout passes
+        appended = self._appended.wait(timeout)
+        self._appended.clear()
+        return appended
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class OutboxFlusher:
+    # Drains the outbox through a ConnectionManager. While the broker is down the manager
+    # keeps retrying with backoff, so the backlog goes out as a few large batches once it
+    # is back. Delivery is at least once: a batch committed by the broker but not yet
+    # removed locally is sent again after a crash (the consumers drop duplicates).
+    # The manager's connection is only used from the flusher thread.
+
+    def __init__(self, outbox, manager, declare=None, batch_size=OUTBOX_BATCH_SIZE,
+                 idle_interval=OUTBOX_IDLE_INTERVAL, properties=None):
+        self.outbox = outbox
+        self.manager = manager
+        # declare(channel) sets up the topology on every new channel
+        self.declare = declare
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.properties = properties
+        self.published = 0
+        self.batches = 0
+        self._channel = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _publish(self, channel, rows):
+        if channel is not self._channel:
+            if self.declare is not None:
+                self.declare(channel)
+            channel.tx_select()
+            self._channel = channel
+        properties = self.properties or xml_properties()
+        for _, exchange, routing_key, body in rows:
+            channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+        channel.tx_commit()
+
+    def drain_once(self):
+        # Publishes and removes up to batch_size messages; returns how many
+        rows = self.outbox.peek(self.batch_size)
+        if not rows:
+            return 0
+        self.manager.run(lambda channel: self._publish(channel, rows))
+        self.outbox.remove_through(rows[-1][0])
+        self.published += len(rows)
+        self.batches += 1
+        return len(rows)
+
+    def drain(self):
+        total = 0
+        while not self._stopping.is_set():
+            count = self.drain_once()
+            if not count:
+                break
+            total += count
+        return total
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.drain():
+                    logger.info("Outbox drained, %d messages published in %d batches", self.published, self.batches)
+            except RECONNECT_ERRORS as error:
+                # Only reached when the manager has a retry limit
+                logger.error("Outbox flush failed, %d messages waiting: %s", len(self.outbox), error)
+            except Exception:
+                # Outbox, declare or publish errors: keep the thread alive and try again
+                # after the idle wait instead of letting the outbox grow unnoticed
+                logger.exception("Outbox flush failed")
+                self._rollback()
+            self.outbox.wait(self.idle_interval)
+
+    def _rollback(self):
+        # Drops what the failed batch published on the channel; it is still in the outbox
+        # and goes out again on the next attempt
+        channel, self._channel = self._channel, None
+        if channel is not None:
+            try:
+                channel.tx_rollback()
+            except Exception:
+                pass
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self.run, name="outbox-flusher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.outbox.wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main():
+    # Standalone flusher for an outbox file filled by other processes. Appends there do
+    # not wake this process, so new messages go out within the idle interval.
+    from scripts.connection_pool import ConnectionManager
+    from scripts.producer import UserPublisher
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    outbox = Outbox(OUTBOX_PATH)
+    manager = ConnectionManager()
+    flusher = OutboxFlusher(outbox, manager, declare=UserPublisher().declare_on)
+    signal.signal(signal.SIGTERM, lambda signum, frame: flusher.stop())
+    logger.info("Flushing %s (%d messages waiting)", OUTBOX_PATH, len(outbox))
+    try:
+        flusher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.close()
+        outbox.close()
+
+
+if __name__ == "__main__":
+    main()
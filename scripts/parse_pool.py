@@ -0,0 +1,57 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from scripts.consumer import dispatch
+
+# Parsing holds the GIL, so bodies are fanned out to worker processes in chunks.
+# 0 workers keeps parsing inline in the consumer process.
+PARSE_WORKERS = int(os.getenv("CONSUMER_PARSE_WORKERS", 0))
+PARSE_CHUNK_SIZE = int(os.getenv("CONSUMER_PARSE_CHUNK_SIZE", 64))
+
+
+def parse_chunk(bodies, parse=dispatch):
+    # Runs in a worker process. A body that fails to parse gives its exception in place,
+    # so one bad message does not fail the whole chunk.
+    results = []
+    for body in bodies:
+        try:
+            results.append(parse(body))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+class ParsePool:
+
+    def __init__(self, workers=None, chunk_size=PARSE_CHUNK_SIZE, parse=dispatch):
+        # workers=None uses one process per core; parse must be a module-level function
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.parse = parse
+        self.executor = ProcessPoolExecutor(self.workers)
+
+    def submit(self, bodies):
+        return self.executor.submit(parse_chunk, bodies, self.parse)
+
+    def map(self, bodies):
+        # Yields parse results (or exceptions) in input order. At most two chunks per
+        # worker are in flight, so large or endless inputs are not read ahead.
+        bodies = iter(bodies)
+        in_flight = deque()
+        for chunk in iter(lambda: list(islice(bodies, self.chunk_size)), []):
+            in_flight.append(self.submit(chunk))
+            if len(in_flight) >= 2 * self.workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,37 +1,56 @@
-from pika import BasicProperties
-from xml.etree.ElementTree import Element, SubElement, tostring
+import weakref
+
+from scripts.fanout import CONFIRM_WINDOW, Fanout, FanoutPublisher
+from scripts.xml_serializer import serialize_user_message
 
 def generate_user_xml(user):
-    root = Element("UserMessage")
-    SubElement(root, "ActionType").text = "CREATE"
-    SubElement(root, "UUID").text = user["uuid"]
-    SubElement(root, "TimeOfAction").text = user["time"]
-    SubElement(root, "EncryptedPassword").text = user["password"]
-    SubElement(root, "FirstName").text = user["first_name"]
-    SubElement(root, "LastName").text = user["last_name"]
-    SubElement(root, "PhoneNumber").text = user["phone"]
-    SubElement(root, "EmailAddress").text = user["email"]
-
-    business = SubElement(root, "Business")
-    SubElement(business, "BusinessName").text = user["business_name"]
-    SubElement(business, "BusinessEmail").text = user["business_email"]
-    SubElement(business, "RealAddress").text = user["real_address"]
-    SubElement(business, "BTWNumber").text = user["btw_number"]
-    SubElement(business, "FacturationAddress").text = user["facturation_address"]
-
-    return tostring(root, encoding='unicode')
-
-def send_user_to_rabbitmq(user, channel, exchange="user"):
-    xml = generate_user_xml(user)
-    props = BasicProperties(content_type="text/xml")
-    
-    routes = {
-        "crm_user_create": "crm.user.create",
-        "facturatie_user_create": "facturatie.user.create",
-        "kassa_user_create": "kassa.user.create"
-    }
-
-    for queue, routing_key in routes.items():
-        channel.queue_declare(queue)
-        channel.queue_bind(queue, exchange, routing_key)
-        channel.basic_publish(exchange=exchange, routing_key=routing_key, body=xml.encode(), properties=props)
+    # user can be a UserRecord or the flat dict used by the WordPress side
+    return serialize_user_message(user).decode()
+
+
+USER_CREATE_ROUTES = {
+    "crm_user_create": "crm.user.create",
+    "facturatie_user_create": "facturatie.user.create",
+    "kassa_user_create": "kassa.user.create"
+}
+
+class UserPublisher(FanoutPublisher):
+    # Publishes users to every route over one channel: each user is serialized once
+    # and fanned out to all routes (see FanoutPublisher for reconnects and the outbox).
+
+    def __init__(self, channel=None, exchange="user", routes=USER_CREATE_ROUTES, confirm_window=CONFIRM_WINDOW,
+                 manager=None, outbox=None):
+        super().__init__(channel, {exchange: routes}, confirm_window, manager, outbox)
+        self.exchange = exchange
+        self.routes = routes
+        self._routing_keys = tuple(routes.values())
+
+    def _fanout(self, user):
+        return Fanout(self.exchange, self._routing_keys, serialize_user_message(user))
+
+    def publish(self, user):
+        self.send((self._fanout(user),), transactional=False)
+
+    def publish_many(self, users):
+        # Returns the number of messages published
+        return self.publish_batch(self._fanout(user) for user in users)
+
+
+# One publisher per channel, so repeated calls reuse the declared topology
+_publishers = weakref.WeakKeyDictionary()
+
+
+def get_publisher(channel, exchange="user"):
+    publisher = _publishers.get(channel)
+    if publisher is None or publisher.exchange != exchange:
+        publisher = UserPublisher(channel, exchange)
+        _publishers[channel] = publisher
+    return publisher
+
+
+def send_user_to_rabbitmq(user, channel, exchange="user", outbox=None):
+    # With an outbox the message is stored locally and published by its flusher
+    if outbox is not None:
+        UserPublisher(exchange=exchange, outbox=outbox).publish(user)
+        return
+    get_publisher(channel, exchange).publish(user)
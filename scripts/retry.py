@@ -0,0 +1,196 @@
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from xml.etree.ElementTree import ParseError
+
+from scripts.message_schema import SchemaError
+from scripts.metrics import MESSAGES_DEAD_LETTERED, MESSAGES_RETRIED
+
+logger = logging.getLogger("RetryScheduler")
+
+# Failed deliveries are not requeued (a poison message would loop through the consumer)
+# but republished to a delay queue per tier. The delay queue has no consumers: when the
+# TTL runs out the broker dead-letters the message back to its original queue through
+# the default exchange. After MAX_ATTEMPTS the message goes to the dead-letter queue
+# with the error attached, where `python -m scripts.retry replay` can pick it up.
+RETRY_DELAYS = tuple(float(delay) for delay in os.getenv("CONSUMER_RETRY_DELAYS", "5,30,180").split(","))
+MAX_ATTEMPTS = int(os.getenv("CONSUMER_MAX_ATTEMPTS", len(RETRY_DELAYS) + 1))
+DEAD_LETTER_QUEUE = os.getenv("CONSUMER_DEAD_LETTER_QUEUE", "frontend_user_dead_letter")
+
+ATTEMPTS_HEADER = "x-attempts"
+ORIGIN_HEADER = "x-original-queue"
+ERROR_HEADERS = ("x-error-type", "x-error", "x-failed-at")
+# Longer error messages are cut off in the headers
+MAX_ERROR_LENGTH = 1000
+
+# Failures that fail the same way on every attempt
+PERMANENT_ERRORS = (ParseError, SchemaError)
+
+
+def tier_name(queue, delay):
+    return "%s.retry.%gs" % (queue, delay)
+
+
+def retry_queue_arguments(queue, delay):
+    return {
+        "x-message-ttl": int(delay * 1000),
+        "x-dead-letter-exchange": "",
+        "x-dead-letter-routing-key": queue,
+    }
+
+
+def attempts(headers):
+    try:
+        return int((headers or {}).get(ATTEMPTS_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class RetryScheduler:
+    # Used by ConsumerService (aio-pika): setup() declares the delay and dead-letter
+    # queues, schedule() republishes a failed delivery. The caller acks the original
+    # once schedule() returns, so a message is never lost between the two.
+
+    def __init__(self, delays=RETRY_DELAYS, max_attempts=MAX_ATTEMPTS, dead_letter_queue=DEAD_LETTER_QUEUE,
+                 clock=time.time):
+        self.delays = tuple(delays)
+        self.max_attempts = max_attempts
+        self.dead_letter_queue = dead_letter_queue
+        self.clock = clock
+        self.retried = 0
+        self.dead_lettered = 0
+        self._exchange = None
+        self._origins = {}
+
+    async def setup(self, channel, queues):
+        # queues: {queue name: routing key}, as in ConsumerService
+        for queue in queues:
+            for delay in self.delays:
+                await channel.declare_queue(tier_name(queue, delay), durable=True,
+                                            arguments=retry_queue_arguments(queue, delay))
+        await channel.declare_queue(self.dead_letter_queue, durable=True)
+        self._exchange = channel.default_exchange
+        self._origins = {routing_key: queue for queue, routing_key in queues.items()}
+        self._origins.update((queue, queue) for queue in queues)
+
+    def origin(self, message):
+        headers = message.headers or {}
+        return headers.get(ORIGIN_HEADER) or self._origins.get(message.routing_key, message.routing_key)
+
+    def delay(self, attempt):
+        # attempt 1 is the first retry
+        return self.delays[min(attempt, len(self.delays)) - 1]
+
+    async def schedule(self, message, error):
+        # Returns the queue the message was republished to
+        import aio_pika
+
+        headers = dict(message.headers or {})
+        attempt = attempts(headers) + 1
+        queue = self.origin(message)
+        headers[ATTEMPTS_HEADER] = attempt
+        headers[ORIGIN_HEADER] = queue
+
+        if attempt >= self.max_attempts or isinstance(error, PERMANENT_ERRORS) or not self.delays:
+            target = self.dead_letter_queue
+            headers["x-error-type"] = type(error).__name__
+            headers["x-error"] = str(error)[:MAX_ERROR_LENGTH]
+            headers["x-failed-at"] = datetime.fromtimestamp(self.clock(), timezone.utc).isoformat()
+            self.dead_lettered += 1
+            MESSAGES_DEAD_LETTERED.inc()
+            logger.error("Message from %s dead-lettered after %d attempt(s): %r", queue, attempt, error)
+        else:
+            delay = self.delay(attempt)
+            target = tier_name(queue, delay)
+            self.retried += 1
+            MESSAGES_RETRIED.inc()
+            logger.warning("Message from %s failed (attempt %d), retrying in %gs: %r", queue, attempt, delay, error)
+
+        await self._exchange.publish(
+            aio_pika.Message(
+                message.body,
+                headers=headers,
+                content_type=getattr(message, "content_type", None),
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=target,
+        )
+        return target
+
+
+def replay(channel, dead_letter_queue=DEAD_LETTER_QUEUE, queue=None, limit=None, dry_run=False):
+    # Moves dead-lettered messages (pika BlockingChannel) back to their original queue
+    # with a fresh attempt counter. Returns the (queue, error) pairs that were replayed,
+    # or would be with dry_run. Messages are held unacked while scanning, so each is seen
+    # once; the ones that are not replayed go back to the dead-letter queue.
+    from pika import BasicProperties
+
+    available = channel.queue_declare(dead_letter_queue, durable=True, passive=True).method.message_count
+    replayed = []
+    held = False
+    if not dry_run:
+        channel.confirm_delivery()
+    for _ in range(available):
+        if limit is not None and len(replayed) >= limit:
+            break
+        method, properties, body = channel.basic_get(dead_letter_queue)
+        if method is None:
+            break
+        headers = dict(properties.headers or {})
+        origin = headers.get(ORIGIN_HEADER)
+        if origin is None or (queue is not None and origin != queue):
+            held = True
+            continue
+        entry = (origin, headers.get("x-error"))
+        if dry_run:
+            held = True
+            replayed.append(entry)
+            continue
+        for name in (ATTEMPTS_HEADER, ORIGIN_HEADER) + ERROR_HEADERS:
+            headers.pop(name, None)
+        channel.basic_publish(
+            exchange="",
+            routing_key=origin,
+            body=body,
+            properties=BasicProperties(content_type=properties.content_type, headers=headers, delivery_mode=2),
+            # A queue that no longer exists raises instead of silently dropping the message
+            mandatory=True,
+        )
+        channel.basic_ack(method.delivery_tag)
+        replayed.append(entry)
+    if held:
+        # Everything still unacked returns to the dead-letter queue
+        channel.basic_nack(0, multiple=True, requeue=True)
+    return replayed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m scripts.retry")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    for name, help in (("list", "show the dead-lettered messages"),
+                       ("replay", "send dead-lettered messages back to their queue")):
+        command = subcommands.add_parser(name, help=help)
+        command.add_argument("--queue", help="only messages from this queue")
+        command.add_argument("--limit", type=int, help="at most this many messages")
+        command.add_argument("--dead-letter-queue", default=DEAD_LETTER_QUEUE)
+    args = parser.parse_args(argv)
+
+    from scripts.connection_pool import ConnectionManager
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    manager = ConnectionManager(max_retries=3)
+    try:
+        messages = replay(manager.channel(), args.dead_letter_queue, args.queue, args.limit,
+                          dry_run=args.command == "list")
+    finally:
+        manager.close()
+    for origin, error in messages:
+        print("%s\t%s" % (origin, error or ""))
+    verb = "Replayed" if args.command == "replay" else "Found"
+    print("%s %d message(s)" % (verb, len(messages)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# Compact user type shared by the producer, the consumer and app.user_utils.
+# Attributes are filled straight from the XML elements; the legacy flat dict keys
+# (including both "phone" and "phone_number") still work through item access.
+
+# XML tag -> UserRecord attribute
+USER_FIELDS = {
+    "UUID": "uuid",
+    "TimeOfAction": "time",
+    "EncryptedPassword": "password",
+    "FirstName": "first_name",
+    "LastName": "last_name",
+    "PhoneNumber": "phone",
+    "EmailAddress": "email",
+}
+
+# XML tag under <Business> -> BusinessInfo attribute
+BUSINESS_FIELDS = {
+    "BusinessName": "name",
+    "BusinessEmail": "email",
+    "RealAddress": "real_address",
+    "BTWNumber": "btw_number",
+    "FacturationAddress": "facturation_address",
+}
+
+# Flat dict key used by the old code -> BusinessInfo attribute
+BUSINESS_KEYS = {
+    "business_name": "name",
+    "business_email": "email",
+    "real_address": "real_address",
+    "btw_number": "btw_number",
+    "facturation_address": "facturation_address",
+}
+
+KEY_ALIASES = {"phone_number": "phone"}
+
+USER_KEYS = tuple(USER_FIELDS.values()) + tuple(BUSINESS_KEYS)
+_RECORD_KEYS = frozenset(USER_FIELDS.values())
+_USER_KEY_SET = frozenset(USER_KEYS)
+
+
+class BusinessInfo:
+    __slots__ = tuple(BUSINESS_FIELDS.values())
+
+    def __init__(self, name=None, email=None, real_address=None, btw_number=None, facturation_address=None):
+        self.name = name
+        self.email = email
+        self.real_address = real_address
+        self.btw_number = btw_number
+        self.facturation_address = facturation_address
+
+    def __eq__(self, other):
+        if not isinstance(other, BusinessInfo):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return "BusinessInfo(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__)
+
+
+class UserRecord:
+    __slots__ = tuple(USER_FIELDS.values()) + ("business",)
+
+    def __init__(self, uuid=None, time=None, password=None, first_name=None, last_name=None,
+                 phone=None, email=None, business=None):
+        self.uuid = uuid
+        self.time = time
+        self.password = password
+        self.first_name = first_name
+        self.last_name = last_name
+        self.phone = phone
+        self.email = email
+        self.business = business
+
+    @classmethod
+    def from_element(cls, xml):
+        # One walk over a <UserMessage> element: returns (action_type, record).
+        # Missing fields stay None, present but empty fields become "" (same as findtext).
+        # A DELETE only keeps uuid and time.
+        action = None
+        record = cls()
+
+        for child in xml:
+            tag = child.tag
+            name = USER_FIELDS.get(tag)
+            if name is not None:
+                setattr(record, name, child.text or "")
+            elif tag == "ActionType":
+                action = child.text
+            elif tag == "Business":
+                business = BusinessInfo()
+                for field in child:
+                    name = BUSINESS_FIELDS.get(field.tag)
+                    if name is not None:
+                        setattr(business, name, field.text or "")
+                record.business = business
+
+        if action == "DELETE":
+            record = cls(uuid=record.uuid, time=record.time)
+        return action, record
+
+    @classmethod
+    def from_dict(cls, user):
+        # Accepts the flat dicts used so far, with either "phone" or "phone_number"
+        business = None
+        if any(user.get(key) is not None for key in BUSINESS_KEYS):
+            business = BusinessInfo(**{name: user.get(key) for key, name in BUSINESS_KEYS.items()})
+        return cls(
+            uuid=user.get("uuid"),
+            time=user.get("time"),
+            password=user.get("password"),
+            first_name=user.get("first_name"),
+            last_name=user.get("last_name"),
+            phone=user.get("phone", user.get("phone_number")),
+            email=user.get("email"),
+            business=business,
+        )
+
+    def to_dict(self):
+        return {key: self[key] for key in USER_KEYS}
+
+    # Read-only mapping over the flat keys, so code written for the old dicts keeps
+    # working ("email" in user, dict(user), iteration). Aliases are readable but not listed.
+    def keys(self):
+        return USER_KEYS
+
+    def values(self):
+        return [self[key] for key in USER_KEYS]
+
+    def items(self):
+        return [(key, self[key]) for key in USER_KEYS]
+
+    def __iter__(self):
+        return iter(USER_KEYS)
+
+    def __len__(self):
+        return len(USER_KEYS)
+
+    def __contains__(self, key):
+        return key in _USER_KEY_SET
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        key = KEY_ALIASES.get(key, key)
+        name = BUSINESS_KEYS.get(key)
+        if name is not None:
+            return getattr(self.business, name) if self.business is not None else None
+        if key in _RECORD_KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __eq__(self, other):
+        if not isinstance(other, UserRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return "UserRecord(%s)" % ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__)
+
+
+def as_user_record(user):
+    if isinstance(user, UserRecord):
+        return user
+    return UserRecord.from_dict(user)
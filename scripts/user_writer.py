@@ -0,0 +1,481 @@
+import hashlib
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger("UserWriter")
+
+# Writes parsed user changes straight into the WordPress tables, a batch per transaction:
+# multi-row upserts into wp_users, delete + multi-row insert for wp_usermeta and
+# DELETE ... IN for removed users, instead of several round trips per user.
+DB_HOST = os.getenv("WORDPRESS_DB_HOST", "db")
+DB_USER = os.getenv("WORDPRESS_DB_USER", "")
+DB_PASSWORD = os.getenv("WORDPRESS_DB_PASSWORD", "")
+DB_NAME = os.getenv("WORDPRESS_DB_NAME", "")
+TABLE_PREFIX = os.getenv("WORDPRESS_TABLE_PREFIX", "wp_")
+POOL_SIZE = int(os.getenv("USER_WRITER_POOL_SIZE", 4))
+WRITE_BATCH_SIZE = int(os.getenv("USER_WRITER_BATCH_SIZE", 500))
+WRITE_BATCH_DELAY = float(os.getenv("USER_WRITER_BATCH_DELAY", 1.0))
+
+# Keeps IN lists and multi-row VALUES under the server's placeholder limits
+MAX_ROWS_PER_STATEMENT = 500
+
+# wp_users columns written for a user, besides ID
+USER_COLUMNS = ("user_login", "user_pass", "user_nicename", "user_email", "user_registered", "display_name")
+
+# Column sizes of wp_users; wp_insert_user refuses longer values and MySQL in strict mode
+# fails the statement
+MAX_LOGIN_LENGTH = 60
+MAX_NICENAME_LENGTH = 50
+MAX_EMAIL_LENGTH = 100
+MAX_DISPLAY_NAME_LENGTH = 250
+
+# Portable phpass hashes ($P$), which every WordPress version accepts in wp_check_password
+ITOA64 = "./0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+HASH_ROUNDS_LOG2 = 8
+
+# Flat UserRecord key -> wp_usermeta key, the same keys the PHP consumers write
+META_FIELDS = (
+    ("first_name", "first_name"),
+    ("last_name", "last_name"),
+    ("phone", "phone_number"),
+    ("business_name", "business_name"),
+    ("business_email", "business_email"),
+    ("real_address", "real_address"),
+    ("btw_number", "btw_number"),
+    ("facturation_address", "facturation_address"),
+)
+
+# Meta that wp_insert_user adds for a new subscriber
+NEW_USER_META = (
+    ("synced_to_wordpress", "1"),
+    ("{prefix}capabilities", 'a:1:{s:10:"subscriber";b:1;}'),
+    ("{prefix}user_level", "0"),
+)
+
+
+def encode64(data, count):
+    output = []
+    i = 0
+    while i < count:
+        value = data[i]
+        i += 1
+        output.append(ITOA64[value & 0x3f])
+        if i < count:
+            value |= data[i] << 8
+        output.append(ITOA64[(value >> 6) & 0x3f])
+        if i >= count:
+            break
+        i += 1
+        if i < count:
+            value |= data[i] << 16
+        output.append(ITOA64[(value >> 12) & 0x3f])
+        if i >= count:
+            break
+        i += 1
+        output.append(ITOA64[(value >> 18) & 0x3f])
+    return "".join(output)
+
+
+def phpass_hash(password, setting):
+    # setting: "$P$", the rounds character and an 8 character salt (or a stored hash)
+    rounds = 1 << ITOA64.index(setting[3])
+    salt = setting[4:12].encode()
+    password = password.encode()
+    digest = hashlib.md5(salt + password).digest()
+    for _ in range(rounds):
+        digest = hashlib.md5(digest + password).digest()
+    return setting[:12] + encode64(digest, 16)
+
+
+def hash_password(password):
+    # wp_insert_user and wp_update_user hash the EncryptedPassword field again before
+    # storing it, so the writer does the same
+    setting = "$P$" + ITOA64[HASH_ROUNDS_LOG2 + 5] + encode64(secrets.token_bytes(6), 6)
+    return phpass_hash(password, setting)
+
+
+def nicename(login):
+    # wp_insert_user: the first 50 characters of the login through sanitize_user(strict)
+    # and sanitize_title. Accents are stripped like remove_accents() does.
+    name = unicodedata.normalize("NFKD", login[:MAX_NICENAME_LENGTH]).encode("ascii", "ignore").decode()
+    name = re.sub(r"%[a-fA-F0-9]{2}|&.+?;", "", name)
+    name = re.sub(r"[^a-z0-9 _.\-@]", "", name, flags=re.I).lower().replace(".", "-")
+    name = re.sub(r"[^a-z0-9 _-]", "", name)
+    name = re.sub(r"\s+", "-", name.strip())
+    return re.sub(r"-+", "-", name).strip("-")
+
+
+def check_change(action, user):
+    # Returns why wp_insert_user / wp_update_user would refuse the change, or None
+    if action == "CREATE" and user.email is None:
+        return "missing EmailAddress"
+    if action in ("CREATE", "UPDATE") and user.email is not None:
+        if not user.email:
+            return "empty EmailAddress"
+        if len(user.email) > MAX_EMAIL_LENGTH:
+            return "EmailAddress longer than %d characters" % MAX_EMAIL_LENGTH
+        # The e-mail address is also the login of a new user
+        if action == "CREATE" and len(user.email) > MAX_LOGIN_LENGTH:
+            return "EmailAddress longer than %d characters (user_login)" % MAX_LOGIN_LENGTH
+    return None
+
+
+class Dialect:
+
+    def __init__(self, placeholder, upsert, nocase="{0}"):
+        self.placeholder = placeholder
+        # Template for the conflict clause; {updates} lists "column = <new value>" pairs
+        self.upsert = upsert
+        self.new_value = "VALUES({0})" if "DUPLICATE" in upsert else "excluded.{0}"
+        # Case-insensitive comparison of a column (MySQL: the utf8mb4 *_ci collation already is)
+        self.nocase = nocase
+
+    def params(self, count):
+        return ", ".join([self.placeholder] * count)
+
+
+DIALECTS = {
+    "mysql": Dialect("%s", " ON DUPLICATE KEY UPDATE {updates}"),
+    "sqlite": Dialect("?", " ON CONFLICT(ID) DO UPDATE SET {updates}", nocase="{0} COLLATE NOCASE"),
+}
+
+
+def chunks(items, size=MAX_ROWS_PER_STATEMENT):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def connect_mysql():
+    # PyMySQL is only needed when the writer talks to the WordPress database
+    import pymysql
+
+    return pymysql.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME,
+                           charset="utf8mb4", autocommit=False)
+
+
+class DatabasePool:
+    # Fixed-size pool of DB-API connections, opened lazily
+
+    def __init__(self, connect=connect_mysql, size=POOL_SIZE):
+        self.connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = queue.Queue()
+        for _ in range(size):
+            self._slots.put(None)
+
+    @contextmanager
+    def connection(self):
+        self._slots.get()
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection = None
+        try:
+            if connection is None:
+                connection = self.connect()
+            yield connection
+        except Exception:
+            # The connection may be broken; the next user opens a fresh one
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            raise
+        else:
+            self._idle.put(connection)
+        finally:
+            self._slots.put(None)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def split_runs(changes):
+    # Splits the batch where a uuid comes back, so each run has at most one change per user
+    # and its creates, updates and deletes can be applied as three independent groups
+    runs = []
+    current = []
+    seen = set()
+    for action, user in changes:
+        if user.uuid in seen:
+            runs.append(current)
+            current = []
+            seen = set()
+        current.append((action, user))
+        seen.add(user.uuid)
+    if current:
+        runs.append(current)
+    return runs
+
+
+class BulkUserWriter:
+
+    def __init__(self, pool, dialect="mysql", prefix=TABLE_PREFIX, clock=time.time):
+        self.pool = pool
+        self.dialect = DIALECTS[dialect]
+        self.prefix = prefix
+        self.clock = clock
+        self.users_table = prefix + "users"
+        self.meta_table = prefix + "usermeta"
+
+    def write(self, changes):
+        # changes: list of (action, UserRecord). Returns one error per change: None when it
+        # was applied or there was nothing to do (like the PHP consumers), otherwise a
+        # message or the database exception. The changes go in one transaction; when that
+        # fails they are applied one per transaction, so only the offending change fails.
+        errors = [check_change(action, user) for action, user in changes]
+        valid = [index for index, error in enumerate(errors) if error is None]
+        try:
+            self._commit([changes[index] for index in valid])
+        except Exception as error:
+            if len(valid) == 1:
+                errors[valid[0]] = error
+                return errors
+            logger.warning("Writing a batch of %d changes failed (%s), writing them one by one", len(valid), error)
+            for index in valid:
+                try:
+                    self._commit([changes[index]])
+                except Exception as failure:
+                    action, user = changes[index]
+                    logger.error("%s %s failed: %s", action, user.uuid, failure)
+                    errors[index] = failure
+        return errors
+
+    def _commit(self, changes):
+        if not changes:
+            return
+        # A failed transaction also drops its connection, the next one starts on a fresh one
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                for run in split_runs(changes):
+                    self._apply(cursor, run)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    __call__ = write
+
+    def _apply(self, cursor, run):
+        ids = self._user_ids(cursor, [user.uuid for _, user in run])
+        creates = [user for action, user in run if action == "CREATE" and user.uuid not in ids]
+        updates = [(ids[user.uuid], user) for action, user in run if action == "UPDATE" and user.uuid in ids]
+        deletes = [ids[user.uuid] for action, user in run if action == "DELETE" and user.uuid in ids]
+
+        if creates:
+            self._create(cursor, creates)
+        if updates:
+            self._update(cursor, updates)
+        if deletes:
+            self._delete(cursor, deletes)
+
+    def _select_in(self, cursor, sql, values, *extra):
+        rows = []
+        for chunk in chunks(values):
+            cursor.execute(sql.format(params=self.dialect.params(len(chunk))), extra + tuple(chunk))
+            rows.extend(cursor.fetchall())
+        return rows
+
+    def _user_ids(self, cursor, uuids):
+        rows = self._select_in(
+            cursor, "SELECT meta_value, user_id FROM %s WHERE meta_key = %s AND meta_value IN ({params})"
+            % (self.meta_table, self.dialect.placeholder), uuids, "UUID",
+        )
+        return dict(rows)
+
+    def _create(self, cursor, users):
+        # Same rule as user-create-consumer.php: an existing e-mail address is skipped.
+        # get_user_by('email') ignores case, so the check does too.
+        emails = [user.email for user in users]
+        existing = {email.lower() for email, in self._select_in(
+            cursor, "SELECT user_email FROM %s WHERE %s IN ({params})"
+            % (self.users_table, self.dialect.nocase.format("user_email")), emails
+        )}
+        new_users = []
+        for user in users:
+            if user.email.lower() in existing:
+                logger.info("User %s already exists, skipping create", user.email)
+                continue
+            existing.add(user.email.lower())
+            new_users.append(user)
+        if not new_users:
+            return
+
+        registered = datetime.fromtimestamp(self.clock(), timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        rows = [(user.email, hash_password(user.password or ""), nicename(user.email), user.email, registered,
+                 (" ".join(filter(None, (user.first_name, user.last_name))) or user.email)[:MAX_DISPLAY_NAME_LENGTH])
+                for user in new_users]
+        for chunk in chunks(rows):
+            cursor.execute(
+                "INSERT INTO %s (%s) VALUES %s" % (
+                    self.users_table, ", ".join(USER_COLUMNS),
+                    ", ".join(["(%s)" % self.dialect.params(len(USER_COLUMNS))] * len(chunk)),
+                ),
+                [value for row in chunk for value in row],
+            )
+
+        # Multi-row inserts do not return every new ID; the e-mail addresses are unique here
+        ids = dict(self._select_in(
+            cursor, "SELECT user_email, ID FROM %s WHERE user_email IN ({params})" % self.users_table,
+            [user.email for user in new_users],
+        ))
+        meta = []
+        for user in new_users:
+            user_id = ids[user.email]
+            meta.append((user_id, "UUID", user.uuid))
+            meta.append((user_id, "nickname", user.email))
+            meta.extend((user_id, key.format(prefix=self.prefix), value) for key, value in NEW_USER_META)
+            meta.extend((user_id, meta_key, user.get(field) or "") for field, meta_key in META_FIELDS)
+        self._insert_meta(cursor, meta)
+
+    def _update(self, cursor, updates):
+        # Only fields present in the message change (same as user-update-consumer.php):
+        # current rows are read once, merged, and written back with one upsert
+        ids = [user_id for user_id, _ in updates]
+        current = {row[0]: list(row[1:]) for row in self._select_in(
+            cursor, "SELECT ID, %s FROM %s WHERE ID IN ({params})" % (", ".join(USER_COLUMNS), self.users_table), ids
+        )}
+        rows = []
+        meta = []
+        for user_id, user in updates:
+            row = current[user_id]
+            if user.email is not None:
+                row[USER_COLUMNS.index("user_email")] = user.email
+            # wp_update_user keeps the current password when the new one is empty
+            if user.password:
+                row[USER_COLUMNS.index("user_pass")] = hash_password(user.password)
+            rows.append([user_id] + row)
+            meta.extend((user_id, meta_key, user.get(field)) for field, meta_key in META_FIELDS
+                        if user.get(field) is not None)
+
+        columns = ("ID",) + USER_COLUMNS
+        updates_sql = ", ".join("%s = %s" % (column, self.dialect.new_value.format(column)) for column in USER_COLUMNS)
+        for chunk in chunks(rows):
+            cursor.execute(
+                "INSERT INTO %s (%s) VALUES %s%s" % (
+                    self.users_table, ", ".join(columns),
+                    ", ".join(["(%s)" % self.dialect.params(len(columns))] * len(chunk)),
+                    self.dialect.upsert.format(updates=updates_sql),
+                ),
+                [value for row in chunk for value in row],
+            )
+
+        # wp_usermeta has no unique (user_id, meta_key) key: replace the rows per key
+        by_key = {}
+        for user_id, meta_key, _ in meta:
+            by_key.setdefault(meta_key, []).append(user_id)
+        for meta_key, user_ids in by_key.items():
+            for chunk in chunks(user_ids):
+                cursor.execute(
+                    "DELETE FROM %s WHERE meta_key = %s AND user_id IN (%s)"
+                    % (self.meta_table, self.dialect.placeholder, self.dialect.params(len(chunk))),
+                    (meta_key,) + tuple(chunk),
+                )
+        self._insert_meta(cursor, meta)
+
+    def _delete(self, cursor, ids):
+        for chunk in chunks(ids):
+            params = self.dialect.params(len(chunk))
+            cursor.execute("DELETE FROM %s WHERE user_id IN (%s)" % (self.meta_table, params), tuple(chunk))
+            cursor.execute("DELETE FROM %s WHERE ID IN (%s)" % (self.users_table, params), tuple(chunk))
+
+    def _insert_meta(self, cursor, rows):
+        for chunk in chunks(rows):
+            cursor.execute(
+                "INSERT INTO %s (user_id, meta_key, meta_value) VALUES %s"
+                % (self.meta_table, ", ".join(["(%s)" % self.dialect.params(3)] * len(chunk))),
+                [value for row in chunk for value in row],
+            )
+
+
+class WriteBuffer:
+    # Synchronous batching for scripts that feed the writer directly (e.g. a bulk sync):
+    # flushes when batch_size changes are buffered or the oldest is max_delay seconds old.
+    # A timer armed by the first buffered change enforces the time window on a quiet
+    # stream; with timer=False the caller calls poll() on its own interval instead.
+    # The asyncio sidecar uses scripts.wordpress_sidecar.BatchingSink instead.
+
+    def __init__(self, writer, batch_size=WRITE_BATCH_SIZE, max_delay=WRITE_BATCH_DELAY, clock=time.monotonic,
+                 timer=True):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.clock = clock
+        self.timer = timer
+        self.written = 0
+        self._pending = []
+        self._first_at = None
+        self._timer = None
+        # The timer thread flushes too
+        self._lock = threading.RLock()
+
+    def add(self, action, user):
+        with self._lock:
+            if not self._pending:
+                self._first_at = self.clock()
+                self._arm(self.max_delay)
+            self._pending.append((action, user))
+            if len(self._pending) >= self.batch_size or self.clock() - self._first_at >= self.max_delay:
+                self.flush()
+
+    def poll(self):
+        # Flushes once the oldest buffered change is max_delay seconds old
+        with self._lock:
+            if not self._pending:
+                return []
+            remaining = self._first_at + self.max_delay - self.clock()
+            if remaining > 0:
+                self._arm(remaining)
+                return []
+            return self.flush()
+
+    def _arm(self, delay):
+        if not self.timer:
+            return
+        self._cancel()
+        self._timer = threading.Timer(delay, self._expired)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _expired(self):
+        try:
+            self.poll()
+        except Exception:
+            logger.exception("Flushing buffered user changes failed")
+
+    def flush(self):
+        with self._lock:
+            self._cancel()
+            if not self._pending:
+                return []
+            batch, self._pending = self._pending, []
+            errors = self.writer(batch)
+            self.written += len(batch)
+            return errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
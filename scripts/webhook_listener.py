@@ -1,51 +1,255 @@
-from flask import Flask, request
+import hashlib
+import hmac
+import json
+import os
+import re
 import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-app = Flask(__name__)
+from scripts.metrics import CONTENT_TYPE, DEPLOY_SECONDS, DEPLOYS_FAILED, REGISTRY
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    if not request.is_json:
-        return "Invalid payload", 400
+REPO_DIR = "/home/ehbstudent/frontend"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 30012))
+# Secret configured on the GitHub webhook; deliveries are signed with it
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Push payloads are a few hundred KB at most
+MAX_BODY_SIZE = int(os.getenv("WEBHOOK_MAX_BODY_SIZE", 1024 * 1024))
+MAIN_REF = "refs/heads/main"
 
-    payload = request.get_json()  # Get the JSON payload from GitHub
+# "ref" is the first key of a push payload ("base_ref" does not match)
+REF_PATTERN = re.compile(rb'"ref"\s*:\s*"((?:[^"\\]|\\.)*)"')
 
-    # Check if the pushed branch is 'main'
-    if payload.get('ref') == 'refs/heads/main':
-        print("✅ Push to main branch detected")
 
-        try:
-            # Pull the latest code and capture output
-            result = subprocess.run(
-                ["git", "pull"],
-                cwd="/home/ehbstudent/frontend",
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            print("🌀 Git pull successful")
-            print(result.stdout)  # Show git pull output
-
-            # Restart the Docker container
-            subprocess.run(
-                ["docker-compose", "restart", "frontend_wordpress"],
-                cwd="/home/ehbstudent/frontend",
-                check=True
-            )
-            print("🚀 Docker container restarted")
-
-            return "Deployment successful", 200
+def verify_signature(secret, body, signature):
+    # X-Hub-Signature-256: "sha256=" + HMAC-SHA256 of the raw body
+    if not secret or not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+
+def push_ref(body):
+    match = REF_PATTERN.search(body)
+    return match.group(1).decode("utf-8", "replace") if match else None
+
+
+def run_deploy():
+    # Pull the latest code and capture output
+    result = subprocess.run(
+        ["git", "pull"],
+        cwd=REPO_DIR,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    print("🌀 Git pull successful")
+    print(result.stdout)  # Show git pull output
+
+    # Restart the Docker container
+    subprocess.run(
+        ["docker-compose", "restart", "frontend_wordpress"],
+        cwd=REPO_DIR,
+        check=True
+    )
+    print("🚀 Docker container restarted")
+
+
+class DeployQueue:
+    # One background worker runs the deploys. Pushes that arrive while a deploy is
+    # running are coalesced into a single follow-up deploy, which pulls all of them.
 
+    def __init__(self, deploy=run_deploy, clock=time.time):
+        self.deploy = deploy
+        self.clock = clock
+        self.pending = None
+        self.current = None
+        self.last = None
+        self.coalesced = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def request(self, ref, commit=None):
+        # Returns True when a new deploy was queued, False when merged into a pending one
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name="deploy", daemon=True)
+                self._thread.start()
+            if self.pending is not None:
+                self.pending["pushes"] += 1
+                self.pending["commit"] = commit
+                self.coalesced += 1
+                return False
+            self.pending = {"ref": ref, "commit": commit, "pushes": 1, "queued_at": self.clock()}
+            self._condition.notify()
+            return True
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while self.pending is None:
+                    self._condition.wait()
+                deploy, self.pending = self.pending, None
+                deploy["started_at"] = self.clock()
+                self.current = deploy
+            self._run(deploy)
+            with self._condition:
+                self.current = None
+                self.last = deploy
+                self._condition.notify_all()
+
+    def _run(self, deploy):
+        try:
+            with DEPLOY_SECONDS.time():
+                self.deploy()
         except subprocess.CalledProcessError as e:
+            DEPLOYS_FAILED.inc()
             print("❌ Deployment failed:", e)
             print("❌ Error Output:", e.stderr)
-            return "Deployment failed", 500
-    else:
-        print(f"❌ Push to {payload.get('ref')} ignored. Not the main branch.")
-        return "Ignored, not a push to main branch", 200
+            deploy["status"] = "failed"
+            deploy["error"] = (e.stderr or str(e)).strip()
+        except Exception as e:
+            DEPLOYS_FAILED.inc()
+            print("❌ Deployment failed:", e)
+            deploy["status"] = "failed"
+            deploy["error"] = str(e)
+        else:
+            deploy["status"] = "succeeded"
+        deploy["finished_at"] = self.clock()
+
+    def status(self):
+        with self._condition:
+            return {
+                "current": dict(self.current) if self.current else None,
+                "pending": dict(self.pending) if self.pending else None,
+                "last": dict(self.last) if self.last else None,
+                "coalesced": self.coalesced,
+            }
+
+    def public_status(self):
+        # /status needs no signature: the git/compose output of a failed deploy can
+        # contain paths and remote URLs, so it only goes to the log
+        status = self.status()
+        for key in ("current", "pending", "last"):
+            if status[key] is not None:
+                status[key].pop("error", None)
+        return status
+
+    def wait_idle(self, timeout=None):
+        # Used by tests and shutdown: blocks until nothing is running or queued
+        with self._condition:
+            return self._condition.wait_for(lambda: self.pending is None and self.current is None, timeout)
+
+
+def make_handler(queue, secret, max_body=MAX_BODY_SIZE):
+    class WebhookHandler(BaseHTTPRequestHandler):
+
+        def _reply(self, status, body, content_type="text/plain; charset=utf-8"):
+            body = body.encode() if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path.split("?")[0] != "/webhook":
+                self.send_error(404)
+                return
+            # Everything below is decided before the body is parsed as JSON: size and event
+            # from the headers, then the signature over the raw bytes, then the ref
+            try:
+                length = int(self.headers.get("Content-Length", ""))
+            except ValueError:
+                self.close_connection = True
+                self._reply(411, "Content-Length required")
+                return
+            if length > max_body:
+                self.close_connection = True
+                self._reply(413, "Payload too large")
+                return
+            event = self.headers.get("X-GitHub-Event", "")
+            if event not in ("push", "ping"):
+                # The body is never read, so the connection cannot be reused
+                self.close_connection = True
+                self._reply(200, f"Ignored, {event or 'unknown'} event")
+                return
+            if not self.headers.get("Content-Type", "").startswith("application/json"):
+                self.close_connection = True
+                self._reply(400, "Invalid payload")
+                return
+
+            body = self.rfile.read(length)
+            if not verify_signature(secret, body, self.headers.get("X-Hub-Signature-256")):
+                print("❌ Webhook with an invalid signature rejected")
+                self._reply(401, "Invalid signature")
+                return
+            if event == "ping":
+                self._reply(200, "pong")
+                return
+
+            ref = push_ref(body)
+            # Check if the pushed branch is 'main'
+            if ref != MAIN_REF:
+                print(f"❌ Push to {ref} ignored. Not the main branch.")
+                self._reply(200, "Ignored, not a push to main branch")
+                return
+            try:
+                # Only pushes to main are decoded in full, to confirm the cheap extraction
+                payload = json.loads(body)
+            except ValueError:
+                self._reply(400, "Invalid payload")
+                return
+            if payload.get("ref") != MAIN_REF:
+                self._reply(200, "Ignored, not a push to main branch")
+                return
+
+            print("✅ Push to main branch detected")
+            # GitHub gives up on slow hooks: the deploy runs in the background
+            if queue.request(ref, payload.get("after")):
+                self._reply(202, "Deployment queued")
+            else:
+                self._reply(202, "Deployment already queued, push merged into it")
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/status":
+                self._reply(200, json.dumps(queue.public_status()), "application/json")
+            elif path == "/metrics":
+                self._reply(200, REGISTRY.render(), CONTENT_TYPE)
+            else:
+                self.send_error(404)
+
+    return WebhookHandler
+
+
+def create_server(queue=None, secret=None, host="0.0.0.0", port=WEBHOOK_PORT, max_body=MAX_BODY_SIZE):
+    queue = queue or deploy_queue
+    secret = WEBHOOK_SECRET if secret is None else secret
+    server = ThreadingHTTPServer((host, port), make_handler(queue, secret, max_body))
+    server.daemon_threads = True
+    return server
+
+
+deploy_queue = DeployQueue()
+
+
+def main():
+    if not WEBHOOK_SECRET:
+        raise SystemExit("WEBHOOK_SECRET must be set (the secret configured on the GitHub webhook)")
+    server = create_server()
+    print(f"👂 Listening for GitHub webhooks on port {server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=30012)
+    main()
 # This script listens for GitHub webhook events and triggers a deployment process.
 # It checks if the pushed branch is 'main', pulls the latest code, and restarts the Docker container.
\ No newline at end of file
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import os
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from scripts.consumer_service import PREFETCH, ConsumerService, run_until_signalled
+from scripts.idempotency import SEEN_CACHE_PATH, SeenCache
+from scripts.metrics import REGISTRY, start_http_server
+from scripts.parse_pool import PARSE_WORKERS, ParsePool
+from scripts.retry import RetryScheduler
+from scripts.user_writer import BulkUserWriter, DatabasePool
+
+logger = logging.getLogger("WordPressSidecar")
+
+# Long-running replacement for the per-minute WP-Cron consumers: one broker connection,
+# user changes written to WordPress in batches, through the user-sync-api plugin
+# ("rest") or straight into the WordPress tables ("database").
+SYNC_MODE = os.getenv("USER_SYNC_MODE", "rest")
+SYNC_URL = os.getenv("USER_SYNC_URL", "http://wordpress/wp-json/frontend-sync/v1/users")
+SYNC_SECRET = os.getenv("USER_SYNC_SECRET", "")
+SYNC_TIMEOUT = float(os.getenv("USER_SYNC_TIMEOUT", 30))
+BATCH_SIZE = int(os.getenv("USER_SYNC_BATCH_SIZE", 100))
+BATCH_DELAY = float(os.getenv("USER_SYNC_BATCH_DELAY", 0.05))
+
+
+class SyncError(Exception):
+    pass
+
+
+def change_payload(action, user):
+    if action == "DELETE":
+        return {"action": action, "user": {"uuid": user.uuid, "time": user.time}}
+    return {"action": action, "user": user.to_dict()}
+
+
+class WordPressClient:
+
+    def __init__(self, url=SYNC_URL, secret=SYNC_SECRET, timeout=SYNC_TIMEOUT):
+        self.url = url
+        self.secret = secret
+        self.timeout = timeout
+
+    def apply(self, changes):
+        # changes: list of (action, UserRecord). Returns one error (None = applied) per change.
+        body = json.dumps({"changes": [change_payload(action, user) for action, user in changes]}).encode()
+        request = Request(self.url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            "X-Sync-Secret": self.secret,
+        })
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                results = json.load(response)["results"]
+        except HTTPError as error:
+            raise SyncError(f"WordPress answered {error.code} for a batch of {len(changes)}") from error
+        if len(results) != len(changes):
+            raise SyncError(f"WordPress returned {len(results)} results for {len(changes)} changes")
+        return [None if result.get("ok") else result.get("error", "failed") for result in results]
+
+
+class BatchingSink:
+    # Consumer handler that collects changes from the worker tasks and writes them in
+    # batches of up to max_batch, or after max_delay seconds. submit() returns once its
+    # batch is written, so a message is only acked after WordPress has applied it.
+    # Batches are written one at a time, in order.
+
+    def __init__(self, write, max_batch=BATCH_SIZE, max_delay=BATCH_DELAY):
+        # write(changes) is blocking (HTTP, database) and runs in a thread
+        self.write = write
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self._pending = []
+        self._timer = None
+        self._lock = None
+        # Keeps the running write tasks referenced until they finish
+        self._writes = set()
+
+    async def submit(self, action, user):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((action, user, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        await future
+
+    __call__ = submit
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._write(batch))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            changes = [(action, user) for action, user, _ in batch]
+            try:
+                errors = await asyncio.get_running_loop().run_in_executor(None, self.write, changes)
+            except Exception as error:
+                logger.error("Writing a batch of %d changes failed: %s", len(batch), error)
+                errors = [error] * len(batch)
+            self.batches += 1
+        for (action, user, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error if isinstance(error, Exception) else SyncError(f"{action} {user.uuid}: {error}"))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if SYNC_MODE == "database":
+        pool = DatabasePool()
+        write = BulkUserWriter(pool)
+        target = "the WordPress database"
+    else:
+        if not SYNC_SECRET:
+            raise SystemExit("USER_SYNC_SECRET must be set (same value as the WordPress container)")
+        pool = None
+        write = WordPressClient().apply
+        target = SYNC_URL
+    if REGISTRY.enabled:
+        start_http_server()
+
+    sink = BatchingSink(write)
+    parse_pool = ParsePool(PARSE_WORKERS) if PARSE_WORKERS > 0 else None
+    guard = SeenCache(path=SEEN_CACHE_PATH)
+    # Every worker waits for its batch to be written, so a full batch needs at least
+    # batch-size workers and deliveries in flight
+    window = max(BATCH_SIZE, PREFETCH)
+    service = ConsumerService(handler=sink, prefetch=window, workers=window, parse_pool=parse_pool, guard=guard,
+                              retry=RetryScheduler())
+
+    logger.info("Syncing users to %s in batches of %d", target, BATCH_SIZE)
+    try:
+        asyncio.run(run_until_signalled(service))
+    finally:
+        guard.close()
+        if parse_pool is not None:
+            parse_pool.close()
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
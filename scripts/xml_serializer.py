@@ -0,0 +1,73 @@
+from operator import attrgetter
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+from scripts.message_schema import USER, USER_MESSAGE, USER_SHAPE_FIELDS, escape, format_value
+from scripts.metrics import SERIALIZE_SECONDS, timed
+from scripts.user_record import BUSINESS_FIELDS, USER_FIELDS, BusinessInfo, as_user_record
+
+# Serializers for the user XML shapes. Each message is rendered by a single f-string
+# compiled at import time from its spec in scripts/message_schema.py, instead of
+# building an ElementTree per message.
+
+USER_MESSAGE_TEMPLATE = USER_MESSAGE.template
+
+USER_TEMPLATE = USER.template
+
+_user_values = attrgetter(*USER_FIELDS.values())
+_business_values = attrgetter(*BUSINESS_FIELDS.values())
+_NO_BUSINESS = BusinessInfo()
+_EMPTY = ("",) * len(USER_SHAPE_FIELDS)
+
+
+@timed(SERIALIZE_SECONDS)
+def serialize_user_message(user, action="CREATE"):
+    # <UserMessage> as bytes, ready for basic_publish. user is a UserRecord or flat dict.
+    user = as_user_record(user)
+    values = (action,) + _user_values(user) + _business_values(user.business or _NO_BUSINESS)
+    return format_value(USER_MESSAGE_TEMPLATE, values).encode()
+
+
+def serialize_user_messages(users, action="CREATE"):
+    return [serialize_user_message(user, action) for user in users]
+
+
+def write_user_messages(users, out, action="CREATE"):
+    # Appends the messages to a caller-owned buffer (bytearray or binary file object),
+    # e.g. to build a dump that scripts.consumer.iter_user_messages can read back.
+    write = out.extend if isinstance(out, bytearray) else out.write
+    count = 0
+    for user in users:
+        write(serialize_user_message(user, action))
+        count += 1
+    return count
+
+
+@timed(SERIALIZE_SECONDS)
+def serialize_user(user):
+    # Lowercase <User> shape used by the WordPress side; missing keys become empty elements
+    values = tuple(map(user.get, USER_SHAPE_FIELDS, _EMPTY))
+    return format_value(USER_TEMPLATE, values).encode()
+
+
+def serialize_users(users):
+    return [serialize_user(user) for user in users]
+
+
+def user_message_element(user, action="CREATE"):
+    # ElementTree version of serialize_user_message, for callers that need a tree
+    user = as_user_record(user)
+    business_info = user.business or _NO_BUSINESS
+
+    root = Element("UserMessage")
+    SubElement(root, "ActionType").text = action
+    for tag, name in USER_FIELDS.items():
+        SubElement(root, tag).text = getattr(user, name)
+
+    business = SubElement(root, "Business")
+    for tag, name in BUSINESS_FIELDS.items():
+        SubElement(business, tag).text = getattr(business_info, name)
+    return root
+
+
+def serialize_user_message_etree(user, action="CREATE"):
+    return tostring(user_message_element(user, action))
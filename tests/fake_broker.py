@@ -0,0 +1,140 @@
+# In-process stand-in for the parts of aio-pika used by the consumer services.
+# Acks follow the broker rules: acking a settled or unknown tag is an error.
+# Also holds the helpers the consumer service tests share.
+
+import asyncio
+
+
+class FakeMessage:
+
+    def __init__(self, channel, delivery_tag, body, routing_key="", headers=None):
+        self.channel = channel
+        self.delivery_tag = delivery_tag
+        self.body = body
+        self.routing_key = routing_key
+        self.headers = headers or {}
+
+    async def ack(self, multiple=False):
+        self.channel.settle(self.delivery_tag, "ack", multiple)
+
+    async def reject(self, requeue=False):
+        self.channel.settle(self.delivery_tag, "reject", False)
+
+
+class FakeQueue:
+
+    def __init__(self, channel, name, arguments=None):
+        self.channel = channel
+        self.name = name
+        self.arguments = arguments or {}
+        self.bindings = []
+        self.consumers = {}
+        self.messages = []
+
+    async def bind(self, exchange, routing_key):
+        self.bindings.append((exchange.name, routing_key))
+
+    async def consume(self, callback):
+        tag = "ctag-%s" % self.name
+        self.consumers[tag] = callback
+        return tag
+
+    async def cancel(self, tag):
+        del self.consumers[tag]
+
+
+class FakeExchange:
+
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message))
+
+
+class FakeChannel:
+
+    def __init__(self):
+        self.prefetch = None
+        self.queues = {}
+        self.exchanges = {}
+        self.default_exchange = FakeExchange(self, "")
+        self.outstanding = {}
+        self.settled = {}
+        self.ack_calls = 0
+        self._next_tag = 1
+
+    async def set_qos(self, prefetch_count):
+        self.prefetch = prefetch_count
+
+    async def declare_exchange(self, name, type, durable=False):
+        return self.exchanges.setdefault(name, FakeExchange(self, name))
+
+    async def declare_queue(self, name, durable=False, arguments=None):
+        return self.queues.setdefault(name, FakeQueue(self, name, arguments))
+
+    def settle(self, tag, outcome, multiple):
+        if tag not in self.outstanding:
+            raise AssertionError("PRECONDITION_FAILED - unknown delivery tag %d" % tag)
+        if outcome == "ack":
+            self.ack_calls += 1
+        tags = [t for t in self.outstanding if t <= tag] if multiple else [tag]
+        for t in tags:
+            del self.outstanding[t]
+            self.settled[t] = outcome
+
+    async def deliver(self, queue_name, body, headers=None):
+        # Delivers like the broker: never more than prefetch unsettled messages
+        while self.prefetch and len(self.outstanding) >= self.prefetch:
+            await asyncio.sleep(0)
+        queue = self.queues[queue_name]
+        tag = self._next_tag
+        self._next_tag += 1
+        message = FakeMessage(self, tag, body, queue_name, headers)
+        self.outstanding[tag] = message
+        for callback in list(queue.consumers.values()):
+            await callback(message)
+            break
+        return message
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.channels = []
+        self.closed = False
+
+    async def channel(self):
+        channel = FakeChannel()
+        self.channels.append(channel)
+        return channel
+
+    async def close(self):
+        self.closed = True
+
+
+def user_message(action, uuid):
+    return (
+        "<UserMessage><ActionType>%s</ActionType><UUID>%s</UUID>"
+        "<TimeOfAction>2025-05-16T12:00:00Z</TimeOfAction></UserMessage>" % (action, uuid)
+    ).encode()
+
+
+async def start(service, connection):
+    task = asyncio.ensure_future(service.run())
+    while not connection.channels or not all(
+        connection.channels[0].queues.get(name) and connection.channels[0].queues[name].consumers
+        for name in service.queues
+    ):
+        await asyncio.sleep(0)
+    return task, connection.channels[0]
+
+
+async def wait_for(condition):
+    for _ in range(10000):
+        if condition():
+            return
+        await asyncio.sleep(0.001)
+    raise AssertionError("condition not reached")
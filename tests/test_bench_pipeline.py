@@ -0,0 +1,42 @@
+import unittest
+
+from benchmarks.bench_pipeline import FakeChannel, compare, make_users, measure, run
+
+
+class TestBenchPipeline(unittest.TestCase):
+
+    def test_synthetic_users_are_reproducible_and_sized(self):
+        self.assertEqual(make_users(50, seed=1), make_users(50, seed=1))
+        large = [user for user in make_users(200, "large") if "business_name" in user]
+        self.assertTrue(large)
+        self.assertEqual(len(large[0]["real_address"]), 512)
+
+    def test_measure_reports_throughput_and_percentiles(self):
+        result = measure(len, ["x"] * 1000, warmup=10)
+        self.assertGreater(result["ops_per_sec"], 0)
+        self.assertLessEqual(result["p50_us"], result["p99_us"])
+
+    def test_run_covers_every_step(self):
+        report = run(count=300)
+        self.assertEqual(
+            {name.split(".")[0] for name in report["results"]},
+            {"serialize", "parse", "validate", "publish"},
+        )
+
+    def test_compare_flags_regressions(self):
+        old = {"results": {"parse.dispatch": {"ops_per_sec": 1000, "p99_us": 10},
+                           "publish.send_user": {"ops_per_sec": 1000, "p99_us": 10}}}
+        new = {"results": {"parse.dispatch": {"ops_per_sec": 700, "p99_us": 10},
+                           "publish.send_user": {"ops_per_sec": 1050, "p99_us": 10.5}}}
+        rows, regressions = compare(old, new, threshold=0.10)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(regressions, ["parse.dispatch"])
+
+    def test_fake_channel_counts_published_bytes(self):
+        channel = FakeChannel()
+        channel.basic_publish(exchange="user", routing_key="crm.user.create", body=b"<User/>")
+        self.assertEqual((channel.messages, channel.bytes), (1, 7))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from scripts.calendar_sync import CalendarStore, CalendarSync, SyncTokenExpired, main, start_key
+
+
+def event(event_id, start, summary=None, status="confirmed"):
+    return {"id": event_id, "status": status, "summary": summary or event_id, "start": {"dateTime": start}}
+
+
+class StubCalendarApi:
+    # In-memory stand-in for the Calendar API: every change gets a sequence number and
+    # a sync token is the sequence number it was handed out at
+
+    def __init__(self, page_size=2):
+        self.page_size = page_size
+        self.calendars = {}
+        self.changes = {}
+        self.sequence = 0
+        self.expired = set()
+        self.fail_on_page = None
+        self.requests = []
+
+    def put(self, calendar_id, *items):
+        self.calendars.setdefault(calendar_id, {"id": calendar_id, "summary": calendar_id, "accessRole": "owner"})
+        for item in items:
+            self.sequence += 1
+            self.changes.setdefault(calendar_id, {})[item["id"]] = (self.sequence, item)
+
+    def delete(self, calendar_id, event_id):
+        self.put(calendar_id, {"id": event_id, "status": "cancelled"})
+
+    def list_calendars(self):
+        return list(self.calendars.values())
+
+    def list_events(self, calendar_id, sync_token=None, page_token=None):
+        self.requests.append((calendar_id, sync_token, page_token))
+        if sync_token in self.expired:
+            raise SyncTokenExpired(calendar_id)
+        since = int(sync_token) if sync_token else 0
+        items = [item for sequence, item in sorted(self.changes.get(calendar_id, {}).values(), key=lambda c: c[0])
+                 if sequence > since and (sync_token or item.get("status") != "cancelled")]
+        offset = int(page_token or 0)
+        if self.fail_on_page is not None and offset // self.page_size == self.fail_on_page:
+            raise ConnectionError("quota exceeded")
+        page = items[offset:offset + self.page_size]
+        if offset + self.page_size < len(items):
+            return {"items": page, "nextPageToken": str(offset + self.page_size)}
+        return {"items": page, "nextSyncToken": str(self.sequence)}
+
+
+class TestCalendarSync(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.api = StubCalendarApi()
+        self.store = CalendarStore(":memory:", clock=lambda: self.now)
+        self.sync = CalendarSync(self.api, self.store)
+
+    def tearDown(self):
+        self.store.close()
+
+    def ids(self, calendar_id):
+        return [item["id"] for item in self.store.events(calendar_id)]
+
+    def test_full_sync_then_only_changes(self):
+        self.api.put("expo", event("b", "2025-06-01T14:00:00Z"), event("a", "2025-06-01T10:00:00Z"),
+                     event("c", "2025-06-02T10:00:00Z"))
+        self.assertEqual(self.sync.sync_all(), 3)
+        # Sessions come back in start order
+        self.assertEqual(self.ids("expo"), ["a", "b", "c"])
+
+        self.api.requests.clear()
+        self.api.put("expo", event("a", "2025-06-01T10:00:00Z", summary="Opening"))
+        self.api.delete("expo", "c")
+        self.assertEqual(self.sync.sync_all(), 2)
+
+        self.assertEqual(self.ids("expo"), ["a", "b"])
+        self.assertEqual(self.store.events("expo")[0]["summary"], "Opening")
+        # One incremental request, with the token from the previous pass
+        self.assertEqual(self.api.requests, [("expo", "3", None)])
+        self.assertEqual(self.sync.full_syncs, 1)
+
+    def test_events_are_ordered_by_actual_start_time(self):
+        self.api.put("expo")
+        self.api.calendars["expo"]["timeZone"] = "Europe/Brussels"
+        self.api.put("expo",
+                     event("utc-9", "2025-06-01T09:00:00Z"),
+                     event("cest-10", "2025-06-01T10:00:00+02:00"),
+                     {"id": "all-day", "status": "confirmed", "start": {"date": "2025-06-01"}},
+                     event("ny-1", "2025-06-01T01:00:00-04:00"))
+        self.sync.sync_all()
+
+        # 22:00Z (all-day, Brussels midnight), 05:00Z, 08:00Z, 09:00Z
+        self.assertEqual(self.ids("expo"), ["all-day", "ny-1", "cest-10", "utc-9"])
+
+    def test_start_key_handles_local_times_and_bad_values(self):
+        self.assertEqual(start_key({"start": {"dateTime": "2025-06-01T10:00:00", "timeZone": "Europe/Brussels"}}),
+                         start_key({"start": {"dateTime": "2025-06-01T08:00:00Z"}}))
+        self.assertIsNone(start_key({"start": {"date": "someday"}}))
+        self.assertIsNone(start_key({}))
+
+    def test_old_store_gets_the_sort_key(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "calendar.sqlite3")
+            with sqlite3.connect(path) as db:
+                db.executescript(
+                    "CREATE TABLE calendars (id TEXT PRIMARY KEY, summary TEXT, access_role TEXT, data TEXT NOT NULL, "
+                    "sync_token TEXT, synced_at REAL NOT NULL DEFAULT 0);"
+                    "CREATE TABLE events (calendar_id TEXT NOT NULL, id TEXT NOT NULL, start TEXT NOT NULL, "
+                    "updated TEXT, data TEXT NOT NULL, PRIMARY KEY (calendar_id, id));"
+                )
+                db.execute("INSERT INTO calendars (id, data) VALUES ('expo', '{}')")
+                for item in (event("late", "2025-06-01T09:00:00Z"), event("early", "2025-06-01T10:00:00+02:00")):
+                    db.execute("INSERT INTO events (calendar_id, id, start, data) VALUES ('expo', ?, ?, ?)",
+                               (item["id"], item["start"]["dateTime"], json.dumps(item)))
+            db.close()
+
+            store = CalendarStore(path)
+            self.assertEqual([item["id"] for item in store.events("expo")], ["early", "late"])
+            store.close()
+
+    def test_expired_sync_token_triggers_a_full_sync(self):
+        self.api.put("expo", event("a", "2025-06-01T10:00:00Z"), event("b", "2025-06-01T11:00:00Z"))
+        self.sync.sync_all()
+        self.api.delete("expo", "b")
+        self.api.expired.add(self.store.sync_token("expo"))
+
+        self.sync.sync_all()
+
+        self.assertEqual(self.ids("expo"), ["a"])
+        self.assertEqual(self.sync.full_syncs, 2)
+        self.assertEqual(self.store.sync_token("expo"), "3")
+
+    def test_planning_calendar_is_skipped_and_removed_calendars_are_dropped(self):
+        self.api.put("planning@youmnimalha.be", event("p", "2025-06-01T10:00:00Z"))
+        self.api.put("expo", event("a", "2025-06-01T10:00:00Z"))
+        self.api.put("old", event("x", "2025-06-01T10:00:00Z"))
+        self.sync.sync_all()
+        self.assertEqual([calendar["id"] for calendar in self.store.calendars()], ["expo", "old"])
+
+        del self.api.calendars["old"]
+        self.sync.sync_all()
+
+        self.assertEqual([calendar["id"] for calendar in self.store.calendars()], ["expo"])
+        self.assertEqual(self.ids("old"), [])
+        self.assertNotIn("planning@youmnimalha.be", [request[0] for request in self.api.requests])
+
+    def test_failure_halfway_through_the_pages_leaves_the_store_untouched(self):
+        self.api.put("expo", event("a", "2025-06-01T10:00:00Z"))
+        self.sync.sync_all()
+        token = self.store.sync_token("expo")
+        self.api.put("expo", *[event(str(i), "2025-06-03T10:00:00Z") for i in range(5)])
+        self.api.fail_on_page = 1
+
+        self.sync.sync_all()
+
+        self.assertEqual(self.ids("expo"), ["a"])
+        self.assertEqual(self.store.sync_token("expo"), token)
+
+        self.api.fail_on_page = None
+        self.sync.sync_all()
+        self.assertEqual(len(self.ids("expo")), 6)
+
+    def test_empty_calendar_list_keeps_the_store(self):
+        self.api.put("expo", event("a", "2025-06-01T10:00:00Z"))
+        self.sync.sync_all()
+
+        calendars, self.api.calendars = self.api.calendars, {}
+        self.sync.sync_all()
+
+        self.assertEqual([calendar["id"] for calendar in self.store.calendars()], ["expo"])
+        self.assertEqual(self.ids("expo"), ["a"])
+        self.api.calendars = calendars
+
+    def test_calendars_go_stale_after_the_ttl_or_when_invalidated(self):
+        self.api.put("expo", event("a", "2025-06-01T10:00:00Z"))
+        self.sync.sync_all()
+        self.assertTrue(self.store.is_fresh("expo", ttl=300))
+
+        self.now += 301
+        self.assertFalse(self.store.is_fresh("expo", ttl=300))
+        # Any pass refreshes the timestamp, even without changes
+        self.sync.sync_all()
+        self.assertTrue(self.store.is_fresh("expo", ttl=300))
+
+        self.store.invalidate("expo")
+        self.assertFalse(self.store.is_fresh("expo", ttl=300))
+        self.assertIsNone(self.store.sync_token("expo"))
+        self.sync.sync_all()
+        self.assertEqual(self.sync.full_syncs, 2)
+
+    def test_unknown_calendar_is_not_fresh(self):
+        self.assertFalse(self.store.is_fresh("missing"))
+
+
+class TestCalendarSyncCli(unittest.TestCase):
+
+    def test_invalidate_clears_sync_tokens(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "calendar.sqlite3")
+            store = CalendarStore(path)
+            api = StubCalendarApi()
+            api.put("expo", event("a", "2025-06-01T10:00:00Z"))
+            CalendarSync(api, store).sync_all()
+            store.close()
+
+            with patch("scripts.calendar_sync.STORE_PATH", path):
+                main(["--invalidate"])
+
+            store = CalendarStore(path)
+            self.assertIsNone(store.sync_token("expo"))
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pika.exceptions import AMQPConnectionError, StreamLostError
+
+from scripts.connection_pool import ChannelPool, ConnectionManager, backoff_delays, connection_parameters
+
+
+def open_connection():
+    connection = MagicMock()
+    connection.is_open = True
+    connection.channel.side_effect = lambda: MagicMock(is_open=True)
+    return connection
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_delays_grow_exponentially_up_to_cap(self):
+        delays = list(backoff_delays(base=0.5, cap=4, retries=6, rng=lambda: 1.0))
+        self.assertEqual(delays, [0.5, 1, 2, 4, 4, 4])
+
+    def test_full_jitter_scales_delay(self):
+        delays = list(backoff_delays(base=1, cap=30, retries=3, rng=lambda: 0.5))
+        self.assertEqual(delays, [0.5, 1, 2])
+
+
+class TestConnectionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        self.parameters = connection_parameters("broker", 5672, "frontend", "s3cret", "/")
+
+    def manager(self, **kwargs):
+        return ConnectionManager(self.parameters, sleep=self.sleeps.append, rng=lambda: 1.0, base_delay=0.5, **kwargs)
+
+    @patch("scripts.connection_pool.pika.BlockingConnection")
+    def test_connect_retries_with_backoff_without_logging_password(self, blocking_connection):
+        blocking_connection.side_effect = [AMQPConnectionError("down"), AMQPConnectionError("down"), open_connection()]
+
+        with self.assertLogs("RabbitMQConnection", "INFO") as logs:
+            channel = self.manager().channel()
+
+        self.assertTrue(channel.is_open)
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        self.assertFalse(any("s3cret" in line for line in logs.output))
+        self.assertTrue(any("user=frontend" in line for line in logs.output))
+
+    @patch("scripts.connection_pool.pika.BlockingConnection")
+    def test_connect_gives_up_after_max_retries(self, blocking_connection):
+        blocking_connection.side_effect = AMQPConnectionError("down")
+
+        with self.assertLogs("RabbitMQConnection"), self.assertRaises(AMQPConnectionError):
+            self.manager(max_retries=2).connection()
+        self.assertEqual(blocking_connection.call_count, 3)
+
+    @patch("scripts.connection_pool.pika.BlockingConnection")
+    def test_run_reconnects_and_retries_on_fresh_channel(self, blocking_connection):
+        first, second = open_connection(), open_connection()
+        blocking_connection.side_effect = [first, second]
+        manager = self.manager()
+        calls = []
+
+        def operation(channel):
+            calls.append(channel)
+            if len(calls) == 1:
+                raise StreamLostError("connection reset")
+            return "ok"
+
+        with self.assertLogs("RabbitMQConnection"):
+            self.assertEqual(manager.run(operation), "ok")
+
+        self.assertIsNot(calls[0], calls[1])
+        self.assertEqual(manager.reconnects, 1)
+        first.close.assert_called_once_with()
+
+    @patch("scripts.connection_pool.pika.BlockingConnection")
+    def test_closed_channel_is_recreated_on_same_connection(self, blocking_connection):
+        blocking_connection.return_value = open_connection()
+        manager = self.manager()
+        channel = manager.channel()
+        channel.is_open = False
+
+        self.assertIsNot(manager.channel(), channel)
+        self.assertEqual(blocking_connection.call_count, 1)
+
+
+class TestChannelPool(unittest.TestCase):
+
+    @patch("scripts.connection_pool.pika.BlockingConnection")
+    def test_channels_are_reused_and_failed_ones_dropped(self, blocking_connection):
+        blocking_connection.side_effect = lambda parameters: open_connection()
+        pool = ChannelPool(ConnectionManager(MagicMock()), size=2)
+
+        with pool.channel() as first:
+            pass
+        with pool.channel() as second:
+            pass
+        self.assertIs(first, second)
+
+        with self.assertRaises(StreamLostError):
+            with pool.channel() as broken:
+                raise StreamLostError("connection reset")
+        with pool.channel() as third:
+            pass
+        self.assertIsNot(third, broken)
+
+
+if __name__ == "__main__":
+    unittest.main()
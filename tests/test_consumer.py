@@ -1,8 +1,11 @@
+import io
 import unittest
 from scripts.consumer import (
     handle_user_create,
     handle_user_update,
-    handle_user_delete
+    handle_user_delete,
+    dispatch,
+    iter_user_messages
 )
 
 class TestConsumer(unittest.TestCase):
@@ -89,5 +92,71 @@ class TestConsumer(unittest.TestCase):
         self.assertEqual(result["uuid"], "abc")
         self.assertIsNone(result["email"])
 
+    def test_dispatch_accepts_bytes_and_returns_action(self):
+        xml = b"""
+        <UserMessage>
+            <ActionType>UPDATE</ActionType>
+            <UUID>b42</UUID>
+            <EmailAddress>rayan@example.com</EmailAddress>
+            <Business>
+                <BTWNumber>BE123456789</BTWNumber>
+            </Business>
+        </UserMessage>
+        """
+        action, user = dispatch(xml)
+        self.assertEqual(action, "UPDATE")
+        self.assertEqual(user["uuid"], "b42")
+        self.assertEqual(user["btw_number"], "BE123456789")
+        self.assertIsNone(user["business_name"])
+
+    def test_dispatch_delete_only_returns_uuid_and_time(self):
+        xml = b"<UserMessage><ActionType>DELETE</ActionType><UUID>d1</UUID>" \
+              b"<TimeOfAction>2025-05-16T18:00:00Z</TimeOfAction><FirstName>x</FirstName></UserMessage>"
+        action, user = dispatch(xml)
+        self.assertEqual(action, "DELETE")
+        self.assertEqual(user.uuid, "d1")
+        self.assertEqual(user.time, "2025-05-16T18:00:00Z")
+        self.assertIsNone(user.first_name)
+
+    def test_dispatch_unknown_or_missing_action_type(self):
+        self.assertEqual(dispatch(b"<UserMessage><ActionType>PATCH</ActionType></UserMessage>"), ("PATCH", None))
+        self.assertEqual(dispatch(b"<UserMessage><UUID>abc</UUID></UserMessage>"), (None, None))
+        self.assertIsNone(handle_user_create(b"<UserMessage><UUID>abc</UUID></UserMessage>"))
+
+    def test_dispatch_keeps_empty_fields_as_empty_string(self):
+        action, user = dispatch(b"<UserMessage><ActionType>CREATE</ActionType><LastName/></UserMessage>")
+        self.assertEqual(user["last_name"], "")
+        self.assertIsNone(user["first_name"])
+
+
+class TestUserMessageStream(unittest.TestCase):
+
+    def message(self, action, uuid):
+        return (
+            '<?xml version="1.0"?>\n<UserMessage><ActionType>%s</ActionType><UUID>%s</UUID>'
+            '<FirstName>Rayan</FirstName><Business><BusinessName>Biz &amp; Co</BusinessName></Business>'
+            '</UserMessage>\n' % (action, uuid)
+        ).encode()
+
+    def test_concatenated_messages_with_declarations(self):
+        dump = b"".join(self.message("CREATE", "u%d" % i) for i in range(50))
+        # A tiny chunk size splits tags and declarations across reads
+        results = list(iter_user_messages(io.BytesIO(dump), chunk_size=7))
+        self.assertEqual(len(results), 50)
+        self.assertEqual(results[0][0], "CREATE")
+        self.assertEqual(results[49][1]["uuid"], "u49")
+        self.assertEqual(results[3][1]["business_name"], "Biz & Co")
+
+    def test_wrapped_messages_from_chunk_iterable(self):
+        chunks = [b"<Batch>", self.message("UPDATE", "a"), self.message("DELETE", "b"), b"</Batch>"]
+        results = list(iter_user_messages(chunks))
+        self.assertEqual([action for action, _ in results], ["UPDATE", "DELETE"])
+        self.assertEqual(results[1][1].uuid, "b")
+        self.assertIsNone(results[1][1].business)
+
+    def test_unknown_action_yields_none(self):
+        results = list(iter_user_messages([b"<UserMessage><ActionType>X</ActionType></UserMessage>"]))
+        self.assertEqual(results, [("X", None)])
+
 if __name__ == "__main__":
     unittest.main()
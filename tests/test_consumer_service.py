@@ -0,0 +1,155 @@
+import asyncio
+import unittest
+
+from fake_broker import FakeConnection, start, user_message, wait_for
+from scripts.consumer_service import USER_QUEUES, AckBatcher, ConsumerService
+
+
+class TestConsumerService(unittest.IsolatedAsyncioTestCase):
+
+    async def test_processes_all_queues_with_bounded_workers_and_batched_acks(self):
+        connection = FakeConnection()
+        seen = []
+        running = 0
+        peak = 0
+
+        async def handler(action, user):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.001)
+            seen.append((action, user.uuid))
+            running -= 1
+
+        async def connect():
+            return connection
+
+        service = ConsumerService(handler=handler, connect=connect, prefetch=10, workers=3,
+                                  ack_batch=4, ack_interval=0.01)
+        task, channel = await start(service, connection)
+
+        self.assertEqual(channel.prefetch, 10)
+        self.assertEqual(channel.queues["frontend_user_update"].bindings, [("user", "frontend.user.update")])
+
+        actions = {"frontend_user_create": "CREATE", "frontend_user_update": "UPDATE", "frontend_user_delete": "DELETE"}
+        for i in range(60):
+            queue = list(USER_QUEUES)[i % 3]
+            await channel.deliver(queue, user_message(actions[queue], "u%d" % i))
+
+        await wait_for(lambda: service.processed == 60)
+        service.stop()
+        await task
+
+        self.assertEqual(sorted(uuid for _, uuid in seen), sorted("u%d" % i for i in range(60)))
+        self.assertLessEqual(peak, 3)
+        self.assertEqual(channel.outstanding, {})
+        self.assertEqual(set(channel.settled.values()), {"ack"})
+        self.assertLess(channel.ack_calls, 60)
+        self.assertTrue(connection.closed)
+
+    async def test_failed_messages_are_rejected_without_breaking_batch_acks(self):
+        connection = FakeConnection()
+
+        def handler(action, user):
+            if user.uuid == "bad":
+                raise ValueError("boom")
+
+        async def connect():
+            return connection
+
+        service = ConsumerService(handler=handler, connect=connect, prefetch=20, workers=2,
+                                  ack_batch=5, ack_interval=0.01)
+        task, channel = await start(service, connection)
+
+        await channel.deliver("frontend_user_create", user_message("CREATE", "ok1"))
+        await channel.deliver("frontend_user_create", user_message("CREATE", "bad"))
+        await channel.deliver("frontend_user_create", b"<not xml")
+        await channel.deliver("frontend_user_create", user_message("PATCH", "ignored"))
+
+        await wait_for(lambda: service.processed + service.failed == 4)
+        service.stop()
+        await task
+
+        self.assertEqual(service.failed, 2)
+        self.assertEqual(channel.outstanding, {})
+        self.assertEqual([channel.settled[tag] for tag in range(1, 5)], ["ack", "reject", "reject", "ack"])
+
+    async def test_workers_survive_failing_acks(self):
+        connection = FakeConnection()
+
+        async def connect():
+            return connection
+
+        service = ConsumerService(handler=lambda action, user: None, connect=connect, prefetch=20, workers=2,
+                                  ack_batch=1, ack_interval=0.01)
+        task, channel = await start(service, connection)
+
+        # The channel closed under the first two acks
+        settle = channel.settle
+        failures = [2]
+
+        def flaky_settle(tag, outcome, multiple):
+            if failures[0]:
+                failures[0] -= 1
+                raise ConnectionError("channel closed")
+            settle(tag, outcome, multiple)
+
+        channel.settle = flaky_settle
+        for i in range(6):
+            await channel.deliver("frontend_user_create", user_message("CREATE", "u%d" % i))
+
+        await wait_for(lambda: service.processed == 6)
+        service.stop()
+        await asyncio.wait_for(task, 5)
+
+        self.assertEqual(failures, [0])
+        self.assertEqual(channel.outstanding, {})
+
+
+class TestAckBatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_only_acks_the_leading_finished_run(self):
+        connection = FakeConnection()
+        channel = await connection.channel()
+        channel.queues["q"] = type("Q", (), {"consumers": {}})()
+        messages = [await channel.deliver("q", b"") for _ in range(4)]
+        acks = AckBatcher(batch_size=100)
+        for message in messages:
+            acks.delivered(message)
+
+        await acks.ack(messages[1])
+        await acks.flush()
+        self.assertEqual(channel.settled, {})
+
+        await acks.ack(messages[0])
+        await acks.reject(messages[2])
+        await acks.flush()
+        self.assertEqual(channel.settled, {1: "ack", 2: "ack", 3: "reject"})
+        self.assertEqual(len(acks), 1)
+
+    async def test_reopened_channel_drops_the_old_deliveries(self):
+        connection = FakeConnection()
+        old, new = await connection.channel(), await connection.channel()
+        for channel in (old, new):
+            channel.queues["q"] = type("Q", (), {"consumers": {}})()
+        acks = AckBatcher(batch_size=100)
+        stale = await old.deliver("q", b"")
+        acks.delivered(stale)
+
+        # Same delivery tag on the new channel
+        fresh = await new.deliver("q", b"")
+        acks.delivered(fresh)
+        self.assertEqual(len(acks), 1)
+
+        await acks.ack(stale)
+        await acks.flush()
+        self.assertEqual(new.settled, {})
+
+        await acks.ack(fresh)
+        await acks.flush()
+        self.assertEqual(new.settled, {1: "ack"})
+        self.assertEqual(old.settled, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import MagicMock
+from xml.etree.ElementTree import fromstring
+
+from pika.exceptions import StreamLostError
+
+from scripts.connection_pool import ConnectionManager
+from scripts.fanout import (EVENT_ROUTING_KEYS, SESSION_ROUTING_KEYS, Fanout, FanoutPublisher, event_fanouts,
+                            publish_event, windows)
+from scripts.message_schema import UPDATE_EVENT, UPDATE_SESSION
+
+
+def event(sessions=0):
+    payload = {
+        "event_uuid": "expo@group.calendar.google.com", "event_name": "Expo", "event_description": "Jaarlijkse expo",
+        "start": "2025-06-01T10:00:00+02:00", "end": "2025-06-01T18:00:00+02:00", "location": "Brussel",
+        "organisator": "planning@youmnimalha.be", "capacity": "100", "event_type": "default",
+        "registered_users": [{"uuid": "2025-05-16T12:00:00.000000Z"}],
+    }
+    session_payloads = [{
+        "session_uuid": "session-%d" % i, "event_uuid": payload["event_uuid"], "session_name": "Talk %d" % i,
+        "session_description": "", "capacity": "100", "start": "2025-06-01T11:00:00+02:00",
+        "end": "2025-06-01T12:00:00+02:00", "location": "Zaal %d" % i, "session_type": "default",
+        "registered_users": [{"email": "rayan@example.com"}],
+    } for i in range(sessions)]
+    return payload, session_payloads
+
+
+class TestFanoutPublisher(unittest.TestCase):
+
+    def test_body_is_serialized_once_and_shared_by_every_route(self):
+        channel = MagicMock()
+        fanout = Fanout("event", EVENT_ROUTING_KEYS, bytearray(b"<UpdateEvent/>"))
+        FanoutPublisher(channel).send([fanout])
+
+        bodies = [call.kwargs["body"] for call in channel.basic_publish.call_args_list]
+        self.assertEqual([call.kwargs["routing_key"] for call in channel.basic_publish.call_args_list],
+                         list(EVENT_ROUTING_KEYS))
+        self.assertIsInstance(bodies[0], bytes)
+        self.assertTrue(all(body is bodies[0] for body in bodies))
+
+    def test_event_and_sessions_are_one_transaction(self):
+        channel = MagicMock()
+        payload, sessions = event(sessions=12)
+
+        count = publish_event(FanoutPublisher(channel), payload, sessions)
+
+        self.assertEqual(count, len(EVENT_ROUTING_KEYS) + 12 * len(SESSION_ROUTING_KEYS))
+        channel.tx_select.assert_called_once_with()
+        channel.tx_commit.assert_called_once_with()
+        calls = channel.basic_publish.call_args_list
+        self.assertEqual({call.kwargs["exchange"] for call in calls[:3]}, {"event"})
+        self.assertEqual([call.kwargs["routing_key"] for call in calls[3:5]], list(SESSION_ROUTING_KEYS))
+        # Nothing is declared for exchanges owned by the other teams
+        channel.queue_declare.assert_not_called()
+
+    def test_event_messages_match_the_schemas(self):
+        payload, sessions = event(sessions=2)
+        fanouts = event_fanouts(payload, sessions)
+
+        self.assertEqual(UPDATE_EVENT.decode(fanouts[0].body, validate=True), payload)
+        self.assertEqual(UPDATE_SESSION.decode(fanouts[1].body, validate=True), sessions[0])
+        self.assertEqual(fromstring(fanouts[2].body).findtext("SessionName"), "Talk 1")
+
+    def test_windows_never_split_a_fanout(self):
+        fanouts = [Fanout("x", ("a", "b", "c"), b"%d" % i) for i in range(5)]
+        self.assertEqual([len(window) for window in windows(fanouts, 7)], [2, 2, 1])
+        self.assertEqual([len(window) for window in windows(fanouts, 2)], [1, 1, 1, 1, 1])
+
+    def test_publish_batch_commits_per_window_and_declares_topology_once(self):
+        channel = MagicMock()
+        publisher = FanoutPublisher(channel, topology={"x": {"queue_a": "a", "queue_b": "b"}}, confirm_window=4)
+
+        count = publisher.publish_batch(Fanout("x", ("a", "b"), b"%d" % i) for i in range(5))
+
+        self.assertEqual(count, 10)
+        self.assertEqual(channel.tx_commit.call_count, 3)
+        self.assertEqual(channel.queue_declare.call_count, 2)
+        channel.queue_bind.assert_any_call("queue_b", "x", "b")
+
+    def test_window_is_resent_on_a_new_channel_after_a_reconnect(self):
+        broken, fresh = MagicMock(), MagicMock()
+        broken.tx_commit.side_effect = StreamLostError("connection reset")
+        manager = ConnectionManager(MagicMock(), max_retries=3, sleep=lambda seconds: None)
+        channels = iter([broken, fresh])
+        manager.channel = lambda: next(channels)
+        payload, sessions = event(sessions=3)
+
+        count = publish_event(FanoutPublisher(manager=manager), payload, sessions)
+
+        self.assertEqual(count, 9)
+        fresh.tx_select.assert_called_once_with()
+        self.assertEqual(fresh.basic_publish.call_count, 9)
+
+    def test_outbox_receives_every_route(self):
+        outbox = MagicMock()
+        payload, sessions = event(sessions=1)
+
+        self.assertEqual(publish_event(FanoutPublisher(outbox=outbox), payload, sessions), 5)
+
+        messages = outbox.append_many.call_args.args[0]
+        self.assertEqual([(exchange, key) for exchange, key, _ in messages],
+                         [("event", key) for key in EVENT_ROUTING_KEYS] + [("session", key) for key in SESSION_ROUTING_KEYS])
+
+
+if __name__ == "__main__":
+    unittest.main()
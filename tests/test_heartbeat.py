@@ -35,5 +35,83 @@ class TestRabbitMQSetup(unittest.TestCase):
         self.assertEqual(chan, mock_channel)
 
 
+from heartbeat.heartbeat import HeartbeatEngine, build_payloads, HEARTBEAT_PROPERTIES
+
+class FakeClock:
+
+    def __init__(self, publish_cost=0.0):
+        self.now = 100.0
+        self.publish_cost = publish_cost
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestHeartbeatEngine(unittest.TestCase):
+
+    def test_payloads_are_prebuilt_bytes(self):
+        payloads = build_payloads(['Frontend', 'Frontend-2'])
+        self.assertEqual(len(payloads), 2)
+        self.assertIn(b'<ServiceName>Frontend-2</ServiceName>', payloads[1])
+
+    def test_schedule_does_not_drift_with_publish_time(self):
+        clock = FakeClock()
+        channel = MagicMock()
+        channel.basic_publish.side_effect = lambda **kwargs: setattr(clock, 'now', clock.now + 0.2)
+        engine = HeartbeatEngine(channel, build_payloads(['Frontend']), interval=1.0, sleep=clock.sleep, clock=clock)
+
+        engine.run(beats=5)
+
+        self.assertEqual(channel.basic_publish.call_count, 5)
+        self.assertEqual([round(s, 6) for s in clock.sleeps], [0.8] * 4)
+        self.assertIs(channel.basic_publish.call_args.kwargs['properties'], HEARTBEAT_PROPERTIES)
+
+    def test_slow_publish_skips_missed_beats(self):
+        clock = FakeClock()
+        channel = MagicMock()
+        channel.basic_publish.side_effect = lambda **kwargs: setattr(clock, 'now', clock.now + 2.5)
+        engine = HeartbeatEngine(channel, build_payloads(['Frontend']), interval=1.0, sleep=clock.sleep, clock=clock)
+
+        engine.run(beats=2)
+
+        self.assertEqual(engine.missed, 4)
+        self.assertAlmostEqual(clock.sleeps[0], 0.5)
+
+    def test_one_engine_publishes_for_every_service(self):
+        clock = FakeClock()
+        channel = MagicMock()
+        engine = HeartbeatEngine(channel, build_payloads(['A', 'B', 'C']), sleep=clock.sleep, clock=clock)
+
+        engine.run(beats=2)
+
+        self.assertEqual(engine.sent, 6)
+
+
+from pika.exceptions import StreamLostError
+from heartbeat.heartbeat import run_heartbeat
+
+class TestHeartbeatReconnect(unittest.TestCase):
+
+    @patch("heartbeat.heartbeat.time.sleep")
+    @patch("heartbeat.heartbeat.pika.BlockingConnection")
+    def test_run_heartbeat_reconnects_after_connection_loss(self, mock_connection, mock_sleep):
+        lost, restored = MagicMock(), MagicMock()
+        lost.channel.return_value.basic_publish.side_effect = StreamLostError("connection reset")
+        restored.channel.return_value.basic_publish.side_effect = [None, KeyboardInterrupt]
+        mock_connection.side_effect = [lost, restored]
+
+        run_heartbeat()
+
+        self.assertEqual(mock_connection.call_count, 2)
+        self.assertEqual(restored.channel.return_value.basic_publish.call_count, 2)
+        mock_sleep.assert_called_once()
+        restored.close.assert_called_once_with()
+
+
 if __name__ == "__main__":
     unittest.main()
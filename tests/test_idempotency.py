@@ -0,0 +1,140 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from fake_broker import FakeConnection, start, wait_for
+from scripts.consumer_service import ConsumerService
+from scripts.idempotency import SeenCache, time_key
+from scripts.user_record import UserRecord
+
+
+def user(uuid, time):
+    return UserRecord(uuid=uuid, time=time)
+
+
+class TestSeenCache(unittest.TestCase):
+
+    def test_drops_duplicates_and_older_messages(self):
+        cache = SeenCache()
+        self.assertTrue(cache.admit("CREATE", user("a", "2025-05-16T12:00:00Z")))
+        self.assertFalse(cache.admit("CREATE", user("a", "2025-05-16T12:00:00Z")))
+        self.assertTrue(cache.admit("UPDATE", user("a", "2025-05-16T13:00:00Z")))
+        self.assertFalse(cache.admit("UPDATE", user("a", "2025-05-16T12:30:00Z")))
+
+    def test_drops_updates_after_delete(self):
+        cache = SeenCache()
+        cache.admit("DELETE", user("a", "2025-05-16T12:00:00Z"))
+        self.assertFalse(cache.admit("UPDATE", user("a", "2025-05-16T18:00:00Z")))
+
+    def test_messages_without_time_are_always_admitted(self):
+        cache = SeenCache()
+        self.assertTrue(cache.admit("UPDATE", user("a", None)))
+        self.assertTrue(cache.admit("UPDATE", user("a", None)))
+        self.assertIsNone(time_key("yesterday"))
+
+    def test_revert_restores_previous_state(self):
+        cache = SeenCache()
+        cache.admit("CREATE", user("a", "2025-05-16T12:00:00Z"))
+        cache.confirm("CREATE", user("a", "2025-05-16T12:00:00Z"))
+        cache.admit("UPDATE", user("a", "2025-05-16T13:00:00Z"))
+        cache.revert("UPDATE", user("a", "2025-05-16T13:00:00Z"))
+        self.assertTrue(cache.is_fresh("UPDATE", user("a", "2025-05-16T13:00:00Z")))
+        self.assertFalse(cache.is_fresh("CREATE", user("a", "2025-05-16T12:00:00Z")))
+
+    def test_changes_within_the_same_second_are_admitted(self):
+        cache = SeenCache()
+        first = UserRecord(uuid="a", time="2025-05-16T12:00:00Z", first_name="Rayan")
+        second = UserRecord(uuid="a", time="2025-05-16T12:00:00Z", first_name="Ray")
+        self.assertTrue(cache.admit("UPDATE", first))
+        self.assertTrue(cache.admit("UPDATE", second))
+        self.assertFalse(cache.admit("UPDATE", first))
+        self.assertFalse(cache.admit("UPDATE", second))
+        self.assertTrue(cache.admit("DELETE", user("a", "2025-05-16T12:00:00Z")))
+
+    def test_failed_message_does_not_undo_a_later_one(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SeenCache(path=os.path.join(directory, "seen.sqlite"))
+            create = user("a", "2025-05-16T12:00:00Z")
+            update = user("a", "2025-05-16T13:00:00Z")
+            self.assertTrue(cache.admit("CREATE", create))
+            self.assertTrue(cache.admit("UPDATE", update))
+            cache.revert("CREATE", create)
+            cache.confirm("UPDATE", update)
+
+            self.assertEqual(cache.get("a")[0], time_key(update.time))
+            self.assertFalse(cache.admit("UPDATE", update))
+            # The retried CREATE still goes through, once
+            self.assertTrue(cache.admit("CREATE", create))
+            cache.confirm("CREATE", create)
+            self.assertFalse(cache.admit("CREATE", create))
+            cache.close()
+
+            restarted = SeenCache(path=os.path.join(directory, "seen.sqlite"))
+            self.assertEqual(restarted.get("a")[0], time_key(update.time))
+            restarted.close()
+
+    def test_revert_after_a_failed_predecessor_restores_the_older_state(self):
+        cache = SeenCache()
+        first = user("a", "2025-05-16T12:00:00Z")
+        second = user("a", "2025-05-16T13:00:00Z")
+        cache.admit("UPDATE", first)
+        cache.admit("UPDATE", second)
+        cache.revert("UPDATE", first)
+        cache.revert("UPDATE", second)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertTrue(cache.admit("UPDATE", first))
+
+    def test_lru_bound_and_ttl(self):
+        now = [1000.0]
+        cache = SeenCache(maxsize=2, ttl=60, clock=lambda: now[0])
+        for uuid in "abc":
+            cache.admit("CREATE", user(uuid, "2025-05-16T12:00:00Z"))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("a"))
+        now[0] += 61
+        self.assertIsNone(cache.get("c"))
+
+    def test_sqlite_spill_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "seen.sqlite")
+            cache = SeenCache(path=path)
+            cache.admit("DELETE", user("a", "2025-05-16T12:00:00Z"))
+            cache.confirm("DELETE", user("a", "2025-05-16T12:00:00Z"))
+            cache.admit("CREATE", user("b", "2025-05-16T12:00:00Z"))  # never confirmed
+            cache.close()
+
+            restarted = SeenCache(path=path)
+            self.assertFalse(restarted.admit("UPDATE", user("a", "2025-05-16T13:00:00Z")))
+            self.assertTrue(restarted.admit("CREATE", user("b", "2025-05-16T12:00:00Z")))
+            restarted.close()
+
+
+class TestConsumerServiceGuard(unittest.IsolatedAsyncioTestCase):
+
+    async def test_redeliveries_skip_the_handler(self):
+        connection = FakeConnection()
+        calls = []
+
+        async def connect():
+            return connection
+
+        body = (b"<UserMessage><ActionType>UPDATE</ActionType><UUID>a</UUID>"
+                b"<TimeOfAction>2025-05-16T12:00:00Z</TimeOfAction></UserMessage>")
+        service = ConsumerService(handler=lambda action, user: calls.append(user.uuid), connect=connect,
+                                  prefetch=10, workers=2, ack_batch=2, ack_interval=0.01, guard=SeenCache())
+        task, channel = await start(service, connection)
+        for _ in range(5):
+            await channel.deliver("frontend_user_update", body)
+        await wait_for(lambda: service.processed == 5)
+        service.stop()
+        await task
+
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(service.skipped, 4)
+        self.assertEqual(channel.outstanding, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from xml.etree.ElementTree import fromstring
+
+from scripts.message_schema import (
+    HEARTBEAT, UPDATE_EVENT, UPDATE_SESSION, USER, USER_MESSAGE, SchemaError, decode_message, encode_message
+)
+from scripts.user_record import UserRecord
+from scripts.xml_serializer import serialize_user_message
+
+try:
+    import lxml  # noqa: F401
+except ImportError:
+    lxml = None
+
+EVENT = {
+    "event_uuid": "2025-05-16T12:00:00Z",
+    "event_name": "Hackathon & BBQ",
+    "event_description": "Yearly <b>event</b>",
+    "start": "2025-06-01T09:00:00+02:00",
+    "end": "2025-06-01T17:00:00+02:00",
+    "location": "Brussel",
+    "organisator": "planning@example.com",
+    "capacity": 100,
+    "event_type": "default",
+    "registered_users": [{"uuid": "u1"}, {"uuid": "u2"}],
+}
+
+
+class TestMessageSchema(unittest.TestCase):
+
+    def test_event_round_trip_with_repeated_users(self):
+        body = UPDATE_EVENT.encode(EVENT)
+
+        self.assertIn(b"<EventName>Hackathon &amp; BBQ</EventName>", body)
+        self.assertIn(b"<RegisteredUsers><User><UUID>u1</UUID></User><User><UUID>u2</UUID></User></RegisteredUsers>", body)
+        decoded = UPDATE_EVENT.decode(body, validate=True)
+        self.assertEqual(decoded, dict(EVENT, capacity="100"))
+
+    def test_session_users_are_identified_by_email(self):
+        body = encode_message("UpdateSession", {"session_uuid": "s1", "registered_users": [{"email": "a@b.be"}]})
+
+        root, decoded = decode_message(body)
+        self.assertEqual(root, "UpdateSession")
+        self.assertEqual(decoded["registered_users"], [{"email": "a@b.be"}])
+        self.assertEqual(decoded["session_name"], "")
+
+    def test_heartbeat_positional_encoding(self):
+        self.assertEqual(
+            HEARTBEAT.encode_values(("Frontend",)),
+            b"<Heartbeat><ServiceName>Frontend</ServiceName></Heartbeat>",
+        )
+
+    def test_user_message_decodes_to_user_record(self):
+        body = serialize_user_message({"uuid": "u1", "time": "2025-05-16T12:00:00Z", "business_name": "Acme"})
+
+        action, user = USER_MESSAGE.decode(body, validate=True)
+
+        self.assertEqual(action, "CREATE")
+        self.assertIsInstance(user, UserRecord)
+        self.assertEqual(user.business.name, "Acme")
+
+    def test_delete_with_only_uuid_and_time_is_valid(self):
+        USER_MESSAGE.validate(
+            b"<UserMessage><ActionType>DELETE</ActionType><UUID>u1</UUID><TimeOfAction>t</TimeOfAction></UserMessage>"
+        )
+
+    def test_validation_reports_structure_errors(self):
+        body = b"<UpdateEvent><EventName>x</EventName><EventUUID>e</EventUUID><Extra/></UpdateEvent>"
+
+        with self.assertRaises(SchemaError) as raised:
+            UPDATE_EVENT.validate(body)
+
+        message = str(raised.exception)
+        self.assertIn("unexpected <Extra>", message)
+        self.assertIn("<EventUUID> is repeated or out of order", message)
+        self.assertIn("missing <Capacity>", message)
+
+    def test_decode_validates_only_when_asked(self):
+        body = b"<Heartbeat><Other>x</Other></Heartbeat>"
+        self.assertEqual(HEARTBEAT.decode(body, validate=False), {})
+        with self.assertRaises(SchemaError):
+            HEARTBEAT.decode(body, validate=True)
+
+    def test_unknown_root_is_rejected(self):
+        with self.assertRaises(SchemaError):
+            decode_message(b"<Unknown/>")
+
+    def test_generated_xsd_lists_every_field(self):
+        xsd = fromstring(UPDATE_SESSION.to_xsd())
+        names = {element.get("name") for element in xsd.iter("{http://www.w3.org/2001/XMLSchema}element")}
+        self.assertTrue({"UpdateSession", "SessionUUID", "RegisteredUsers", "User", "email"} <= names)
+
+    def test_lowercase_user_shape_has_every_key(self):
+        self.assertEqual(USER.decode(USER.encode({"first_name": "Rayan"}))["first_name"], "Rayan")
+
+    @unittest.skipIf(lxml is None, "lxml is not installed")
+    def test_xsd_validation(self):
+        UPDATE_EVENT.validate(UPDATE_EVENT.encode(EVENT), xsd=True)
+        with self.assertRaises(SchemaError):
+            UPDATE_EVENT.validate(b"<UpdateEvent><Extra/></UpdateEvent>", xsd=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
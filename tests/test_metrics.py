@@ -0,0 +1,72 @@
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from scripts.metrics import Registry, start_http_server, timed
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_disabled_registry_records_nothing(self):
+        registry = Registry(enabled=False)
+        counter = registry.counter("test_total", "Test counter")
+        histogram = registry.histogram("test_seconds", "Test histogram")
+
+        counter.inc()
+        histogram.observe(0.5)
+        with histogram.time():
+            pass
+
+        self.assertEqual((counter.value, histogram.count), (0, 0))
+
+    def test_timed_returns_function_unwrapped_when_disabled(self):
+        histogram = Registry(enabled=False).histogram("test_seconds", "Test histogram")
+
+        def parse(body):
+            return body
+
+        self.assertIs(timed(histogram)(parse), parse)
+
+    def test_timed_observes_calls_when_enabled(self):
+        histogram = Registry(enabled=True).histogram("test_seconds", "Test histogram")
+        parse = timed(histogram)(lambda body: body.upper())
+
+        self.assertEqual(parse("x"), "X")
+        self.assertEqual(histogram.count, 1)
+
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = Registry(enabled=True)
+        histogram = registry.histogram("test_seconds", "Test histogram", buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        registry.counter("test_total", "Test counter").inc(2)
+
+        text = registry.render()
+
+        self.assertIn('test_seconds_bucket{le="0.1"} 2', text)
+        self.assertIn('test_seconds_bucket{le="1"} 3', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn("test_seconds_count 4", text)
+        self.assertIn("# TYPE test_total counter\ntest_total 2", text)
+
+    def test_registering_a_name_twice_returns_the_same_metric(self):
+        registry = Registry()
+        self.assertIs(registry.counter("test_total", "a"), registry.counter("test_total", "a"))
+
+    def test_http_server_serves_metrics(self):
+        registry = Registry(enabled=True)
+        registry.counter("test_total", "Test counter").inc()
+        server = start_http_server(0, registry, host="127.0.0.1")
+        try:
+            url = "http://127.0.0.1:%d" % server.server_address[1]
+            with urlopen(url + "/metrics") as response:
+                self.assertIn(b"test_total 1", response.read())
+            with self.assertRaises(HTTPError):
+                urlopen(url + "/other")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+from types import ModuleType
+from unittest import mock
+
+from scripts import ngrok_webhook_updater
+from scripts.ngrok_webhook_updater import ngrok_command, wait_for_public_url, webhook_config
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestWaitForPublicUrl(unittest.TestCase):
+
+    def test_polls_with_backoff_until_the_https_tunnel_is_up(self):
+        clock = FakeClock()
+        answers = iter([
+            ConnectionRefusedError("ngrok not listening yet"),
+            [],
+            [{"proto": "http", "public_url": "http://abc.ngrok.app"}],
+            [{"proto": "http", "public_url": "http://abc.ngrok.app"},
+             {"proto": "https", "public_url": "https://abc.ngrok.app"}],
+        ])
+
+        def fetch():
+            answer = next(answers)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        url = wait_for_public_url(fetch, timeout=15, sleep=clock.sleep, clock=clock)
+
+        self.assertEqual(url, "https://abc.ngrok.app")
+        self.assertEqual(clock.sleeps, [0.05, 0.1, 0.2])
+
+    def test_gives_up_after_the_timeout(self):
+        clock = FakeClock()
+
+        def fetch():
+            raise ConnectionRefusedError("ngrok not listening")
+
+        with self.assertRaises(TimeoutError):
+            wait_for_public_url(fetch, timeout=3, sleep=clock.sleep, clock=clock)
+        self.assertLessEqual(clock.now, 3)
+        self.assertEqual(max(clock.sleeps), 1.0)
+
+    def test_ngrok_command_uses_port(self):
+        self.assertEqual(ngrok_command(8080)[-2:], ["http", "8080"])
+
+
+class TestWebhookUpdate(unittest.TestCase):
+
+    def test_config_keeps_the_secret(self):
+        self.assertEqual(webhook_config("https://abc.ngrok.app", "s3cret"),
+                         {"url": "https://abc.ngrok.app/webhook", "content_type": "json", "secret": "s3cret"})
+
+    def test_refuses_to_run_without_a_secret(self):
+        dotenv = ModuleType("dotenv")
+        dotenv.load_dotenv = lambda: None
+        with mock.patch.dict(sys.modules, {"dotenv": dotenv}), mock.patch.dict(os.environ, {"WEBHOOK_SECRET": ""}):
+            with mock.patch("subprocess.Popen") as popen, self.assertRaises(SystemExit):
+                ngrok_webhook_updater.main()
+        popen.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
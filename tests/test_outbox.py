@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from pika.exceptions import StreamLostError
+
+from scripts.connection_pool import ConnectionManager
+from scripts.outbox import Outbox, OutboxFlusher
+from scripts.producer import USER_CREATE_ROUTES, UserPublisher, send_user_to_rabbitmq
+
+
+def fake_manager(*channels):
+    # Hands out the same channel until the manager resets after a failure
+    manager = ConnectionManager(MagicMock(), max_retries=3, sleep=lambda seconds: None)
+    channels = list(channels)
+    manager.channel = lambda: channels[0]
+    manager.reset = lambda: channels.pop(0)
+    return manager
+
+
+def published(channel):
+    return [(call.kwargs["routing_key"], call.kwargs["body"]) for call in channel.basic_publish.call_args_list]
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "outbox.sqlite3")
+        self.outbox = Outbox(self.path)
+        self.user = {"uuid": "2025-05-16T12:00:00.000000Z", "time": "2025-05-16T12:00:00Z",
+                     "email": "rayan@example.com", "first_name": "Rayan"}
+
+    def tearDown(self):
+        self.outbox.close()
+        self.tmp.cleanup()
+
+    def test_messages_survive_a_reopen_in_order(self):
+        self.outbox.append_many([("user", "a", b"1"), ("user", "b", b"2")])
+        self.outbox.append("user", "c", b"3")
+        self.outbox.close()
+
+        self.outbox = Outbox(self.path)
+        rows = self.outbox.peek(10)
+        self.assertEqual([(exchange, key, body) for _, exchange, key, body in rows],
+                         [("user", "a", b"1"), ("user", "b", b"2"), ("user", "c", b"3")])
+        self.assertEqual(len(self.outbox), 3)
+
+    def test_drain_commits_one_transaction_per_batch(self):
+        self.outbox.append_many([("user", "key", str(i).encode()) for i in range(5)])
+        channel = MagicMock()
+        declare = MagicMock()
+        flusher = OutboxFlusher(self.outbox, fake_manager(channel), declare=declare, batch_size=2)
+
+        self.assertEqual(flusher.drain(), 5)
+
+        self.assertEqual([body for _, body in published(channel)], [b"0", b"1", b"2", b"3", b"4"])
+        self.assertEqual(channel.tx_commit.call_count, 3)
+        channel.tx_select.assert_called_once_with()
+        declare.assert_called_once_with(channel)
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(flusher.batches, 3)
+
+    def test_failed_batch_stays_in_outbox_and_is_replayed_on_a_new_channel(self):
+        self.outbox.append_many([("user", "key", str(i).encode()) for i in range(3)])
+        broken, fresh = MagicMock(), MagicMock()
+        broken.tx_commit.side_effect = StreamLostError("connection reset")
+        removed = []
+        remove_through = self.outbox.remove_through
+        self.outbox.remove_through = lambda last_id: removed.append(len(self.outbox)) or remove_through(last_id)
+        manager = fake_manager(broken, fresh)
+        flusher = OutboxFlusher(self.outbox, manager)
+
+        self.assertEqual(flusher.drain(), 3)
+
+        self.assertEqual(manager.reconnects, 1)
+        # Nothing was removed before the new channel committed the whole batch
+        self.assertEqual(removed, [3])
+        fresh.tx_select.assert_called_once_with()
+        self.assertEqual([body for _, body in published(fresh)], [b"0", b"1", b"2"])
+        self.assertEqual(len(self.outbox), 0)
+
+    def test_publisher_with_outbox_does_not_touch_the_broker(self):
+        channel = MagicMock()
+        publisher = UserPublisher(channel, outbox=self.outbox)
+
+        self.assertEqual(publisher.publish_many([self.user, self.user]), 6)
+        send_user_to_rabbitmq(self.user, None, outbox=self.outbox)
+
+        self.assertEqual(channel.method_calls, [])
+        rows = self.outbox.peek(100)
+        self.assertEqual(len(rows), 9)
+        self.assertEqual([key for _, _, key, _ in rows[:3]], list(USER_CREATE_ROUTES.values()))
+
+    def test_flusher_thread_publishes_appended_messages(self):
+        channel = MagicMock()
+        publisher = UserPublisher(outbox=self.outbox)
+        flusher = OutboxFlusher(self.outbox, fake_manager(channel), declare=publisher.declare_on,
+                                idle_interval=5).start()
+        try:
+            publisher.publish(self.user)
+            for _ in range(200):
+                if not len(self.outbox):
+                    break
+                self.outbox.wait(0.01)
+        finally:
+            flusher.stop(timeout=5)
+
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(channel.basic_publish.call_count, 3)
+        self.assertEqual(channel.queue_declare.call_count, 3)
+
+    def test_flusher_thread_survives_other_errors(self):
+        self.outbox.append("user", "key", b"1")
+        channel = MagicMock()
+        peek = self.outbox.peek
+        failures = [sqlite3.OperationalError("database is locked"), RuntimeError("declare failed")]
+
+        def flaky_peek(limit):
+            if failures:
+                raise failures.pop(0)
+            return peek(limit)
+
+        self.outbox.peek = flaky_peek
+        flusher = OutboxFlusher(self.outbox, fake_manager(channel), idle_interval=0.01)
+        with self.assertLogs("Outbox", "ERROR") as logs:
+            flusher.start()
+            try:
+                for _ in range(500):
+                    if not len(self.outbox):
+                        break
+                    self.outbox.wait(0.01)
+            finally:
+                flusher.stop(timeout=5)
+
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn("database is locked", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+from xml.etree.ElementTree import ParseError
+
+from fake_broker import FakeConnection, start, user_message, wait_for
+from scripts.consumer_service import ConsumerService
+from scripts.parse_pool import ParsePool, parse_chunk
+
+
+class TestParsePool(unittest.TestCase):
+
+    def test_parse_chunk_keeps_errors_in_place(self):
+        results = parse_chunk([user_message("CREATE", "a"), b"<broken", user_message("DELETE", "b")])
+        self.assertEqual(results[0][1].uuid, "a")
+        self.assertIsInstance(results[1], ParseError)
+        self.assertEqual(results[2][0], "DELETE")
+
+    def test_map_returns_results_in_input_order(self):
+        bodies = [user_message("UPDATE", "u%d" % i) for i in range(100)]
+        with ParsePool(workers=2, chunk_size=7) as pool:
+            results = list(pool.map(bodies))
+        self.assertEqual([user.uuid for _, user in results], ["u%d" % i for i in range(100)])
+
+
+class TestConsumerServiceWithParsePool(unittest.IsolatedAsyncioTestCase):
+
+    async def test_pool_parsed_messages_are_handled_and_acked(self):
+        connection = FakeConnection()
+        seen = []
+
+        async def connect():
+            return connection
+
+        with ParsePool(workers=2, chunk_size=8) as pool:
+            service = ConsumerService(handler=lambda action, user: seen.append(user.uuid), connect=connect,
+                                      prefetch=50, workers=4, ack_batch=10, ack_interval=0.01, parse_pool=pool)
+            task, channel = await start(service, connection)
+            for i in range(40):
+                await channel.deliver("frontend_user_create", user_message("CREATE", "u%d" % i))
+            await channel.deliver("frontend_user_create", b"<broken")
+
+            await wait_for(lambda: service.processed + service.failed == 41)
+            service.stop()
+            await task
+
+        self.assertEqual(sorted(seen), sorted("u%d" % i for i in range(40)))
+        self.assertEqual(service.failed, 1)
+        self.assertEqual(channel.outstanding, {})
+        self.assertEqual(channel.settled[41], "reject")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,12 @@
+import os
+import subprocess
+import sys
 import unittest
 from unittest.mock import MagicMock
-from scripts.producer import send_user_to_rabbitmq, generate_user_xml
+from pika.exceptions import StreamLostError
+from scripts.connection_pool import ConnectionManager
+from scripts.producer import UserPublisher, send_user_to_rabbitmq, generate_user_xml
+from scripts.user_record import UserRecord
 
 class TestProducer(unittest.TestCase):
 
@@ -47,5 +53,82 @@ class TestProducer(unittest.TestCase):
         self.assertIn("<BusinessName>MyCompany</BusinessName>", xml)
         self.assertIn("<UUID>2025-05-16T12:00:00.000000Z</UUID>", xml)
 
+    def test_generate_user_xml_accepts_user_record(self):
+        record = UserRecord.from_dict(self.user)
+        self.assertEqual(generate_user_xml(record), generate_user_xml(self.user))
+
+    def test_send_user_to_rabbitmq_declares_topology_once_per_channel(self):
+        for _ in range(5):
+            send_user_to_rabbitmq(self.user, self.mock_channel)
+
+        self.assertEqual(self.mock_channel.queue_declare.call_count, 3)
+        self.assertEqual(self.mock_channel.queue_bind.call_count, 3)
+        self.assertEqual(self.mock_channel.basic_publish.call_count, 15)
+
+
+class TestUserPublisher(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_channel = MagicMock()
+        self.user = {"uuid": "u1", "first_name": "Rayan", "phone": "+32470123456"}
+
+    def test_publish_many_commits_per_window(self):
+        publisher = UserPublisher(self.mock_channel, confirm_window=30)
+
+        published = publisher.publish_many([self.user] * 25)
+
+        self.assertEqual(published, 75)
+        self.assertEqual(self.mock_channel.basic_publish.call_count, 75)
+        self.mock_channel.tx_select.assert_called_once_with()
+        # 75 messages in windows of 30 -> commits after 30, 60 and the final 15
+        self.assertEqual(self.mock_channel.tx_commit.call_count, 3)
+        self.assertEqual(self.mock_channel.queue_declare.call_count, 3)
+
+    def test_publish_after_publish_many_is_committed(self):
+        publisher = UserPublisher(self.mock_channel)
+        publisher.publish_many([self.user])
+        publisher.publish(self.user)
+
+        self.assertEqual(self.mock_channel.tx_commit.call_count, 2)
+        self.mock_channel.tx_select.assert_called_once_with()
+
+    def test_publish_reuses_body_for_all_routes(self):
+        UserPublisher(self.mock_channel).publish(self.user)
+
+        bodies = {call.kwargs["body"] for call in self.mock_channel.basic_publish.call_args_list}
+        self.assertEqual(len(bodies), 1)
+        self.mock_channel.tx_commit.assert_not_called()
+
+    def test_publish_many_resends_window_after_reconnect(self):
+        broken, fresh = MagicMock(), MagicMock()
+        broken.tx_commit.side_effect = StreamLostError("connection reset")
+        manager = ConnectionManager(MagicMock(), max_retries=3, sleep=lambda seconds: None)
+        channels = iter([broken, fresh])
+        manager.channel = lambda: next(channels)
+
+        publisher = UserPublisher(manager=manager, confirm_window=30)
+        published = publisher.publish_many([self.user] * 10)
+
+        self.assertEqual(published, 30)
+        self.assertEqual(manager.reconnects, 1)
+        # The new channel gets the topology again and the whole window, in a new transaction
+        self.assertEqual(fresh.queue_declare.call_count, 3)
+        fresh.tx_select.assert_called_once_with()
+        self.assertEqual(fresh.basic_publish.call_count, 30)
+        fresh.tx_commit.assert_called_once_with()
+
+
+class TestImportSideEffects(unittest.TestCase):
+
+    def test_importing_the_producer_does_not_load_pika(self):
+        # pika is imported on the first publish, not at import time
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, scripts.producer; print('pika' in sys.modules)"],
+            cwd=root, capture_output=True, text=True, check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "False")
+
+
 if __name__ == "__main__":
     unittest.main()
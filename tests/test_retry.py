@@ -0,0 +1,144 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from fake_broker import FakeConnection, start, user_message, wait_for
+from scripts.consumer_service import ConsumerService
+from scripts.retry import RetryScheduler, replay, retry_queue_arguments, tier_name
+
+
+class TestRetryScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def run_service(self, deliveries, handler, retry):
+        connection = FakeConnection()
+
+        async def connect():
+            return connection
+
+        service = ConsumerService(handler=handler, connect=connect, prefetch=20, workers=2, ack_batch=5,
+                                  ack_interval=0.01, retry=retry)
+        task, channel = await start(service, connection)
+        for body, headers in deliveries:
+            await channel.deliver("frontend_user_create", body, headers)
+        await wait_for(lambda: service.processed + service.failed == len(deliveries))
+        service.stop()
+        await task
+        return service, channel
+
+    def published(self, channel):
+        return [(routing_key, message.headers) for routing_key, message in channel.default_exchange.published]
+
+    async def test_declares_delay_tiers_that_dead_letter_back_to_the_queue(self):
+        retry = RetryScheduler(delays=(5, 30), dead_letter_queue="dlq")
+        _, channel = await self.run_service([], lambda action, user: None, retry)
+
+        tier = channel.queues["frontend_user_update.retry.30s"]
+        self.assertEqual(tier.arguments, {
+            "x-message-ttl": 30000, "x-dead-letter-exchange": "", "x-dead-letter-routing-key": "frontend_user_update",
+        })
+        self.assertIn("dlq", channel.queues)
+
+    async def test_failures_are_retried_at_growing_delays_then_dead_lettered(self):
+        def handler(action, user):
+            raise ValueError("WordPress is down")
+
+        retry = RetryScheduler(delays=(5, 30, 180), max_attempts=4, dead_letter_queue="dlq", clock=lambda: 0)
+        body = user_message("CREATE", "u1")
+        service, channel = await self.run_service([
+            (body, None),
+            (body, {"x-attempts": 1, "x-original-queue": "frontend_user_create"}),
+            (body, {"x-attempts": 2, "x-original-queue": "frontend_user_create"}),
+            (body, {"x-attempts": 3, "x-original-queue": "frontend_user_create"}),
+        ], handler, retry)
+
+        published = self.published(channel)
+        self.assertEqual([key for key, _ in published], [
+            "frontend_user_create.retry.5s", "frontend_user_create.retry.30s", "frontend_user_create.retry.180s", "dlq",
+        ])
+        self.assertEqual([headers["x-attempts"] for _, headers in published], [1, 2, 3, 4])
+        dead = published[-1][1]
+        self.assertEqual((dead["x-error-type"], dead["x-error"]), ("ValueError", "WordPress is down"))
+        self.assertEqual(dead["x-failed-at"], "1970-01-01T00:00:00+00:00")
+        # The originals are acked once their copy is published, never rejected
+        self.assertEqual(set(channel.settled.values()), {"ack"})
+        self.assertEqual((retry.retried, retry.dead_lettered, service.failed), (3, 1, 4))
+
+    async def test_unparsable_message_goes_straight_to_the_dead_letter_queue(self):
+        retry = RetryScheduler(delays=(5,), dead_letter_queue="dlq")
+        _, channel = await self.run_service([(b"<not xml", None)], lambda action, user: None, retry)
+
+        (key, headers), = self.published(channel)
+        self.assertEqual((key, headers["x-attempts"], headers["x-error-type"]), ("dlq", 1, "ParseError"))
+        self.assertEqual(headers["x-original-queue"], "frontend_user_create")
+
+    async def test_failed_publish_falls_back_to_reject(self):
+        retry = RetryScheduler(delays=(5,))
+
+        def handler(action, user):
+            raise ValueError("boom")
+
+        async def broken_publish(message, routing_key):
+            raise ConnectionError("channel closed")
+
+        connection = FakeConnection()
+
+        async def connect():
+            return connection
+
+        service = ConsumerService(handler=handler, connect=connect, prefetch=5, workers=1, ack_interval=0.01,
+                                  retry=retry)
+        task, channel = await start(service, connection)
+        channel.default_exchange.publish = broken_publish
+        await channel.deliver("frontend_user_create", user_message("CREATE", "u1"))
+        await wait_for(lambda: service.failed == 1)
+        service.stop()
+        await task
+
+        self.assertEqual(channel.settled, {1: "reject"})
+
+    def test_tier_names(self):
+        self.assertEqual(tier_name("q", 5.0), "q.retry.5s")
+        self.assertEqual(tier_name("q", 0.5), "q.retry.0.5s")
+        self.assertEqual(retry_queue_arguments("q", 0.5)["x-message-ttl"], 500)
+
+
+def dead_letter(tag, origin, error="boom"):
+    headers = {"x-attempts": 4, "x-original-queue": origin, "x-error": error, "x-error-type": "ValueError",
+               "x-failed-at": "2025-05-16T12:00:00+00:00", "trace": "abc"}
+    return SimpleNamespace(delivery_tag=tag), SimpleNamespace(headers=headers, content_type="text/xml"), b"<x/>"
+
+
+class TestReplay(unittest.TestCase):
+
+    def channel(self, *messages):
+        channel = MagicMock()
+        channel.queue_declare.return_value.method.message_count = len(messages)
+        channel.basic_get.side_effect = list(messages) + [(None, None, None)]
+        return channel
+
+    def test_replays_to_the_original_queue_with_a_fresh_counter(self):
+        channel = self.channel(dead_letter(1, "frontend_user_create"), dead_letter(2, "frontend_user_update"))
+
+        replayed = replay(channel, "dlq")
+
+        self.assertEqual(replayed, [("frontend_user_create", "boom"), ("frontend_user_update", "boom")])
+        publish = channel.basic_publish.call_args_list[0].kwargs
+        self.assertEqual((publish["exchange"], publish["routing_key"]), ("", "frontend_user_create"))
+        self.assertEqual(publish["properties"].headers, {"trace": "abc"})
+        self.assertEqual([call.args[0] for call in channel.basic_ack.call_args_list], [1, 2])
+        channel.basic_nack.assert_not_called()
+
+    def test_filter_and_list_leave_the_rest_in_the_dead_letter_queue(self):
+        channel = self.channel(dead_letter(1, "frontend_user_create"), dead_letter(2, "frontend_user_update"))
+        self.assertEqual(replay(channel, "dlq", queue="frontend_user_update"), [("frontend_user_update", "boom")])
+        channel.basic_ack.assert_called_once_with(2)
+        channel.basic_nack.assert_called_once_with(0, multiple=True, requeue=True)
+
+        channel = self.channel(dead_letter(1, "frontend_user_create"))
+        self.assertEqual(replay(channel, "dlq", dry_run=True), [("frontend_user_create", "boom")])
+        channel.basic_publish.assert_not_called()
+        channel.basic_nack.assert_called_once_with(0, multiple=True, requeue=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
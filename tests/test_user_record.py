@@ -0,0 +1,74 @@
+import pickle
+import unittest
+from xml.etree.ElementTree import fromstring
+
+from scripts.user_record import BusinessInfo, UserRecord, as_user_record
+
+
+class TestUserRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.user = {
+            "uuid": "2025-05-16T12:00:00.000000Z",
+            "time": "2025-05-16T12:00:00Z",
+            "password": "hashed",
+            "first_name": "Rayan",
+            "last_name": "Haddou",
+            "phone": "+32470123456",
+            "email": "rayan@example.com",
+            "business_name": "MyCompany",
+            "business_email": "biz@example.com",
+            "real_address": "Main St 1",
+            "btw_number": "BE123456789",
+            "facturation_address": "Invoice St 5"
+        }
+
+    def test_dict_round_trip(self):
+        record = UserRecord.from_dict(self.user)
+        self.assertEqual(record.business.name, "MyCompany")
+        self.assertEqual(record.to_dict(), self.user)
+
+    def test_mapping_like_the_old_dicts(self):
+        record = UserRecord.from_dict(self.user)
+        self.assertIn("email", record)
+        self.assertIn("business_name", UserRecord(uuid="abc"))
+        self.assertNotIn("unknown", record)
+        self.assertEqual(dict(record), self.user)
+        self.assertEqual(list(record), list(self.user))
+        self.assertEqual(dict(record.items()), self.user)
+        self.assertEqual(len(record), len(self.user))
+
+    def test_phone_number_alias(self):
+        record = UserRecord.from_dict({"phone_number": "+32470123456"})
+        self.assertEqual(record.phone, "+32470123456")
+        self.assertEqual(record["phone_number"], "+32470123456")
+        self.assertEqual(record.get("phone"), "+32470123456")
+
+    def test_item_access_without_business(self):
+        record = UserRecord(uuid="abc")
+        self.assertIsNone(record["business_name"])
+        self.assertEqual(record.get("unknown", "x"), "x")
+        with self.assertRaises(KeyError):
+            record["unknown"]
+
+    def test_from_element(self):
+        action, record = UserRecord.from_element(fromstring(
+            "<UserMessage><ActionType>CREATE</ActionType><UUID>u1</UUID>"
+            "<Business><BTWNumber>BE1</BTWNumber></Business></UserMessage>"
+        ))
+        self.assertEqual(action, "CREATE")
+        self.assertEqual(record.uuid, "u1")
+        self.assertEqual(record.business, BusinessInfo(btw_number="BE1"))
+
+    def test_records_are_slotted_and_picklable(self):
+        record = UserRecord.from_dict(self.user)
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+
+    def test_as_user_record_keeps_records(self):
+        record = UserRecord(uuid="abc")
+        self.assertIs(as_user_record(record), record)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,22 @@
 # tests/test_user_utils.py
 
-from app.user_utils import validate_user
+import unittest
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+from app.user_utils import (
+    INVALID_FIRST_NAME,
+    INVALID_LAST_NAME,
+    INVALID_PHONE_NUMBER,
+    error_messages,
+    validate_columns,
+    validate_user,
+    validate_users
+)
+from scripts.user_record import UserRecord
 
 def test_valid_user():
     user = {
@@ -33,3 +49,44 @@ def test_invalid_phone_number():
         "phone_number": "abcde12345"
     }
     assert "Invalid phone number" in validate_user(user)
+
+def test_validate_user_record():
+    user = UserRecord(first_name="Weiam", last_name="Almahnash", phone="+32470123456")
+    assert validate_user(user) == []
+    user.phone = "123"
+    assert validate_user(user) == ["Invalid phone number"]
+
+def test_validate_users_returns_bitmasks():
+    users = [
+        {"first_name": "Weiam", "last_name": "Almahnash", "phone_number": "+32470123456"},
+        {"first_name": "", "last_name": "123", "phone_number": "abc"},
+        UserRecord(first_name="Rayan", last_name="Haddou", phone="0498123"),
+    ]
+    masks = validate_users(iter(users), batch_size=2)
+    assert list(masks) == [0, INVALID_FIRST_NAME | INVALID_LAST_NAME | INVALID_PHONE_NUMBER, INVALID_PHONE_NUMBER]
+    assert error_messages(masks[2]) == ["Invalid phone number"]
+
+def test_validate_columns_matches_validate_user():
+    masks = validate_columns(["Weiam", None, "Jo3"], ["Doe", "Doe", "Doe"], ["0498123456", "0498123456", None])
+    assert list(masks) == [0, INVALID_FIRST_NAME, INVALID_FIRST_NAME | INVALID_PHONE_NUMBER]
+
+def test_validate_user_and_validate_users_agree():
+    # validate_user keeps its own single-row path; both must apply the same rules
+    values = ["Weiam", "", None, "Jo3", "Élodie", "O'Neil", "+32470123456", "0498123", "1234567890123456"]
+    phones = ["+32470123456", "0498123456", "", None, "abc", "+3247012345a", "12345678", "123456789012345",
+              "1234567890123456", "++32470123456"]
+    users = [{"first_name": first, "last_name": last, "phone_number": phone}
+             for first in values for last in values[:4] for phone in phones]
+    users.append(UserRecord(first_name="Rayan", last_name="", phone="0498123456"))
+    masks = validate_users(users)
+    assert [validate_user(user) for user in users] == [error_messages(mask) for mask in masks]
+
+@unittest.skipUnless(pandas, "pandas not installed")
+def test_validate_users_dataframe():
+    frame = pandas.DataFrame({
+        "first_name": ["Weiam", "", None],
+        "last_name": ["Almahnash", "Smith", "Doe"],
+        "phone_number": ["+32470123456", "0498123456", "abcde12345"],
+    })
+    masks = validate_users(frame)
+    assert masks.tolist() == [0, INVALID_FIRST_NAME, INVALID_FIRST_NAME | INVALID_PHONE_NUMBER]
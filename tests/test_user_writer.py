@@ -0,0 +1,234 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from scripts.user_record import BusinessInfo, UserRecord
+from scripts.user_writer import BulkUserWriter, DatabasePool, WriteBuffer, nicename, phpass_hash, split_runs
+
+SCHEMA = """
+CREATE TABLE wp_users (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_login TEXT NOT NULL DEFAULT '',
+    user_pass TEXT NOT NULL DEFAULT '',
+    user_nicename TEXT NOT NULL DEFAULT '',
+    user_email TEXT NOT NULL DEFAULT '',
+    user_url TEXT NOT NULL DEFAULT '',
+    user_registered TEXT NOT NULL DEFAULT '',
+    user_activation_key TEXT NOT NULL DEFAULT '',
+    user_status INTEGER NOT NULL DEFAULT 0,
+    display_name TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE wp_usermeta (
+    umeta_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL DEFAULT 0,
+    meta_key TEXT,
+    meta_value TEXT
+);
+"""
+
+
+def user(uuid, **fields):
+    fields.setdefault("email", "%s@example.com" % uuid)
+    return UserRecord(uuid=uuid, time="2025-05-16T12:00:00Z", **fields)
+
+
+class TestBulkUserWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "wordpress.sqlite3")
+        with sqlite3.connect(self.path) as db:
+            db.executescript(SCHEMA)
+        self.statements = []
+
+        def connect():
+            connection = sqlite3.connect(self.path)
+            connection.set_trace_callback(self.statements.append)
+            return connection
+
+        self.pool = DatabasePool(connect, size=2)
+        self.writer = BulkUserWriter(self.pool, dialect="sqlite", clock=lambda: 1747396800)
+        self.db = sqlite3.connect(self.path)
+
+    def tearDown(self):
+        self.db.close()
+        self.pool.close()
+        self.directory.cleanup()
+
+    def meta(self, uuid):
+        user_id = self.db.execute("SELECT user_id FROM wp_usermeta WHERE meta_key = 'UUID' AND meta_value = ?",
+                                  (uuid,)).fetchone()[0]
+        return user_id, dict(self.db.execute("SELECT meta_key, meta_value FROM wp_usermeta WHERE user_id = ?",
+                                             (user_id,)).fetchall())
+
+    def test_creates_users_with_meta_in_a_few_statements(self):
+        self.writer.write([("CREATE", user("u0", first_name="Rayan", phone="+32470123456",
+                                           business=BusinessInfo(name="Acme")))])
+        self.statements.clear()
+
+        errors = self.writer.write([("CREATE", user("u%d" % i, first_name="Rayan")) for i in range(1, 201)])
+
+        self.assertEqual(errors, [None] * 200)
+        # 200 users and 2800 meta rows: lookups, inserts of up to 500 rows and the commit
+        self.assertLessEqual(len([sql for sql in self.statements if sql.startswith(("SELECT", "INSERT"))]), 10)
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM wp_users").fetchone()[0], 201)
+        user_id, meta = self.meta("u0")
+        self.assertEqual(meta["phone_number"], "+32470123456")
+        self.assertEqual(meta["business_name"], "Acme")
+        self.assertEqual(meta["wp_capabilities"], 'a:1:{s:10:"subscriber";b:1;}')
+        self.assertEqual(self.db.execute("SELECT display_name FROM wp_users WHERE ID = ?", (user_id,)).fetchone()[0],
+                         "Rayan")
+
+    def test_existing_email_is_not_created_twice(self):
+        self.writer.write([("CREATE", user("u1"))])
+        self.writer.write([("CREATE", user("u2", email="u1@example.com"))])
+
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM wp_users").fetchone()[0], 1)
+
+    def test_update_only_changes_fields_in_the_message(self):
+        self.writer.write([("CREATE", user("u1", password="$P$old", first_name="Rayan", phone="+32470000000"))])
+
+        self.writer.write([("UPDATE", UserRecord(uuid="u1", email="new@example.com", phone="+32470999999"))])
+
+        user_id, meta = self.meta("u1")
+        email, stored = self.db.execute("SELECT user_email, user_pass FROM wp_users WHERE ID = ?",
+                                        (user_id,)).fetchone()
+        self.assertEqual(email, "new@example.com")
+        self.assertEqual(phpass_hash("$P$old", stored), stored)
+        self.assertEqual((meta["phone_number"], meta["first_name"]), ("+32470999999", "Rayan"))
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM wp_usermeta WHERE user_id = ? AND meta_key = ?",
+                                         (user_id, "phone_number")).fetchone()[0], 1)
+
+    def test_delete_removes_user_and_meta(self):
+        self.writer.write([("CREATE", user("u1")), ("CREATE", user("u2"))])
+
+        self.writer.write([("DELETE", UserRecord(uuid="u1")), ("DELETE", UserRecord(uuid="missing"))])
+
+        self.assertEqual([row[0] for row in self.db.execute("SELECT user_email FROM wp_users")], ["u2@example.com"])
+        self.assertIsNone(self.db.execute("SELECT 1 FROM wp_usermeta WHERE meta_value = 'u1'").fetchone())
+
+    def test_changes_for_the_same_user_apply_in_order(self):
+        self.writer.write([
+            ("CREATE", user("u1", first_name="Rayan")),
+            ("UPDATE", UserRecord(uuid="u1", first_name="Ray")),
+            ("CREATE", user("u2")),
+            ("DELETE", UserRecord(uuid="u2")),
+        ])
+
+        self.assertEqual(self.meta("u1")[1]["first_name"], "Ray")
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM wp_users").fetchone()[0], 1)
+
+    def test_failed_batch_falls_back_to_single_changes(self):
+        self.db.execute("DROP TABLE wp_usermeta")
+        self.db.execute("CREATE TABLE wp_usermeta (umeta_id INTEGER PRIMARY KEY, user_id INTEGER, meta_key TEXT, "
+                        "meta_value TEXT CHECK (meta_value != 'boom'))")
+        self.db.commit()
+
+        errors = self.writer.write([("CREATE", user("u1")), ("CREATE", user("u2", first_name="boom"))])
+
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], sqlite3.IntegrityError)
+        self.assertEqual([row[0] for row in self.db.execute("SELECT user_email FROM wp_users")], ["u1@example.com"])
+        self.assertIsNone(self.db.execute("SELECT 1 FROM wp_usermeta WHERE meta_value = 'u2'").fetchone())
+
+    def test_invalid_changes_are_rejected_on_their_own(self):
+        long_email = "a" * 95 + "@x.be"
+        errors = self.writer.write([
+            ("CREATE", UserRecord(uuid="no-email", time="2025-05-16T12:00:00Z")),
+            ("CREATE", user("u1")),
+            ("CREATE", user("long", email=long_email)),
+            ("UPDATE", UserRecord(uuid="u1", email=long_email + "x")),
+        ])
+
+        self.assertEqual(errors, ["missing EmailAddress", None, "EmailAddress longer than 60 characters (user_login)",
+                                  "EmailAddress longer than 100 characters"])
+        self.assertEqual([row[0] for row in self.db.execute("SELECT user_email FROM wp_users")], ["u1@example.com"])
+
+    def test_create_derives_nicename_and_hashes_the_password(self):
+        email = "Jean.Dupont+" + "x" * 60 + "@example.com"
+        self.writer.write([("CREATE", user("u1", email=email[:60], password="secret"))])
+
+        login, stored, name = self.db.execute("SELECT user_login, user_pass, user_nicename FROM wp_users").fetchone()
+        self.assertEqual(login, email[:60])
+        self.assertEqual(name, "jean-dupontxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx")
+        self.assertEqual(name, nicename(email[:60]))
+        self.assertTrue(stored.startswith("$P$"))
+        self.assertEqual(phpass_hash("secret", stored), stored)
+
+    def test_existing_email_check_ignores_case(self):
+        self.writer.write([("CREATE", user("u1", email="Rayan@Example.com"))])
+        self.writer.write([("CREATE", user("u2", email="rayan@example.com")),
+                           ("CREATE", user("u3", email="NEW@example.com")),
+                           ("CREATE", user("u4", email="new@example.com"))])
+
+        self.assertEqual([row[0] for row in self.db.execute("SELECT user_email FROM wp_users ORDER BY ID")],
+                         ["Rayan@Example.com", "NEW@example.com"])
+
+
+class TestPasswords(unittest.TestCase):
+
+    def test_phpass_matches_a_known_hash(self):
+        self.assertEqual(phpass_hash("test12345", "$P$9IQRaTwmfeRo7ud9Fh4E2PdI0S3r.L0"),
+                         "$P$9IQRaTwmfeRo7ud9Fh4E2PdI0S3r.L0")
+
+    def test_nicename_follows_sanitize_title(self):
+        self.assertEqual(nicename("john.doe@example.com"), "john-doeexample-com")
+        self.assertEqual(nicename("Émile Zola@ex.be"), "emile-zolaex-be")
+
+class TestBatching(unittest.TestCase):
+
+    def test_split_runs_starts_a_new_run_when_a_user_repeats(self):
+        changes = [("CREATE", UserRecord(uuid="a")), ("CREATE", UserRecord(uuid="b")),
+                   ("UPDATE", UserRecord(uuid="a")), ("DELETE", UserRecord(uuid="c"))]
+        self.assertEqual([[u.uuid for _, u in run] for run in split_runs(changes)], [["a", "b"], ["a", "c"]])
+
+    def test_write_buffer_flushes_on_size_and_age(self):
+        batches = []
+        now = [0.0]
+        buffer = WriteBuffer(lambda batch: batches.append(len(batch)), batch_size=3, max_delay=1.0,
+                             clock=lambda: now[0], timer=False)
+
+        for _ in range(4):
+            buffer.add("CREATE", UserRecord(uuid="u"))
+        now[0] = 1.5
+        buffer.add("CREATE", UserRecord(uuid="u"))
+
+        self.assertEqual(batches, [3, 2])
+
+    def test_write_buffer_poll_flushes_a_quiet_stream(self):
+        batches = []
+        now = [0.0]
+        buffer = WriteBuffer(lambda batch: batches.append(len(batch)), batch_size=10, max_delay=1.0,
+                             clock=lambda: now[0], timer=False)
+
+        buffer.add("CREATE", UserRecord(uuid="a"))
+        buffer.add("CREATE", UserRecord(uuid="b"))
+        now[0] = 0.5
+        buffer.poll()
+        self.assertEqual(batches, [])
+
+        now[0] = 1.0
+        buffer.poll()
+        self.assertEqual(batches, [2])
+
+    def test_write_buffer_timer_flushes_without_another_add(self):
+        flushed = threading.Event()
+        batches = []
+
+        def writer(batch):
+            batches.append(len(batch))
+            flushed.set()
+
+        buffer = WriteBuffer(writer, batch_size=10, max_delay=0.05)
+        buffer.add("CREATE", UserRecord(uuid="a"))
+
+        self.assertTrue(flushed.wait(5))
+        self.assertEqual(batches, [1])
+        buffer.flush()
+        self.assertEqual(batches, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import hashlib
+import hmac
+import json
+import subprocess
+import threading
+import unittest
+from http.client import HTTPConnection
+
+from scripts import webhook_listener
+
+SECRET = "It's a Secret to Everybody"
+
+
+def sign(body, secret=SECRET):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class BlockingDeploy:
+    # Deploy stand-in that waits until the test releases it
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+
+
+class TestSignature(unittest.TestCase):
+
+    def test_github_example_signature(self):
+        # Example from the GitHub webhook documentation
+        self.assertTrue(webhook_listener.verify_signature(
+            SECRET, b"Hello, World!",
+            "sha256=757107ea0eb2509fc211221cce984b8a37570b6d7586c22c46f4379c8b043e17",
+        ))
+        self.assertFalse(webhook_listener.verify_signature(SECRET, b"Hello, World?", sign(b"Hello, World!")))
+        self.assertFalse(webhook_listener.verify_signature("", b"", sign(b"", "")))
+        self.assertFalse(webhook_listener.verify_signature(SECRET, b"", None))
+
+    def test_push_ref_ignores_base_ref(self):
+        body = b'{"base_ref": "refs/heads/dev", "ref" : "refs/heads/main", "after": "abc"}'
+        self.assertEqual(webhook_listener.push_ref(body), "refs/heads/main")
+        self.assertIsNone(webhook_listener.push_ref(b"{}"))
+
+
+class TestDeployQueue(unittest.TestCase):
+
+    def test_pushes_during_deploy_coalesce_into_one_follow_up(self):
+        deploy = BlockingDeploy()
+        queue = webhook_listener.DeployQueue(deploy)
+
+        self.assertTrue(queue.request("refs/heads/main", "a1"))
+        self.assertTrue(deploy.started.wait(5))
+        # Three pushes while the first deploy runs: one new deploy, two merged into it
+        self.assertTrue(queue.request("refs/heads/main", "b2"))
+        self.assertFalse(queue.request("refs/heads/main", "c3"))
+        self.assertFalse(queue.request("refs/heads/main", "d4"))
+
+        status = queue.status()
+        self.assertEqual(status["current"]["commit"], "a1")
+        self.assertEqual(status["pending"]["pushes"], 3)
+
+        deploy.release.set()
+        self.assertTrue(queue.wait_idle(5))
+        self.assertEqual(deploy.calls, 2)
+        self.assertEqual(queue.status()["last"]["commit"], "d4")
+        self.assertEqual(queue.status()["last"]["status"], "succeeded")
+
+    def test_failed_deploy_is_reported(self):
+        def deploy():
+            raise subprocess.CalledProcessError(1, ["git", "pull"], stderr="merge conflict\n")
+
+        queue = webhook_listener.DeployQueue(deploy)
+        queue.request("refs/heads/main")
+        self.assertTrue(queue.wait_idle(5))
+
+        last = queue.status()["last"]
+        self.assertEqual((last["status"], last["error"]), ("failed", "merge conflict"))
+
+
+class TestWebhookServer(unittest.TestCase):
+
+    def setUp(self):
+        self.deploy = BlockingDeploy()
+        self.deploy.release.set()
+        self.queue = webhook_listener.DeployQueue(self.deploy)
+        self.server = webhook_listener.create_server(self.queue, SECRET, host="127.0.0.1", port=0, max_body=4096)
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def tearDown(self):
+        self.queue.wait_idle(5)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, path, body=None, headers=None):
+        connection = HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=5)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def push(self, payload, event="push", signature=None):
+        body = json.dumps(payload).encode() if not isinstance(payload, bytes) else payload
+        return self.request("POST", "/webhook", body, {
+            "Content-Type": "application/json",
+            "X-GitHub-Event": event,
+            "X-Hub-Signature-256": signature or sign(body),
+        })
+
+    def test_push_to_main_returns_202_and_deploys_in_background(self):
+        status, _ = self.push({"ref": "refs/heads/main", "after": "abc"})
+
+        self.assertEqual(status, 202)
+        self.assertTrue(self.queue.wait_idle(5))
+        self.assertEqual(self.deploy.calls, 1)
+        status, body = self.request("GET", "/status")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["last"]["commit"], "abc")
+        self.assertIsNone(json.loads(body)["current"])
+
+    def test_status_does_not_expose_deploy_output(self):
+        def deploy():
+            raise subprocess.CalledProcessError(1, ["git", "pull"],
+                                                stderr="fatal: /srv/frontend: https://token@github.com\n")
+
+        self.queue.deploy = deploy
+        self.push({"ref": "refs/heads/main", "after": "abc"})
+        self.assertTrue(self.queue.wait_idle(5))
+
+        status, body = self.request("GET", "/status")
+        last = json.loads(body)["last"]
+        self.assertEqual((status, last["status"]), (200, "failed"))
+        self.assertNotIn("error", last)
+        self.assertNotIn(b"github.com", body)
+        self.assertIn("github.com", self.queue.status()["last"]["error"])
+
+    def test_push_to_other_branch_is_ignored(self):
+        status, _ = self.push({"ref": "refs/heads/dev"})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self.deploy.calls, 0)
+
+    def test_invalid_signature_is_rejected(self):
+        status, _ = self.push({"ref": "refs/heads/main"}, signature=sign(b"something else"))
+
+        self.assertEqual(status, 401)
+        self.assertEqual(self.deploy.calls, 0)
+
+    def test_other_events_are_ignored_without_reading_the_body(self):
+        status, body = self.push({"ref": "refs/heads/main"}, event="issues", signature="sha256=00")
+
+        self.assertEqual((status, body), (200, b"Ignored, issues event"))
+        self.assertEqual(self.deploy.calls, 0)
+
+    def test_ping_is_answered(self):
+        self.assertEqual(self.push({"zen": "Keep it logically awesome."}, event="ping"), (200, b"pong"))
+
+    def test_oversized_body_is_refused(self):
+        status, _ = self.push({"ref": "refs/heads/main", "padding": "x" * 5000})
+
+        self.assertEqual(status, 413)
+        self.assertEqual(self.deploy.calls, 0)
+
+    def test_metrics_endpoint(self):
+        status, body = self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertIn(b"deploy", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_broker import FakeConnection, start, user_message, wait_for
+from scripts.consumer_service import ConsumerService
+from scripts.user_record import UserRecord
+from scripts.wordpress_sidecar import BatchingSink, SyncError, WordPressClient
+
+
+class RecordingWriter:
+
+    def __init__(self, fail=()):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, changes):
+        self.batches.append([(action, user.uuid) for action, user in changes])
+        return ["rejected" if user.uuid in self.fail else None for _, user in changes]
+
+
+class TestBatchingSink(unittest.IsolatedAsyncioTestCase):
+
+    async def test_changes_are_written_in_order_in_bounded_batches(self):
+        writer = RecordingWriter()
+        sink = BatchingSink(writer, max_batch=2, max_delay=0.01)
+
+        await asyncio.gather(*(sink.submit("CREATE", UserRecord(uuid="u%d" % i)) for i in range(5)))
+
+        self.assertEqual([len(batch) for batch in writer.batches], [2, 2, 1])
+        self.assertEqual([uuid for batch in writer.batches for _, uuid in batch], ["u%d" % i for i in range(5)])
+
+    async def test_only_the_failed_change_raises(self):
+        sink = BatchingSink(RecordingWriter(fail={"bad"}), max_batch=2, max_delay=0.01)
+
+        results = await asyncio.gather(
+            sink.submit("CREATE", UserRecord(uuid="ok")),
+            sink.submit("CREATE", UserRecord(uuid="bad")),
+            return_exceptions=True,
+        )
+
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], SyncError)
+
+    async def test_consumer_acks_after_the_batch_is_written(self):
+        connection = FakeConnection()
+        writer = RecordingWriter(fail={"bad"})
+
+        async def connect():
+            return connection
+
+        service = ConsumerService(handler=BatchingSink(writer, max_batch=4, max_delay=0.01), connect=connect,
+                                  prefetch=10, workers=10, ack_batch=5, ack_interval=0.01)
+        task, channel = await start(service, connection)
+
+        for uuid in ("u1", "u2", "bad", "u3", "u4", "u5"):
+            await channel.deliver("frontend_user_create", user_message("CREATE", uuid))
+
+        await wait_for(lambda: service.processed + service.failed == 6)
+        service.stop()
+        await task
+
+        self.assertEqual(sum(len(batch) for batch in writer.batches), 6)
+        self.assertLess(len(writer.batches), 6)
+        self.assertEqual(channel.outstanding, {})
+        self.assertEqual(channel.settled[3], "reject")
+        self.assertEqual(service.processed, 5)
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        SyncHandler.requests.append((self.headers["X-Sync-Secret"], body))
+        if self.headers["X-Sync-Secret"] != "s3cret":
+            self.send_error(403)
+            return
+        results = [{"ok": change["user"]["uuid"] != "bad", "error": "nope"} for change in body["changes"]]
+        data = json.dumps({"results": results}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestWordPressClient(unittest.TestCase):
+
+    def setUp(self):
+        SyncHandler.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SyncHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/wp-json/frontend-sync/v1/users" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_posts_batch_with_secret_and_maps_results(self):
+        client = WordPressClient(self.url, "s3cret")
+        changes = [
+            ("CREATE", UserRecord(uuid="u1", email="a@b.be", phone="+32470123456")),
+            ("DELETE", UserRecord(uuid="bad", time="t", email="ignored@b.be")),
+        ]
+
+        self.assertEqual(client.apply(changes), [None, "nope"])
+
+        secret, body = SyncHandler.requests[0]
+        self.assertEqual(secret, "s3cret")
+        self.assertEqual(body["changes"][0]["user"]["phone"], "+32470123456")
+        self.assertEqual(body["changes"][1], {"action": "DELETE", "user": {"uuid": "bad", "time": "t"}})
+
+    def test_wrong_secret_fails_the_batch(self):
+        with self.assertRaises(SyncError):
+            WordPressClient(self.url, "wrong").apply([("CREATE", UserRecord(uuid="u1"))])
+
+
+if __name__ == "__main__":
+    unittest.main()
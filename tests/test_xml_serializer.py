@@ -0,0 +1,76 @@
+import io
+import unittest
+from xml.etree.ElementTree import fromstring
+
+from scripts.consumer import iter_user_messages
+from scripts.user_record import UserRecord
+from scripts.xml_serializer import (
+    serialize_user,
+    serialize_user_message,
+    serialize_user_message_etree,
+    serialize_user_messages,
+    write_user_messages
+)
+
+
+class TestUserMessageSerializer(unittest.TestCase):
+
+    def setUp(self):
+        self.user = {
+            "uuid": "2025-05-16T12:00:00.000000Z",
+            "time": "2025-05-16T12:00:00Z",
+            "password": "hashed",
+            "first_name": "Rayan",
+            "last_name": "Haddou",
+            "phone": "+32470123456",
+            "email": "rayan@example.com",
+            "business_name": "Haddou & <Zonen>",
+            "business_email": "biz@example.com",
+            "real_address": "Main St 1",
+            "btw_number": "BE123456789",
+            "facturation_address": "Invoice St 5"
+        }
+
+    def test_matches_elementtree_output(self):
+        fast = UserRecord.from_element(fromstring(serialize_user_message(self.user)))
+        reference = UserRecord.from_element(fromstring(serialize_user_message_etree(self.user)))
+        self.assertEqual(fast, reference)
+        self.assertEqual(fast[1].business.name, "Haddou & <Zonen>")
+
+    def test_returns_escaped_bytes(self):
+        body = serialize_user_message(self.user, action="UPDATE")
+        self.assertIsInstance(body, bytes)
+        self.assertIn(b"<ActionType>UPDATE</ActionType>", body)
+        self.assertIn(b"<BusinessName>Haddou &amp; &lt;Zonen&gt;</BusinessName>", body)
+
+    def test_missing_fields_become_empty_elements(self):
+        action, record = UserRecord.from_element(fromstring(serialize_user_message(UserRecord(uuid="u1"))))
+        self.assertEqual(record.uuid, "u1")
+        self.assertEqual(record.first_name, "")
+        self.assertEqual(record.business.name, "")
+
+    def test_batch_and_buffer_round_trip(self):
+        users = [dict(self.user, uuid="u%d" % i) for i in range(10)]
+        self.assertEqual(len(serialize_user_messages(users)), 10)
+
+        buffer = bytearray()
+        self.assertEqual(write_user_messages(users, buffer), 10)
+        parsed = [record.uuid for _, record in iter_user_messages([bytes(buffer)])]
+        self.assertEqual(parsed, ["u%d" % i for i in range(10)])
+
+        out = io.BytesIO()
+        write_user_messages(users, out)
+        self.assertEqual(out.getvalue(), bytes(buffer))
+
+
+class TestUserSerializer(unittest.TestCase):
+
+    def test_lowercase_user_shape_is_escaped(self):
+        xml = serialize_user({"user_login": "a<b", "first_name": "Weiam"})
+        self.assertTrue(xml.startswith(b"<User><user_login>a&lt;b</user_login>"))
+        self.assertIn(b"<first_name>Weiam</first_name>", xml)
+        self.assertIn(b"<action_type></action_type>", xml)
+
+
+if __name__ == "__main__":
+    unittest.main()
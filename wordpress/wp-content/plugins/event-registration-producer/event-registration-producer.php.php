@@ -27,7 +27,118 @@ function get_google_calendar_service() {
     return new Google_Service_Calendar($client);
 }
 
+/**
+ * Lokale kopie van de agenda's en sessies, bijgehouden door scripts/calendar_sync.py
+ * (service calendar_sync). Zolang die vers is, wordt de Google API niet per pagina
+ * aangeroepen. Geeft null terug als de store ontbreekt; de aanroepers vallen dan
+ * terug op de API.
+ */
+function expo_calendar_store() {
+    static $pdo = null, $opened = false;
+    if ($opened) {
+        return $pdo;
+    }
+    $opened = true;
+
+    $path = getenv('CALENDAR_STORE_PATH');
+    if (!$path || !is_readable($path) || !in_array('sqlite', PDO::getAvailableDrivers(), true)) {
+        return null;
+    }
+    try {
+        $options = [PDO::ATTR_ERRMODE => PDO::ERRMODE_EXCEPTION];
+        if (defined('PDO::SQLITE_ATTR_OPEN_FLAGS')) {
+            $options[PDO::SQLITE_ATTR_OPEN_FLAGS] = PDO::SQLITE_OPEN_READONLY;
+        }
+        $pdo = new PDO('sqlite:' . $path, null, null, $options);
+    } catch (PDOException $e) {
+        error_log("Calendar store niet leesbaar: " . $e->getMessage());
+    }
+    return $pdo;
+}
+
+/**
+ * Oudste synchronisatietijd die nog als vers geldt (CALENDAR_CACHE_TTL, standaard 5 minuten).
+ */
+function expo_calendar_fresh_since() {
+    return time() - (int)(getenv('CALENDAR_CACHE_TTL') ?: 300);
+}
+
+function expo_calendar_store_query($sql, array $params = []) {
+    $pdo = expo_calendar_store();
+    if (!$pdo) {
+        return null;
+    }
+    try {
+        $statement = $pdo->prepare($sql);
+        $statement->execute($params);
+        return $statement->fetchAll(PDO::FETCH_ASSOC);
+    } catch (PDOException $e) {
+        error_log("Calendar store query mislukt: " . $e->getMessage());
+        return null;
+    }
+}
+
+/**
+ * Agenda's uit de store, of null als de lijst ontbreekt of verouderd is.
+ */
+function expo_cached_calendars() {
+    $rows = expo_calendar_store_query("SELECT data, synced_at FROM calendars ORDER BY summary, id");
+    if (empty($rows) || max(array_column($rows, 'synced_at')) < expo_calendar_fresh_since()) {
+        return null;
+    }
+    return array_map(function ($row) {
+        return new Google_Service_Calendar_CalendarListEntry(json_decode($row['data'], true));
+    }, $rows);
+}
+
+function expo_cached_calendar($calendarId) {
+    $rows = expo_calendar_store_query(
+        "SELECT data FROM calendars WHERE id = ? AND synced_at >= ?",
+        [$calendarId, expo_calendar_fresh_since()]
+    );
+    return empty($rows) ? null : new Google_Service_Calendar_CalendarListEntry(json_decode($rows[0]['data'], true));
+}
+
+/**
+ * Sessies van een agenda (op starttijd), of null als de agenda niet vers in de store staat.
+ */
+function expo_cached_events($calendarId, $eventId = null) {
+    if (expo_cached_calendar($calendarId) === null) {
+        return null;
+    }
+    $sql    = "SELECT data FROM events WHERE calendar_id = ?";
+    $params = [$calendarId];
+    if ($eventId !== null) {
+        $sql     .= " AND id = ?";
+        $params[] = $eventId;
+    }
+    // start_utc: starttijd in UTC, zodat tijdzones en hele-dag-sessies juist gesorteerd worden
+    $rows = expo_calendar_store_query($sql . " ORDER BY start_utc, id", $params);
+    if ($rows === null) {
+        return null;
+    }
+    return array_map(function ($row) {
+        return new Google_Service_Calendar_Event(json_decode($row['data'], true));
+    }, $rows);
+}
+
+/**
+ * Alle agenda's: uit de store als die vers is, anders via de API.
+ */
+function expo_list_calendars() {
+    $cached = expo_cached_calendars();
+    if ($cached !== null) {
+        return $cached;
+    }
+    return get_google_calendar_service()->calendarList->listCalendarList()->getItems();
+}
+
 function fetch_all_events_from_calendar($calendarId) {
+    $cached = expo_cached_events($calendarId);
+    if ($cached !== null) {
+        return $cached;
+    }
+
     $service = get_google_calendar_service();
     $allEvents = [];
     $pageToken = null;
@@ -50,11 +161,9 @@ function fetch_all_events_from_calendar($calendarId) {
 
 
 function fetch_all_calendars_and_sessions() {
-    $service = get_google_calendar_service();
-    $calendarList = $service->calendarList->listCalendarList();
     $allEvents = [];
 
-    foreach ($calendarList->getItems() as $calendar) {
+    foreach (expo_list_calendars() as $calendar) {
         if ( $calendar->getId() === 'planning@youmnimalha.be' ) {
         continue;
     }
@@ -73,13 +182,12 @@ function fetch_all_calendars_and_sessions() {
 
 
 function expo_render_events() {
-    $service      = get_google_calendar_service();
-    $calendarList = $service->calendarList->listCalendarList();
+    $calendars = expo_list_calendars();
 
     ob_start();
     ?>
     <div id="expo-events">
-        <?php foreach ($calendarList->getItems() as $calendar):
+        <?php foreach ($calendars as $calendar):
             // on skip l'agenda “planning@youmnimalha.be”
             if ($calendar->getId() === 'planning@youmnimalha.be') {
                 continue;
@@ -131,12 +239,14 @@ function expo_render_event_detail() {
     }
 
     $calendarId = sanitize_text_field( $_GET['event_id'] );
-    $service    = get_google_calendar_service();
 
-    try {
-        $calendar = $service->calendarList->get( $calendarId );
-    } catch ( Exception $e ) {
-        return '<p>❌ Unable to load event details.</p>';
+    $calendar = expo_cached_calendar( $calendarId );
+    if ( $calendar === null ) {
+        try {
+            $calendar = get_google_calendar_service()->calendarList->get( $calendarId );
+        } catch ( Exception $e ) {
+            return '<p>❌ Unable to load event details.</p>';
+        }
     }
 
     $title    = $calendar->getSummary();
@@ -341,7 +451,8 @@ function expo_register_event_only() {
     // ➍ Publication sessions
     foreach ( $sessions as $sid ) {
         try {
-            $session = $service->events->get( $event_uuid, $sid );
+            $cached  = expo_cached_events( $event_uuid, $sid );
+            $session = $cached ? $cached[0] : $service->events->get( $event_uuid, $sid );
             $xmlS    = new SimpleXMLElement('<UpdateSession/>');
             $xmlS->addChild('SessionUUID',     ( new DateTime() )->format(DateTime::ATOM) );
             $xmlS->addChild('EventUUID',       $event_uuid );
@@ -69,6 +69,11 @@ function rabbitmq_deactivation() {
  */
 add_action('rabbitmq_process_user_create', 'rabbitmq_user_create_process_cron');
 function rabbitmq_user_create_process_cron() {
+    // De Python sidecar (user_sync service) verwerkt deze queue continu
+    if (getenv('USER_SYNC_SIDECAR')) {
+        return;
+    }
+
     // RabbitMQ-instellingen uit de omgevingsvariabelen
     $host       = getenv('RABBITMQ_HOST');
     $port       = getenv('RABBITMQ_PORT');
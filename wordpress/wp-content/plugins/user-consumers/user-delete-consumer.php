@@ -43,6 +43,11 @@ function rabbitmq_delete_deactivate() {
 // Hook voor het cron-event
 add_action(USER_DELETE_EVENT, 'rabbitmq_user_delete_process_cron');
 function rabbitmq_user_delete_process_cron() {
+    // De Python sidecar (user_sync service) verwerkt deze queue continu
+    if (getenv('USER_SYNC_SIDECAR')) {
+        return;
+    }
+
     $host       = getenv('RABBITMQ_HOST');
     $port       = getenv('RABBITMQ_PORT');
     $user       = getenv('RABBITMQ_USER');
@@ -41,6 +41,11 @@ function rabbitmq_update_deactivate() {
 // Hook voor het cron-event
 add_action(USER_UPDATE_EVENT, 'rabbitmq_user_update_process_cron');
 function rabbitmq_user_update_process_cron() {
+    // De Python sidecar (user_sync service) verwerkt deze queue continu
+    if (getenv('USER_SYNC_SIDECAR')) {
+        return;
+    }
+
     $host       = getenv('RABBITMQ_HOST');
     $port       = getenv('RABBITMQ_PORT');
     $user       = getenv('RABBITMQ_USER');
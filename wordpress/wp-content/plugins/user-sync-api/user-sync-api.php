@@ -0,0 +1,177 @@
+<?php
+/**
+ * Plugin Name: User Sync API
+ * Description: REST-endpoint waarmee de Python sidecar (scripts/wordpress_sidecar.py) gebruikerswijzigingen in batches doorgeeft.
+ * Version: 1.0
+ */
+
+/**
+ * Registreer POST /wp-json/frontend-sync/v1/users.
+ *
+ * Body: {"changes": [{"action": "CREATE|UPDATE|DELETE", "user": {...}}, ...]}
+ * Antwoord: {"results": [{"ok": true}, {"ok": false, "error": "..."}, ...]} in dezelfde volgorde.
+ */
+add_action('rest_api_init', function () {
+    register_rest_route('frontend-sync/v1', '/users', [
+        'methods'             => 'POST',
+        'callback'            => 'frontend_sync_apply_changes',
+        'permission_callback' => 'frontend_sync_check_secret',
+    ]);
+});
+
+/**
+ * Alleen de sidecar mag schrijven: gedeeld geheim in de X-Sync-Secret header.
+ */
+function frontend_sync_check_secret(WP_REST_Request $request) {
+    $secret = getenv('USER_SYNC_SECRET');
+    if (!$secret) {
+        return new WP_Error('sync_disabled', 'USER_SYNC_SECRET is niet ingesteld', ['status' => 503]);
+    }
+    return hash_equals($secret, (string)$request->get_header('X-Sync-Secret'));
+}
+
+function frontend_sync_apply_changes(WP_REST_Request $request) {
+    $changes = $request->get_json_params()['changes'] ?? null;
+    if (!is_array($changes)) {
+        return new WP_Error('invalid_payload', 'changes ontbreekt', ['status' => 400]);
+    }
+
+    // Producer-hooks uitschakelen zodat de wijzigingen niet terug naar RabbitMQ gaan
+    remove_action('profile_update',    'send_user_to_rabbitmq_on_profile_update');
+    remove_action('profile_update',    'schedule_rabbitmq_user_update', 10);
+    remove_action('updated_user_meta', 'schedule_rabbitmq_meta_update', 10);
+    remove_action('delete_user',       'handle_user_delete', 10);
+
+    // Eén term/comment-telling aan het einde i.p.v. per gebruiker
+    wp_defer_term_counting(true);
+
+    $results = [];
+    foreach ($changes as $change) {
+        $user = $change['user'] ?? [];
+        try {
+            switch ($change['action'] ?? '') {
+                case 'CREATE':
+                    $error = frontend_sync_create_user($user);
+                    break;
+                case 'UPDATE':
+                    $error = frontend_sync_update_user($user);
+                    break;
+                case 'DELETE':
+                    $error = frontend_sync_delete_user($user);
+                    break;
+                default:
+                    $error = 'Onbekende actie';
+            }
+        } catch (Exception $e) {
+            $error = $e->getMessage();
+        }
+        $results[] = $error === null ? ['ok' => true] : ['ok' => false, 'error' => $error];
+    }
+
+    wp_defer_term_counting(false);
+
+    add_action('profile_update',    'send_user_to_rabbitmq_on_profile_update', 10, 1);
+    add_action('profile_update',    'schedule_rabbitmq_user_update', 10, 2);
+    add_action('updated_user_meta', 'schedule_rabbitmq_meta_update', 10, 4);
+    add_action('delete_user',       'handle_user_delete', 10, 1);
+
+    return rest_ensure_response(['results' => $results]);
+}
+
+function frontend_sync_find_user_id($uuid) {
+    $users = get_users([
+        'meta_key'   => 'UUID',
+        'meta_value' => $uuid,
+        'number'     => 1,
+        'fields'     => 'ID'
+    ]);
+    return empty($users) ? null : $users[0];
+}
+
+function frontend_sync_update_business_meta($user_id, array $user) {
+    foreach (['business_name', 'business_email', 'real_address', 'btw_number', 'facturation_address'] as $key) {
+        if (isset($user[$key])) {
+            update_user_meta($user_id, $key, (string)$user[$key]);
+        }
+    }
+}
+
+/**
+ * Zelfde regels als user-create-consumer.php: bestaande e-mailadressen worden overgeslagen.
+ * Geeft null terug bij succes, anders een foutmelding.
+ */
+function frontend_sync_create_user(array $user) {
+    $email = (string)($user['email'] ?? '');
+    if (get_user_by('email', $email)) {
+        error_log("Gebruiker {$email} bestaat al, wijziging overslaan.");
+        return null;
+    }
+
+    $newId = wp_insert_user([
+        'user_login' => $email,
+        'user_pass'  => (string)($user['password'] ?? ''),
+        'user_email' => $email,
+        'first_name' => (string)($user['first_name'] ?? ''),
+        'last_name'  => (string)($user['last_name'] ?? ''),
+    ]);
+    if (is_wp_error($newId)) {
+        return $newId->get_error_message();
+    }
+
+    update_user_meta($newId, 'synced_to_wordpress', '1');
+    update_user_meta($newId, 'UUID', (string)($user['uuid'] ?? ''));
+    update_user_meta($newId, 'phone_number', (string)($user['phone'] ?? ''));
+    frontend_sync_update_business_meta($newId, $user);
+    return null;
+}
+
+/**
+ * Zelfde regels als user-update-consumer.php: alleen meegegeven velden worden aangepast.
+ */
+function frontend_sync_update_user(array $user) {
+    $user_id = frontend_sync_find_user_id((string)($user['uuid'] ?? ''));
+    if ($user_id === null) {
+        error_log("Geen gebruiker gevonden voor UPDATE met UUID {$user['uuid']}");
+        return null;
+    }
+
+    update_user_meta($user_id, 'rabbitmq_lock', '1');
+
+    $update_data = ['ID' => $user_id];
+    if (isset($user['first_name'])) $update_data['first_name'] = (string)$user['first_name'];
+    if (isset($user['last_name']))  $update_data['last_name']  = (string)$user['last_name'];
+    if (isset($user['email']))      $update_data['user_email'] = (string)$user['email'];
+    if (isset($user['password']))   $update_data['user_pass']  = (string)$user['password'];
+
+    $result = wp_update_user($update_data);
+    if (!is_wp_error($result)) {
+        if (isset($user['phone'])) {
+            update_user_meta($user_id, 'phone_number', (string)$user['phone']);
+        }
+        frontend_sync_update_business_meta($user_id, $user);
+    }
+
+    delete_user_meta($user_id, 'rabbitmq_lock');
+    return is_wp_error($result) ? $result->get_error_message() : null;
+}
+
+/**
+ * Zelfde regels als user-delete-consumer.php.
+ */
+function frontend_sync_delete_user(array $user) {
+    $user_id = frontend_sync_find_user_id((string)($user['uuid'] ?? ''));
+    if ($user_id === null) {
+        error_log("Geen gebruiker gevonden voor DELETE met UUID {$user['uuid']}");
+        return null;
+    }
+
+    update_user_meta($user_id, 'rabbitmq_lock', '1');
+    if (!function_exists('wp_delete_user')) {
+        require_once ABSPATH . 'wp-admin/includes/user.php';
+    }
+    if (!wp_delete_user($user_id, true)) {
+        delete_user_meta($user_id, 'rabbitmq_lock');
+        return "Fout bij verwijderen gebruiker #{$user_id}";
+    }
+    return null;
+}